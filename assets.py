@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Cache des données dérivées coûteuses à recalculer (vérité terrain en 3 canaux, son masque navigable,
+# tables de perception...). Chaque jeu de tableaux est enregistré une fois au format .npy dans un
+# dossier identifié par une empreinte de ses paramètres, puis relu en lecture seule par memmap :
+# les processus serveurs partagent ainsi les mêmes pages en mémoire et démarrent sans matplotlib.
+# L'empreinte comprend aussi le contenu des fichiers source qui calculent les données (ce module et ceux
+# indiqués par l'appelant) : une modification du code invalide les jeux enregistrés, sans dépendre
+# d'une augmentation manuelle d'ASSET_VERSION (réservée aux changements de format du cache).
+# Le dossier peut être changé avec la variable d'environnement ROVER_ASSET_CACHE.
+
+ASSET_VERSION = 1
+ASSET_CACHE = os.environ.get('ROVER_ASSET_CACHE', os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'rover_assets'))
+META_FILE = 'meta.json'
+
+
+# Empreintes du contenu de fichiers source
+def source_digests(paths):
+    digests = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            digests.append(hashlib.sha1(f.read()).hexdigest())
+    return digests
+
+
+def _fingerprint(key, sources=()):
+    sources = source_digests((os.path.abspath(__file__),) + tuple(sources))
+    return hashlib.sha1(json.dumps([ASSET_VERSION, sources, key], sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _load(directory):
+    try:
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        # np.asarray : vues ndarray simples sur les memmaps (sans le surcoût de la sous-classe np.memmap)
+        arrays = {name: np.asarray(np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+                  for name in meta['arrays']}
+    except (OSError, ValueError, KeyError):
+        return None
+    return arrays, meta
+
+
+# Écritures atomiques (fichier temporaire puis os.replace) ; meta.json, écrit en dernier,
+# marque le jeu comme complet
+def _store(directory, arrays, meta):
+    os.makedirs(directory, exist_ok=True)
+    suffix = '.{}.tmp'.format(os.getpid())
+    for name, array in arrays.items():
+        path = os.path.join(directory, name + '.npy')
+        with open(path + suffix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(path + suffix, path)
+    meta = dict(meta, arrays=sorted(arrays))
+    path = os.path.join(directory, META_FILE)
+    with open(path + suffix, 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + suffix, path)
+
+
+# Tableaux du jeu `kind` identifié par `key` (valeurs sérialisables en JSON) : relus du cache si possible,
+# sinon calculés par `build()` -> (dictionnaire de tableaux, métadonnées) et enregistrés.
+# `sources` : fichiers source dont dépend `build` en plus de ce module (en général le __file__ de l'appelant).
+# Si le cache n'est pas accessible en écriture, les tableaux calculés sont renvoyés tels quels.
+def cached(kind, key, build, cache_dir=None, sources=()):
+    directory = os.path.join(cache_dir or ASSET_CACHE, '{}_{}'.format(kind, _fingerprint(key, sources)))
+    loaded = _load(directory)
+    if loaded is not None:
+        return loaded
+    arrays, meta = build()
+    try:
+        _store(directory, arrays, meta)
+    except OSError as e:
+        print("Cache des données indisponible ({}) : {}".format(directory, e))
+        return arrays, meta
+    return _load(directory) or (arrays, meta)
+
+
+# Vérité terrain et données dérivées, partagées en lecture seule
+class GroundTruthAssets():
+    def __init__(self, arrays, meta):
+        self.rgb = arrays['rgb']  # Carte verte en 3 canaux (comme l'ancien ground_truth_3d)
+        self.half = arrays['half']  # rgb * 0.5, fond de l'image de la carte
+        self.nav_mask = arrays['nav_mask']  # Pixels navigables (canal vert non nul)
+        self.nav_pixels = meta['nav_pixels']
+
+
+# Assets de vérité terrain indexés par l'identité de leur tableau rgb (voir ground_truth_stats)
+_ground_truths = {}
+
+
+def _build_ground_truth(path):
+    import matplotlib.image as mpimg
+    ground_truth = mpimg.imread(path)
+    # Cette ligne suivante crée des tableaux de zéros dans les canaux rouge et bleu
+    # et place la carte dans le canal vert. C'est pourquoi la carte sous-jacente
+    # a l'air verte dans l'image d'affichage
+    rgb = np.dstack((ground_truth * 0, ground_truth * 255, ground_truth * 0)).astype(float)
+    nav_mask = rgb[:, :, 1] > 0
+    return {'rgb': rgb, 'half': rgb * 0.5, 'nav_mask': nav_mask}, {'nav_pixels': int(np.count_nonzero(nav_mask))}
+
+
+# La clé est le contenu du fichier : une carte modifiée produit un nouveau jeu de données
+def ground_truth_assets(path, cache_dir=None):
+    with open(path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    arrays, meta = cached('ground_truth', [os.path.splitext(path)[1].lower(), digest],
+                          lambda: _build_ground_truth(path), cache_dir)
+    assets = GroundTruthAssets(arrays, meta)
+    _ground_truths[id(assets.rgb)] = assets
+    return assets
+
+
+# (masque navigable, nombre de pixels navigables, rgb * 0.5) d'une vérité terrain en 3 canaux :
+# lus dans le cache si elle en provient, calculés sinon
+def ground_truth_stats(ground_truth):
+    assets = _ground_truths.get(id(ground_truth))
+    if assets is not None and assets.rgb is ground_truth:
+        return assets.nav_mask, assets.nav_pixels, assets.half
+    nav_mask = ground_truth[:, :, 1] > 0
+    return nav_mask, int(np.count_nonzero(nav_mask)), ground_truth * 0.5
@@ -0,0 +1,202 @@
+import argparse
+from multiprocessing import Pool
+
+import cv2
+import numpy as np
+
+from map_fusion import MapFusion
+from perception import (get_perception_kernel, SCALE, OBSTACLE_THRESH, ROCK_THRESH, NAVIGABLE_THRESH, lut_index,
+                        load_color_lut)
+from worldmap import DenseWorldMap
+
+# Perception par lots pour les données enregistrées : une pile N x H x W x 3 (ou un itérateur de trames
+# et de poses) est transformée, segmentée et projetée dans le monde en quelques appels vectorisés,
+# au lieu d'une boucle Python trame par trame.
+# Exemple :
+#   $ python batch_perception.py ../runs/course1 --processes 4 --out carte.npy
+
+CLASSES = ('obstacle', 'rock', 'navigable')
+DEFAULT_THRESHOLDS = (OBSTACLE_THRESH, ROCK_THRESH, NAVIGABLE_THRESH)
+
+
+def warp_batch(frames, kernel=None, out=None):
+    frames = np.asarray(frames)
+    if kernel is None:
+        kernel = get_perception_kernel(frames.shape[1:3])
+    if out is None:
+        out = np.empty_like(frames)
+    for i in range(len(frames)):
+        kernel.warp(frames[i], out=out[i])
+    return out
+
+
+# Masques (classe, trame, ligne, colonne) à 0/255 : la pile est vue comme une seule grande image,
+# si bien que chaque classe est seuillée par un unique appel à cv2.inRange
+# (ou, avec une table de couleurs `lut`, étiquetée par une seule lecture indexée, voir LutSegmenter)
+def segment_batch(warped, thresholds=DEFAULT_THRESHOLDS, out=None, lut=None):
+    n, height, width = warped.shape[:3]
+    tall = warped.reshape(n * height, width, 3)
+    if out is None:
+        out = np.empty((len(thresholds), n, height, width), dtype=np.uint8)
+    if lut is not None:
+        labels = lut[lut_index(tall)]
+        for k in range(len(out)):
+            cv2.compare(labels, k + 1, cv2.CMP_EQ, dst=out[k].reshape(n * height, width))
+        return out
+    for k, (low, high) in enumerate(thresholds):
+        cv2.inRange(tall, low, high, dst=out[k].reshape(n * height, width))
+    return out
+
+
+# Coordonnées monde des pixels d'un masque (N x H x W) pour des poses (N x 3+ : x, y, lacet en degrés).
+# Renvoie (indice de trame, x monde, y monde, distance en pixels redressés) pour tous les pixels utiles du lot.
+def world_hits(masks, poses, kernel, world_size=200, scale=SCALE, visible_only=False):
+    n = len(masks)
+    roi = masks.reshape(n, -1)[:, kernel.roi_idx]
+    if visible_only:
+        roi = roi * kernel.roi_visible
+    frame_idx, k = roi.nonzero()
+    poses = np.asarray(poses, dtype=float)
+    angles = kernel.roi_angles[k] + poses[frame_idx, 2] * np.pi / 180
+    pix_dist = kernel.roi_dist[k]
+    dist = pix_dist / scale
+    x_world = dist * np.cos(angles) + poses[frame_idx, 0]
+    y_world = dist * np.sin(angles) + poses[frame_idx, 1]
+    x_pix_world = np.clip(np.int_(x_world), 0, world_size - 1)
+    y_pix_world = np.clip(np.int_(y_world), 0, world_size - 1)
+    return frame_idx, x_pix_world, y_pix_world, pix_dist
+
+
+# Poses stables (tangage et roulis à moins d'un degré), comme dans perception_step
+def stable_poses(poses):
+    poses = np.asarray(poses, dtype=float)
+    if poses.shape[1] < 5:
+        return np.ones(len(poses), dtype=bool)
+    pitch, roll = poses[:, 3], poses[:, 4]
+    return ((pitch < 1.0) | (pitch > 359.0)) & ((roll < 1.0) | (roll > 359.0))
+
+
+def perceive_batch(frames, poses=None, kernel=None, thresholds=DEFAULT_THRESHOLDS, world_size=200, scale=SCALE,
+                   lut=None):
+    frames = np.asarray(frames)
+    if kernel is None:
+        kernel = get_perception_kernel(frames.shape[1:3])
+    warped = warp_batch(frames, kernel)
+    masks = segment_batch(warped, thresholds, lut=lut)
+    result = {'warped': warped, 'masks': masks}
+    if poses is not None:
+        # Comme dans perception_step, les obstacles sont limités au champ de la caméra
+        result['hits'] = {name: world_hits(masks[k], poses, kernel, world_size, scale, name == 'obstacle')
+                          for k, name in enumerate(CLASSES)}
+    return result
+
+
+def _kept(hits, keep):
+    if keep is None:
+        return hits
+    sel = keep[hits[0]]
+    return tuple(values[sel] for values in hits)
+
+
+# Ajoute les détections d'un lot à une carte (canaux obstacles / rochers / navigable).
+# Avec `fusion` (MapFusion), la carte est un WorldMap et toutes les trames du lot sont fusionnées
+# d'un coup, avec la même règle que perception_step ; sans, la carte est un tableau H x W x 3
+# et une cellule compte au plus une fois par trame (ancienne règle).
+def accumulate_batch(worldmap, hits, keep=None, fusion=None):
+    if fusion is not None:
+        obs_frame, obs_x, obs_y, obs_dist = _kept(hits['obstacle'], keep)
+        nav_frame, nav_x, nav_y, nav_dist = _kept(hits['navigable'], keep)
+        rock_frame, rock_x, rock_y = _kept(hits['rock'], keep)[:3]
+        fusion.fuse(worldmap, (obs_y, obs_x, obs_dist), (rock_y, rock_x), (nav_y, nav_x, nav_dist))
+        return worldmap
+    world_size = worldmap.shape[0]
+    for channel, name in ((0, 'obstacle'), (2, 'navigable')):
+        frame_idx, x, y = _kept(hits[name], keep)[:3]
+        cells = y * world_size + x
+        cells = np.unique(frame_idx.astype(np.int64) * world_size * world_size + cells) % (world_size * world_size)
+        worldmap[:, :, channel] += np.bincount(cells, minlength=world_size * world_size).reshape(world_size, world_size)
+    frame_idx, x, y = _kept(hits['rock'], keep)[:3]
+    worldmap[y, x, 1] = 255
+    return worldmap
+
+
+# Regroupe un itérateur de trames (image RGB) et de poses en lots de taille fixe
+def iter_batches(frames, poses, batch_size=64):
+    batch_frames, batch_poses = [], []
+    for frame, pose in zip(frames, poses):
+        batch_frames.append(frame)
+        batch_poses.append(pose)
+        if len(batch_frames) == batch_size:
+            yield np.stack(batch_frames), np.asarray(batch_poses, dtype=float)
+            batch_frames, batch_poses = [], []
+    if batch_frames:
+        yield np.stack(batch_frames), np.asarray(batch_poses, dtype=float)
+
+
+# Carte H x W x 3 reconstruite ; `fusion` vaut par défaut un MapFusion() comme celui de RoverState
+def rebuild_map(frames, poses, world_size=200, batch_size=64, thresholds=DEFAULT_THRESHOLDS, worldmap=None,
+                fusion=None, lut=None):
+    if worldmap is None:
+        worldmap = np.zeros((world_size, world_size, 3), dtype=float)
+    if fusion is None:
+        fusion = MapFusion()
+    target = DenseWorldMap(world_size, data=worldmap)
+    for batch_frames, batch_poses in iter_batches(frames, poses, batch_size):
+        result = perceive_batch(batch_frames, batch_poses, thresholds=thresholds, world_size=world_size, lut=lut)
+        accumulate_batch(target, result['hits'], keep=stable_poses(batch_poses), fusion=fusion)
+    return worldmap
+
+
+def _rebuild_chunk(task):
+    from recorder import open_recording
+    path, start, stop, world_size, batch_size, lut_path = task
+    recording = open_recording(path)
+    poses = recording.poses()[start:stop]
+    frames = (recording.image(i) for i in range(start, stop))
+    valid = ~np.isnan(poses).any(axis=1)
+    if not valid.all():
+        frames = (frame for frame, ok in zip(frames, valid) if ok)
+        poses = poses[valid]
+    lut = load_color_lut(lut_path) if lut_path else None
+    return rebuild_map(frames, poses, world_size, batch_size, lut=lut)
+
+
+# Reconstruit la carte d'un enregistrement 'segments', éventuellement en répartissant des tranches
+# de trames sur plusieurs processus (chaque processus relit ses trames par memmap)
+def rebuild_map_from_recording(path, world_size=200, batch_size=64, processes=0, chunk_size=1024, lut_path=''):
+    from recorder import open_recording
+    count = len(open_recording(path))
+    tasks = [(path, start, min(start + chunk_size, count), world_size, batch_size, lut_path)
+             for start in range(0, count, chunk_size)]
+    if processes > 1:
+        with Pool(processes) as pool:
+            partial_maps = pool.map(_rebuild_chunk, tasks)
+    else:
+        partial_maps = [_rebuild_chunk(task) for task in tasks]
+    worldmap = np.zeros((world_size, world_size, 3), dtype=float)
+    for partial in partial_maps:
+        worldmap[:, :, 0] += partial[:, :, 0]
+        worldmap[:, :, 2] += partial[:, :, 2]
+        worldmap[:, :, 1] = np.maximum(worldmap[:, :, 1], partial[:, :, 1])
+    return worldmap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstruction de carte à partir d'un enregistrement")
+    parser.add_argument('recording', help="Dossier d'enregistrement au format 'segments'")
+    parser.add_argument('--processes', type=int, default=0, help='Nombre de processus (0 : un seul)')
+    parser.add_argument('--batch-size', type=int, default=64, help='Nombre de trames par lot')
+    parser.add_argument('--world-size', type=int, default=200, help='Taille de la carte (cellules)')
+    parser.add_argument('--out', default='worldmap.npy', help='Fichier de sortie (.npy)')
+    parser.add_argument('--color-lut', default='', help='Table de couleurs (calibrate_colors.py) au lieu des seuils')
+    args = parser.parse_args()
+
+    worldmap = rebuild_map_from_recording(args.recording, args.world_size, args.batch_size, args.processes,
+                                          lut_path=args.color_lut)
+    np.save(args.out, worldmap)
+    print("Carte enregistrée dans {} ({} cellules navigables)".format(
+        args.out, np.count_nonzero(worldmap[:, :, 2])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from perception import (LUT_SIZE, N_LABELS, lut_index, lut_bin_colors, lut_from_thresholds, save_color_lut,
+                        get_perception_kernel)
+
+# Calibration de la segmentation couleur.
+# Apprend une table RGB565 -> classe (voir perception.LutSegmenter) à partir de trames étiquetées :
+# pour chaque image, un PNG d'étiquettes de même nom (0 inconnu, 1 obstacle, 2 rocher, 3 navigable,
+# 255 ignoré). Chaque case de la table prend la classe la plus fréquente parmi les pixels observés,
+# complétée par un modèle gaussien par classe (analyse discriminante quadratique) pour les couleurs
+# rares ou jamais vues. La table est écrite atomiquement : un serveur lancé avec --color-lut la
+# recharge à chaud.
+# Exemples :
+#   $ python calibrate_colors.py '../test_dataset/IMG/*.jpg' ../test_dataset/labels --out couleurs.npz
+#   $ python calibrate_colors.py --from-thresholds --out couleurs.npz
+
+IGNORE_LABEL = 255
+CLASS_NAMES = ('inconnu', 'obstacle', 'rocher', 'navigable')
+
+
+# Paires (image RGB, étiquettes) : les étiquettes de `labels_dir/<nom>.png` ; les images sans étiquettes
+# sont ignorées. `warp` : images et étiquettes vues de dessus, comme dans perception_step.
+def labeled_frames(image_pattern, labels_dir, warp=False):
+    for path in sorted(glob.glob(image_pattern)):
+        label_path = os.path.join(labels_dir, os.path.splitext(os.path.basename(path))[0] + '.png')
+        if not os.path.exists(label_path):
+            continue
+        img = cv2.cvtColor(cv2.imread(path), cv2.COLOR_BGR2RGB)
+        labels = cv2.imread(label_path, cv2.IMREAD_GRAYSCALE)
+        if warp:
+            kernel = get_perception_kernel(img.shape)
+            img = kernel.warp(img)
+            labels = cv2.remap(labels, kernel.map_x, kernel.map_y, cv2.INTER_NEAREST,
+                               borderMode=cv2.BORDER_CONSTANT, borderValue=IGNORE_LABEL)
+        yield img, labels
+
+
+# Effectifs (classe, case de la table) des pixels étiquetés d'une trame, ajoutés à `counts`
+def accumulate(counts, img, labels):
+    index = lut_index(img).ravel().astype(np.int64)
+    labels = labels.ravel()
+    keep = labels < N_LABELS
+    counts += np.bincount(labels[keep].astype(np.int64) * LUT_SIZE + index[keep],
+                          minlength=N_LABELS * LUT_SIZE).reshape(N_LABELS, LUT_SIZE)
+    return counts
+
+
+# Probabilités a posteriori (classe, case) d'un modèle gaussien par classe ajusté sur les effectifs
+def gaussian_posterior(counts, min_variance=16.0):
+    colors = lut_bin_colors()
+    total = counts.sum()
+    log_post = np.full(counts.shape, -np.inf)
+    for k in range(len(counts)):
+        n = counts[k].sum()
+        if n == 0:
+            continue
+        weights = counts[k] / n
+        mean = weights @ colors
+        diff = colors - mean
+        # Variance minimale : une classe d'une seule couleur reste une gaussienne utilisable
+        cov = (diff * weights[:, None]).T @ diff + min_variance * np.eye(3)
+        maha = np.einsum('ij,jk,ik->i', diff, np.linalg.inv(cov), diff)
+        log_post[k] = np.log(n / total) - 0.5 * (maha + np.linalg.slogdet(cov)[1])
+    log_post -= log_post.max(axis=0)
+    post = np.exp(log_post)
+    return post / post.sum(axis=0)
+
+
+# Table apprise : classe majoritaire de chaque case, le modèle gaussien comptant pour `smoothing` pixels
+def learn_lut(counts, smoothing=2.0, min_variance=16.0):
+    if counts.sum() == 0:
+        raise ValueError('aucun pixel étiqueté')
+    scores = counts + smoothing * gaussian_posterior(counts, min_variance)
+    return np.argmax(scores, axis=0).astype(np.uint8)
+
+
+# Matrice de confusion (étiquette, prédiction) d'une table sur des trames étiquetées
+def confusion(table, frames):
+    matrix = np.zeros((N_LABELS, N_LABELS), dtype=np.int64)
+    for img, labels in frames:
+        predicted = table[lut_index(img)].ravel()
+        labels = labels.ravel()
+        keep = labels < N_LABELS
+        matrix += np.bincount(labels[keep].astype(np.int64) * N_LABELS + predicted[keep],
+                              minlength=N_LABELS * N_LABELS).reshape(N_LABELS, N_LABELS)
+    return matrix
+
+
+def format_confusion(matrix):
+    lines = ['{:<11}{:>10}{:>10}'.format('classe', 'rappel', 'précision')]
+    for k, name in enumerate(CLASS_NAMES):
+        recall = matrix[k, k] / matrix[k].sum() if matrix[k].sum() else float('nan')
+        precision = matrix[k, k] / matrix[:, k].sum() if matrix[:, k].sum() else float('nan')
+        lines.append('{:<11}{:>10.3f}{:>10.3f}'.format(name, recall, precision))
+    lines.append('exactitude : {:.4f}'.format(np.trace(matrix) / max(matrix.sum(), 1)))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apprentissage de la table de segmentation couleur')
+    parser.add_argument('images', nargs='?', default='', help="Motif des images étiquetées (ex. 'IMG/*.jpg')")
+    parser.add_argument('labels', nargs='?', default='', help="Dossier des étiquettes PNG (même nom que l'image)")
+    parser.add_argument('--out', default='couleurs.npz', help='Fichier de la table produite')
+    parser.add_argument('--from-thresholds', action='store_true',
+                        help='Compiler les seuils par défaut de perception.py au lieu d\'apprendre')
+    parser.add_argument('--smoothing', type=float, default=2.0,
+                        help='Poids (en pixels) du modèle gaussien dans chaque case')
+    parser.add_argument('--validation', type=int, default=5,
+                        help='Une trame sur N réservée à la validation (0 : aucune)')
+    parser.add_argument('--warp', action='store_true', help='Apprendre sur les vues de dessus (comme perception_step)')
+    args = parser.parse_args()
+
+    if args.from_thresholds:
+        save_color_lut(args.out, lut_from_thresholds(), {'source': 'thresholds'})
+        print('Table des seuils par défaut écrite dans {}'.format(args.out))
+        return
+    if not args.images or not args.labels:
+        parser.error('indiquez les images et le dossier des étiquettes, ou --from-thresholds')
+
+    counts = np.zeros((N_LABELS, LUT_SIZE), dtype=np.int64)
+    validation = []
+    n_frames = 0
+    for i, (img, labels) in enumerate(labeled_frames(args.images, args.labels, args.warp)):
+        if args.validation > 0 and i % args.validation == args.validation - 1:
+            validation.append((img, labels))
+        else:
+            accumulate(counts, img, labels)
+            n_frames += 1
+    if n_frames == 0:
+        parser.error('aucune trame étiquetée trouvée')
+
+    table = learn_lut(counts, args.smoothing)
+    save_color_lut(args.out, table, {'source': args.images, 'frames': n_frames, 'smoothing': args.smoothing,
+                                     'pixels': counts.sum(axis=1).tolist()})
+    print('{} trames, {} pixels étiquetés ; table écrite dans {}'.format(n_frames, int(counts.sum()), args.out))
+    if validation:
+        print('\nValidation ({} trames), table apprise :'.format(len(validation)))
+        print(format_confusion(confusion(table, validation)))
+        print('\nSeuils par défaut :')
+        print(format_confusion(confusion(lut_from_thresholds(), validation)))
+
+
+if __name__ == '__main__':
+    main()
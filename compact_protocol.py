@@ -0,0 +1,126 @@
+import base64
+import json
+import struct
+
+import numpy as np
+
+# Protocole compact entre le simulateur (ou fake_sim.run_client) et drive_rover.py.
+# Le format d'origine transporte tout en texte : nombres convertis en chaînes (« 1.2;3.4 » pour les
+# listes) et images JPEG en base64, dans les deux sens et à chaque trame. Le format compact utilise les
+# pièces jointes binaires de socketio :
+#   - télémétrie : 'state' (champs numériques packés, STATE), 'samples' (positions des échantillons en
+#     float32, x puis y) et 'image' (octets JPEG bruts) ;
+#   - commandes : 'commands' (accélération, frein, direction, COMMANDS) et les images d'incrustation en
+#     octets JPEG bruts, absentes quand elles n'ont pas changé depuis le dernier envoi (le client garde
+#     alors les précédentes).
+# Négociation : à la connexion, le client appelle l'événement 'protocol' avec les versions qu'il connaît
+# ({'versions': [1]}) et le serveur répond (accusé de réception socketio) par la version retenue,
+# 0 pour le format texte. Sans réponse (simulateur ou serveur d'origine), chacun reste au format texte.
+# Le serveur reconnaît le format de chaque trame reçue : les deux formats peuvent coexister.
+
+PROTOCOL_VERSION = 1
+TEXT_PROTOCOL = 0
+# Vitesse, x, y, lacet, tangage, roulis, accélération, direction ; near_sample, picking_up, sample_count
+STATE = struct.Struct('<8f3H')
+COMMANDS = struct.Struct('<3f')
+
+
+# Version retenue parmi celles proposées par le client (TEXT_PROTOCOL si aucune n'est commune)
+def negotiate(offer, supported=(PROTOCOL_VERSION,)):
+    versions = offer.get('versions', []) if isinstance(offer, dict) else []
+    common = [v for v in versions if v in supported]
+    return max(common) if common else TEXT_PROTOCOL
+
+
+def is_compact(data):
+    return 'state' in data
+
+
+def pack_telemetry(speed, pos, yaw, pitch, roll, throttle, steer, near_sample, picking_up, sample_count,
+                   samples_x, samples_y, jpeg):
+    return {
+        'state': STATE.pack(speed, pos[0], pos[1], yaw, pitch, roll, throttle, steer,
+                            near_sample, picking_up, sample_count),
+        'samples': np.concatenate((samples_x, samples_y)).astype('<f4').tobytes(),
+        'image': bytes(jpeg),
+    }
+
+
+# (vitesse, x, y, lacet, tangage, roulis, accélération, direction, near_sample, picking_up, sample_count)
+def unpack_state(data):
+    return STATE.unpack(data['state'])
+
+
+# Positions (x, y) des échantillons
+def unpack_samples(data):
+    samples = np.frombuffer(data['samples'], dtype='<f4')
+    return samples[:len(samples) // 2], samples[len(samples) // 2:]
+
+
+# Télémétrie compacte convertie au format texte du simulateur (journaux, métadonnées des enregistrements).
+# `image=False` : sans l'image, pour éviter l'encodage base64 quand elle est enregistrée à part.
+def text_telemetry(data, image=True):
+    speed, x, y, yaw, pitch, roll, throttle, steer, near_sample, picking_up, sample_count = unpack_state(data)
+    samples_x, samples_y = unpack_samples(data)
+    text = {
+        'speed': repr(speed),
+        'position': '{!r};{!r}'.format(x, y),
+        'yaw': repr(yaw),
+        'pitch': repr(pitch),
+        'roll': repr(roll),
+        'throttle': repr(throttle),
+        'steering_angle': repr(steer),
+        'near_sample': str(near_sample),
+        'picking_up': str(picking_up),
+        'sample_count': str(sample_count),
+        'samples_x': ';'.join(repr(float(v)) for v in samples_x),
+        'samples_y': ';'.join(repr(float(v)) for v in samples_y),
+    }
+    if image:
+        text['image'] = base64.b64encode(data['image']).decode('utf-8')
+    return text
+
+
+# Commandes au format compact ; une image à None n'est pas envoyée
+def pack_commands(commands, inset1=None, inset2=None):
+    data = {'commands': COMMANDS.pack(*commands)}
+    if inset1 is not None:
+        data['inset_image1'] = inset1
+    if inset2 is not None:
+        data['inset_image2'] = inset2
+    return data
+
+
+# (accélération, frein, direction), image 1, image 2 (None si inchangée) ; accepte aussi le format texte
+def unpack_commands(data):
+    if 'commands' in data:
+        commands = COMMANDS.unpack(data['commands'])
+        return commands, data.get('inset_image1'), data.get('inset_image2')
+    commands = tuple(float(data[k]) for k in ('throttle', 'brake', 'steering_angle'))
+    return commands, data.get('inset_image1') or None, data.get('inset_image2') or None
+
+
+# Dernières images d'incrustation envoyées à un client : seules celles qui ont changé sont renvoyées
+class InsetCache():
+    def __init__(self):
+        self.sent = [None, None]
+        self.unchanged = 0
+
+    def filter(self, *images):
+        result = []
+        for i, image in enumerate(images):
+            if not image or image == self.sent[i]:
+                if image:
+                    self.unchanged += 1
+                result.append(None)
+            else:
+                self.sent[i] = image
+                result.append(image)
+        return result
+
+
+# Taille approximative (octets) d'un message : pièces jointes binaires plus le reste encodé en JSON
+def payload_size(data):
+    binary = {k: v for k, v in data.items() if isinstance(v, (bytes, bytearray))}
+    rest = {k: v for k, v in data.items() if k not in binary}
+    return sum(len(v) for v in binary.values()) + len(json.dumps(rest, separators=(',', ':')))
@@ -0,0 +1,199 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from perception import perception_step
+from decision import decision_step
+from supporting_functions import update_rover
+
+# Boucle de contrôle à cadence fixe.
+# Sans elle, une décision est prise à chaque événement de télémétrie : la cadence et la latence
+# dépendent du rythme du simulateur et de ses à-coups. Ici, la télémétrie reçue est seulement
+# conservée (la dernière trame remplace la précédente : les trames en retard sont abandonnées, jamais
+# mises en file) et sa perception lancée dans un fil dédié dès que celui-ci est libre. À chaque période,
+# la décision est prise à partir des derniers résultats de perception, la pose étant extrapolée jusqu'à
+# l'instant présent par un estimateur à vitesse constante, puis les commandes sont envoyées.
+# La latence de contrôle reste ainsi bornée par la période plus la durée d'une perception, quelle que
+# soit la charge. Toutes les durées utilisent une horloge monotone.
+
+
+def _wrap(angle):
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+# Estimateur à vitesse constante sur (pos, lacet, vitesse) : la vitesse de lacet est lissée
+# exponentiellement entre deux trames, la position avance selon la vitesse mesurée et le cap estimé
+class StateEstimator():
+    def __init__(self, smoothing=0.5, max_horizon=0.5):
+        self.smoothing = smoothing  # Poids de la nouvelle mesure de vitesse de lacet
+        self.max_horizon = max_horizon  # Extrapolation maximale (secondes)
+        self.t = None
+        self.pos = None
+        self.yaw = None
+        self.vel = 0.0
+        self.yaw_rate = 0.0  # Degrés par seconde
+
+    def observe(self, Rover, t):
+        if self.t is not None and t > self.t:
+            rate = _wrap(Rover.yaw - self.yaw) / (t - self.t)
+            self.yaw_rate += self.smoothing * (rate - self.yaw_rate)
+        self.t = t
+        self.pos = np.array(Rover.pos, dtype=float)
+        self.yaw = float(Rover.yaw)
+        self.vel = float(Rover.vel)
+
+    # Pose prédite (x, y, lacet) à l'instant t
+    def predict(self, t):
+        dt = min(max(t - self.t, 0.0), self.max_horizon)
+        yaw = self.yaw + self.yaw_rate * dt
+        # Cap moyen sur l'intervalle (arc de cercle approché)
+        heading = np.radians(self.yaw + self.yaw_rate * dt / 2)
+        x = self.pos[0] + self.vel * dt * np.cos(heading)
+        y = self.pos[1] + self.vel * dt * np.sin(heading)
+        return x, y, yaw % 360.0
+
+    # Écrit la pose prédite dans Rover (avant decision_step)
+    def apply(self, Rover, t):
+        if self.t is None:
+            return
+        x, y, yaw = self.predict(t)
+        Rover.pos = np.array([x, y])
+        Rover.yaw = yaw
+
+
+class ControlLoop():
+    def __init__(self, Rover, act, rate=25.0, perception=perception_step, decision=decision_step,
+                 max_frame_age=0.5, estimator=None, clock=time.monotonic, on_frame=None, metrics=None):
+        self.Rover = Rover
+        self.act = act  # act(Rover) : envoi des commandes (et des images) après chaque décision
+        self.period = 1.0 / rate
+        self.perception = perception
+        self.decision = decision
+        self.max_frame_age = max_frame_age  # Au-delà (secondes), une trame n'est plus perçue
+        self.estimator = estimator if estimator is not None else StateEstimator()
+        self.clock = clock
+        Rover.clock = clock
+        self.on_frame = on_frame  # on_frame(image, data) : appelé pour chaque trame décodée
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Sérialise décision et démarrage d'une perception (acquis sans attente dans submit : la télémétrie
+        # peut arriver pendant l'envoi des commandes, qui rend la main à eventlet)
+        self.lock = threading.Lock()
+        self.future = None
+        self.pending = None  # (data, instant de réception) de la trame la plus récente
+        self.frame_time = None  # Instant de réception de la trame en cours de perception / perçue
+        self.running = True
+        self.frames_received = 0
+        self.frames_dropped = 0  # Remplacées par une trame plus récente avant d'être perçues
+        self.frames_stale = 0  # Trop anciennes au moment d'être perçues
+        self.decisions = 0
+        self.waits = 0  # Décisions retardées par une perception encore en cours
+
+    # Réception d'une trame de télémétrie : seule la plus récente est conservée, et perçue tout de suite
+    # si le fil de perception est libre
+    def submit(self, data, t=None):
+        if self.pending is not None:
+            self.frames_dropped += 1
+        self.pending = (data, self.clock() if t is None else t)
+        self.frames_received += 1
+        if self.lock.acquire(blocking=False):
+            try:
+                if self.future is None or self.future.done():
+                    self._collect()
+                    self._start(self.clock())
+            finally:
+                self.lock.release()
+
+    def _count(self, name, value=1):
+        if self.metrics is not None:
+            self.metrics.count(name, value)
+
+    def _observe(self, name, seconds):
+        if self.metrics is not None:
+            self.metrics.observe(name, seconds)
+
+    def _perceive(self):
+        start = time.perf_counter()
+        self.perception(self.Rover)
+        return time.perf_counter() - start
+
+
+    # Attend la fin de la perception en cours
+    def _collect(self):
+        if self.future is not None:
+            if not self.future.done():
+                self.waits += 1
+            self._observe('perception', self.future.result())
+            if self.Rover.perception_mode_used is not None:
+                self._observe('perception_' + self.Rover.perception_mode_used, self.Rover.perception_cost)
+            self.future = None
+
+    # Décode la trame en attente et lance sa perception
+    def _start(self, now):
+        if self.pending is None or not self.running:
+            return
+        data, received = self.pending
+        self.pending = None
+        if now - received > self.max_frame_age:
+            self.frames_stale += 1
+            self._count('stale_frames')
+            return
+        # update_rover remplace les commandes par celles de la télémétrie : la décision suivante les recalcule
+        Rover, image = update_rover(self.Rover, data)
+        if self.on_frame is not None:
+            self.on_frame(image, data)
+        if np.isfinite(Rover.vel):
+            self.estimator.observe(Rover, received)
+            self.frame_time = received
+            self.future = self.executor.submit(self._perceive)
+        else:
+            self._count('invalid_frames')
+
+    # Une période : décision à partir de la dernière perception terminée (attendue si elle est en cours),
+    # puis perception de la trame en attente. Renvoie True si une décision a été prise.
+    def tick(self):
+        Rover = self.Rover
+        decided = False
+        with self.lock:
+            self._collect()
+            now = self.clock()
+            if Rover.nav_angles is not None and np.isfinite(Rover.vel):
+                self.estimator.apply(Rover, now)
+                start = time.perf_counter()
+                self.decision(Rover)
+                self._observe('decision', time.perf_counter() - start)
+                # Âge de l'information utilisée (réception de la trame -> commande)
+                self._observe('control_latency', now - self.frame_time)
+                self.act(Rover)
+                self.decisions += 1
+                decided = True
+            self._start(self.clock())
+        return decided
+
+    # Boucle à cadence fixe ; `sleep` permet d'utiliser eventlet.sleep pour rendre la main aux autres
+    # connexions (y compris pendant l'attente de la perception)
+    def run(self, sleep=time.sleep):
+        next_tick = self.clock()
+        while self.running:
+            while self.future is not None and not self.future.done() and self.clock() < next_tick + self.period:
+                sleep(0.001)
+            if not self.running:
+                break
+            self.tick()
+            next_tick += self.period
+            now = self.clock()
+            if now > next_tick:
+                # En retard : on repart de maintenant plutôt que d'enchaîner les périodes manquées
+                self._count('missed_ticks', int((now - next_tick) / self.period) + 1)
+                next_tick = now
+            sleep(max(0.0, next_tick - now))
+
+    def close(self):
+        self.running = False
+        self.executor.shutdown(wait=True)
+
+    def summary(self):
+        return {'frames_received': self.frames_received, 'frames_dropped': self.frames_dropped,
+                'frames_stale': self.frames_stale, 'decisions': self.decisions, 'waits': self.waits}
@@ -0,0 +1,113 @@
+import cv2
+import numpy as np
+
+from worldmap import DirtyTiles, TiledWorldMap, make_worldmap
+
+# Carte de dégagement : distance (en mètres) de chaque cellule à l'obstacle cartographié le plus proche.
+# La transformée en distance n'est recalculée que sur la région modifiée de la carte, élargie de
+# `max_range` (au-delà, les distances sont plafonnées et ne peuvent pas changer). Avec une carte par
+# tuiles, les modifications sont suivies tuile par tuile : chaque recalcul porte sur une tuile élargie,
+# quelle que soit la taille de la carte.
+# La distance est conservée sous forme de proximité (max_range - distance), nulle loin des obstacles,
+# dans une carte de même implémentation que la carte du monde : par tuiles, seules les tuiles proches
+# d'un obstacle sont allouées ; dense, elle occupe size x size float32.
+# Le dégagement le long d'un cap s'obtient par lancer de rayon sur cette carte (« sphere tracing ») :
+# chaque pas avance de la distance libre lue dans la table, si bien que quelques lectures suffisent
+# quelle que soit la longueur du rayon. Par décision, tous les caps (braquages candidats et cap actuel)
+# sont lancés ensemble : au plus `steps` lectures vectorisées, moins si tous les rayons sont arrêtés.
+
+
+class ClearanceMap():
+    def __init__(self, worldmap, max_range=10.0, min_evidence=0, steps=12, steer_count=7, max_steer=15):
+        self.worldmap = worldmap
+        tiled = isinstance(worldmap, TiledWorldMap)
+        tile_size = getattr(worldmap, 'tile_size', 32)
+        self.dirty = worldmap.track(DirtyTiles(worldmap.size, tile_size) if tiled else None)
+        self.max_range = max_range  # Dégagement maximal mesuré (mètres)
+        self.min_evidence = min_evidence  # Évidence d'obstacle minimale pour bloquer une cellule
+        self.steps = steps  # Nombre maximal de pas du lancer de rayon
+        self.steer_count = steer_count  # Nombre de braquages évalués, répartis sur ±Rover.max_steer
+        self.steer_candidates = self._candidates(max_steer)  # Angles de braquage évalués (degrés)
+        size = worldmap.size
+        self.proximity = make_worldmap(size, worldmap.cell_size, np.float32, tiled=tiled, tile_size=tile_size,
+                                       channels=1)
+        self.clearances = np.full(len(self.steer_candidates), max_range)
+        # Premier calcul sur la carte entière (carte éventuellement déjà remplie, reprise) ; avec une carte
+        # par tuiles, seules les tuiles allouées peuvent contenir des obstacles
+        if tiled:
+            for ty, tx in list(worldmap.tiles):
+                self.dirty.add_bbox(ty * tile_size, (ty + 1) * tile_size, tx * tile_size, (tx + 1) * tile_size)
+        else:
+            self.dirty.add_bbox(0, size, 0, size)
+        self.update()
+
+    def _candidates(self, max_steer):
+        return np.linspace(-max_steer, max_steer, self.steer_count)
+
+    @property
+    def pad(self):
+        return int(np.ceil(self.max_range / self.worldmap.cell_size)) + 1
+
+    def _refresh(self, y0, y1, x0, x1):
+        size, pad = self.worldmap.size, self.pad
+        # Les distances changent jusqu'à `max_range` autour des cellules modifiées ; on les recalcule
+        # sur cette fenêtre à partir d'une fenêtre encore élargie (obstacles voisins compris)
+        wy0, wy1, wx0, wx1 = max(0, y0 - pad), min(size, y1 + pad), max(0, x0 - pad), min(size, x1 + pad)
+        ry0, ry1, rx0, rx1 = max(0, wy0 - pad), min(size, wy1 + pad), max(0, wx0 - pad), min(size, wx1 + pad)
+        region = self.worldmap.region(ry0, ry1, rx0, rx1)
+        obs, nav = region[:, :, 0], region[:, :, 2]
+        obstacle = (obs > nav) & (obs > self.min_evidence)
+        if not obstacle.any():
+            proximity = np.zeros((wy1 - wy0, wx1 - wx0), dtype=np.float32)
+        else:
+            free = np.where(obstacle, 0, 255).astype(np.uint8)
+            distance = cv2.distanceTransform(free, cv2.DIST_L2, cv2.DIST_MASK_PRECISE) * self.worldmap.cell_size
+            distance = distance[wy0 - ry0:wy1 - ry0, wx0 - rx0:wx1 - rx0]
+            proximity = np.maximum(self.max_range - distance, 0).astype(np.float32)
+        self.proximity.set_region(wy0, wx0, proximity[:, :, None])
+
+    def update(self):
+        taken = self.dirty.take()
+        # DirtyTiles : une boîte par tuile modifiée ; DirtyRegion : une seule boîte englobante, ou None
+        boxes = taken if isinstance(self.dirty, DirtyTiles) else [taken] if taken is not None else []
+        for bbox in boxes:
+            self._refresh(*bbox)
+
+    # Distance libre (mètres) aux positions (x, y)
+    def at(self, x, y):
+        ix, iy = self.worldmap.world_to_cell(np.atleast_1d(x), np.atleast_1d(y))
+        return self.max_range - self.proximity.gather(0, iy, ix)
+
+    # Dégagement (mètres) le long de chaque cap monde `angles` (radians) depuis (x, y), plafonné à max_range
+    def clearance(self, x, y, angles):
+        angles = np.atleast_1d(np.asarray(angles, dtype=float))
+        dx, dy = np.cos(angles), np.sin(angles)
+        travelled = np.zeros(angles.shape)
+        min_step = 0.5 * self.worldmap.cell_size
+        for _ in range(self.steps):
+            free = self.at(x + travelled * dx, y + travelled * dy)
+            # Un rayon s'arrête sur une cellule d'obstacle ; sinon il avance de la distance libre
+            advanced = np.where(free > 0, np.minimum(travelled + np.maximum(free, min_step), self.max_range), travelled)
+            if np.array_equal(advanced, travelled):
+                break
+            travelled = advanced
+        return travelled
+
+    # Met à jour la carte, puis le dégagement devant le rover et pour chaque braquage candidat
+    # (candidats recalculés si Rover.max_steer a changé)
+    def update_rover(self, Rover):
+        self.update()
+        if self.steer_candidates[-1] != Rover.max_steer:
+            self.steer_candidates = self._candidates(Rover.max_steer)
+        yaw = Rover.yaw * np.pi / 180
+        angles = yaw + self.steer_candidates * np.pi / 180
+        self.clearances = self.clearance(Rover.pos[0], Rover.pos[1], np.append(angles, yaw))
+        Rover.dist_to_obstacle = float(self.clearances[-1])
+        self.clearances = self.clearances[:-1]
+        return Rover.dist_to_obstacle
+
+    # Braquage candidat le plus dégagé ; à dégagement égal, le plus proche de `preferred` (degrés)
+    def best_steer(self, preferred=0.0):
+        best = self.clearances.max()
+        choices = self.steer_candidates[self.clearances >= best - 1e-6]
+        return float(choices[np.argmin(np.abs(choices - preferred))])
@@ -1,63 +1,104 @@
 import numpy as np
-import time
 
 def decision_step(Rover):
     # 1. Gestion du ramassage
     if Rover.near_sample:
         Rover.throttle = 0
-        Rover.brake = 10
+        Rover.brake = Rover.brake_set
         if not Rover.picking_up:
             Rover.send_pickup = True
+            # Le rocher ramassé ne doit plus être recherché
+            Rover.rock_index.mark_visited(Rover.pos[0], Rover.pos[1])
         return Rover
 
     # 2. Détection de blocage
     if Rover.mode == 'forward':
         # Si on veut avancer mais que la vitesse est quasi nulle
+        # (horloge monotone du rover : temps réel, ou temps simulé lors d'un rejeu)
         if Rover.vel < 0.2 and Rover.throttle > 0.1:
-            if not hasattr(Rover, 'stuck_time'):
-                Rover.stuck_time = time.time()
-            elif time.time() - Rover.stuck_time > 2: # Bloqué plus de 2 sec
+            if Rover.stuck_time is None:
+                Rover.stuck_time = Rover.clock()
+            elif Rover.clock() - Rover.stuck_time > Rover.stuck_timeout: # Bloqué plus de 2 sec (par défaut)
                 Rover.mode = 'stuck'
         else:
-            Rover.stuck_time = time.time()
+            Rover.stuck_time = Rover.clock()
+
+    # Planificateur d'exploration (facultatif) : mise à jour des frontières et du chemin
+    if Rover.explorer is not None and Rover.pos is not None:
+        Rover.explorer.update(Rover)
+    # Carte de dégagement (facultative) : distance à l'obstacle devant le rover et pour chaque braquage
+    if Rover.costmap is not None and Rover.pos is not None:
+        Rover.costmap.update_rover(Rover)
 
     # 3. Logique des modes
     if Rover.nav_angles is not None:
+        # Terrain navigable visible, en pixels de la vue complète (quel que soit le mode de perception)
+        nav_pixels = len(Rover.nav_angles) * Rover.nav_pixel_area
         if Rover.mode == 'stuck':
             Rover.throttle = 0
             Rover.brake = 0
-            Rover.steer = -15 # Tourne pour se dégager
-            if len(Rover.nav_angles) > Rover.go_forward:
+            Rover.steer = -Rover.max_steer # Tourne pour se dégager
+            if nav_pixels > Rover.go_forward:
                 Rover.mode = 'forward'
-                delattr(Rover, 'stuck_time')
+                Rover.stuck_time = None
 
         elif Rover.mode == 'forward':
-            if len(Rover.nav_angles) >= Rover.stop_forward:
+            if nav_pixels >= Rover.stop_forward:
                 # Priorité aux rochers
+                rock = None
+                if len(Rover.samples_angles) == 0 and Rover.rock_seek_distance > 0:
+                    # Rocher déjà détecté mais sorti du champ de la caméra : on le rejoint s'il est proche et devant
+                    rock = Rover.rock_index.nearest_unvisited(Rover.pos[0], Rover.pos[1], Rover.rock_seek_distance)
+                    if rock is not None:
+                        angle = np.arctan2(rock[2] - Rover.pos[1], rock[1] - Rover.pos[0]) * 180 / np.pi - Rover.yaw
+                        angle = (angle + 180) % 360 - 180
+                        rock = angle if abs(angle) < 45 else None
                 if len(Rover.samples_angles) > 0:
-                    Rover.steer = np.clip(np.mean(Rover.samples_angles * 180 / np.pi), -15, 15)
+                    Rover.steer = np.clip(np.mean(Rover.samples_angles * 180 / np.pi), -Rover.max_steer, Rover.max_steer)
+                elif rock is not None:
+                    Rover.steer = np.clip(rock, -Rover.max_steer, Rover.max_steer)
                 else:
-                    # Navigation normale (on ajoute un petit offset de 0.1 pour longer les murs)
-                    Rover.steer = np.clip(np.mean((Rover.nav_angles + 0.1) * 180 / np.pi), -15, 15)
+                    target = None
+                    if Rover.explorer is not None:
+                        target = Rover.explorer.steering_angle(Rover.nav_angles, Rover.nav_pixel_area)
+                    if target is not None:
+                        # Vers la frontière choisie par le planificateur
+                        Rover.steer = np.clip(target * 180 / np.pi, -Rover.max_steer, Rover.max_steer)
+                    else:
+                        # Navigation normale (on ajoute un petit offset, 0.1 rad par défaut, pour longer les murs)
+                        Rover.steer = np.clip(np.mean((Rover.nav_angles + Rover.wall_bias) * 180 / np.pi),
+                                              -Rover.max_steer, Rover.max_steer)
 
                 if Rover.vel < Rover.max_vel:
-                    Rover.throttle = 0.2
+                    Rover.throttle = Rover.throttle_set
                 else:
                     Rover.throttle = 0
                 Rover.brake = 0
+
+                # Obstacle cartographié devant : on ralentit et on braque vers le cap le plus dégagé,
+                # ou on s'arrête s'il est trop proche (sauf en approche d'un rocher)
+                if Rover.costmap is not None and len(Rover.samples_angles) == 0 \
+                        and Rover.dist_to_obstacle < Rover.slow_distance:
+                    if Rover.dist_to_obstacle < Rover.stop_distance:
+                        Rover.mode = 'stop'
+                    else:
+                        Rover.steer = Rover.costmap.best_steer(Rover.steer)
+                        if Rover.vel > Rover.max_vel / 2:
+                            Rover.throttle = 0
             else:
                 Rover.mode = 'stop'
 
         elif Rover.mode == 'stop':
             if Rover.vel > 0.2:
                 Rover.throttle = 0
-                Rover.brake = 10
+                Rover.brake = Rover.brake_set
                 Rover.steer = 0
             else:
                 Rover.throttle = 0
                 Rover.brake = 0
-                Rover.steer = -15
-                if len(Rover.nav_angles) >= Rover.go_forward:
+                Rover.steer = -Rover.max_steer
+                clear = Rover.costmap is None or Rover.dist_to_obstacle >= Rover.stop_distance
+                if nav_pixels >= Rover.go_forward and clear:
                     Rover.mode = 'forward'
 
     return Rover
@@ -1,198 +1,697 @@
 import argparse
 import shutil
-import base64
-from datetime import datetime
 import os
-import cv2
 import numpy as np
 import socketio
 import eventlet
 import eventlet.wsgi
-from PIL import Image
-from flask import Flask
-from io import BytesIO, StringIO
-import json
-import pickle
-import matplotlib.image as mpimg
-import time
+from flask import Flask, jsonify, request
+import signal
+from multiprocessing import Process
 
 # Importez les fonctions pour la perception et la prise de décision
-from perception import perception_step
+from perception import perception_step, get_perception_kernel, LutSegmenter, PERCEPTION_MODES
 from decision import decision_step
-from supporting_functions import update_rover, create_output_images
+from supporting_functions import update_rover, create_output_images, OutputImageWorker, encode_image, encode_jpeg
+from rover_state import RoverState, load_ground_truth
+from worldmap import make_worldmap
+from map_fusion import MapFusion, WEIGHTINGS
+from telemetry_log import TelemetryRecorder
+from recorder import FrameRecorder
+from metrics import Metrics
+from exploration import ExplorationPlanner
+from costmap import ClearanceMap
+from pose_fusion import PoseAwareFusion
+from control_loop import ControlLoop
+from map_snapshot import MapSnapshot, restore_snapshot
+from scoring import RunScore
+from compact_protocol import (PROTOCOL_VERSION, TEXT_PROTOCOL, negotiate, is_compact, text_telemetry,
+                              pack_commands, InsetCache)
 
 # Initialisez le serveur socketio et l'application Flask
 # (en savoir plus sur : https://python-socketio.readthedocs.io/en/latest/)
 sio = socketio.Server()
 app = Flask(__name__)
 
-# Lisez la carte de vérité terrain et créez une version verte en 3 canaux pour la superposition
-# REMARQUE : les images sont lues par défaut avec l'origine (0, 0) en haut à gauche
-# et l'axe des y augmentant vers le bas.
-ground_truth = mpimg.imread('../calibration_images/map_bw.jpg')
-# Cette ligne suivante crée des tableaux de zéros dans les canaux rouge et bleu
-# et place la carte dans le canal vert. C'est pourquoi la carte sous-jacente
-# a l'air verte dans l'image d'affichage
-ground_truth_3d = np.dstack((ground_truth * 0, ground_truth * 255, ground_truth * 0)).astype(np.float)
-
-
-# Définissez la classe RoverState() pour conserver les paramètres d'état du rover
-class RoverState():
-    def __init__(self):
-        self.start_time = None  # Pour enregistrer l'heure de début de la navigation
-        self.total_time = None  # Pour enregistrer la durée totale de la navigation
-        self.img = None  # Image de caméra actuelle
-        self.pos = None  # Position actuelle (x, y)
-        self.yaw = None  # Angle de lacet actuel
-        self.pitch = None  # Angle de tangage actuel
-        self.roll = None  # Angle de roulis actuel
-        self.vel = None  # Vitesse actuelle
-        self.steer = 0  # Angle de direction actuel
-        self.throttle = 0  # Valeur actuelle de l'accélération
-        self.brake = 0  # Valeur actuelle du frein
-        self.nav_angles = None  # Angles des pixels de terrain navigable
-        self.nav_dists = None  # Distances des pixels de terrain navigable
-        self.ground_truth = ground_truth_3d  # Carte du monde de vérité terrain
-        self.mode = 'forward'  # Mode actuel (peut être "forward" ou "stop")
-        self.nav_area = 0
-        self.stop_forward = 50  # Seuil pour initier l'arrêt
-        self.go_forward = 500  # Seuil pour avancer à nouveau
-        self.max_vel = 2  # Vitesse maximale (mètres/seconde)
-
-        self.vision_image = np.zeros((160, 320, 3), dtype=np.float)
-
-        self.worldmap = np.zeros((200, 200, 3), dtype=np.float)
-        self.samples_pos = None  # Pour stocker les positions d'échantillons réelles
-        self.samples_to_find = 0  # Pour stocker le nombre initial d'échantillons
-        self.samples_located = 0  # Pour stocker le nombre d'échantillons situés sur la carte
-        self.samples_collected = 0  # Pour compter le nombre d'échantillons collectés
-        self.near_sample = 0  # Sera défini sur la valeur de télémétrie data["near_sample"]
-        self.picking_up = 0  # Sera défini sur la valeur de télémétrie data["picking_up"]
-        self.send_pickup = False  # Défini sur True pour déclencher la collecte de rochers
-        self.samples_dists = np.asarray([])
-        self.samples_angles = np.asarray([])
-        self.dist_to_obstacle = 0
-
-# Initialisez notre rover
-Rover = RoverState()
-
-# Variables pour suivre les images par seconde (FPS)
-# Compteur de trames initial
-frame_counter = 0
-# Initialisation du compteur de secondes
-second_counter = time.time()
-fps = None
+# Lisez la carte de vérité terrain (version verte en 3 canaux pour la superposition).
+# Elle est partagée par tous les rovers du processus.
+ground_truth_3d = load_ground_truth()
+
+# Précalculez les tables de perception (transformation et coordonnées polaires) au démarrage
+get_perception_kernel((160, 320, 3))
+
+# Mesures du chemin critique (durées par étape, FPS, trames non valides ou abandonnées), tous rovers confondus
+metrics = Metrics()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Conduite à distance')
+    parser.add_argument(
+        'image_folder',
+        type=str,
+        nargs='?',
+        default='',
+        help="Chemin du dossier d'images. C'est l'endroit où les images de la course seront enregistrées."
+    )
+    parser.add_argument(
+        '--record-telemetry',
+        type=str,
+        default='',
+        help="Journal où enregistrer la télémétrie brute (.log.gz) pour la rejouer avec replay.py."
+    )
+    parser.add_argument(
+        '--record-format',
+        choices=['jpg', 'segments'],
+        default='jpg',
+        help="Format d'enregistrement des images : un JPEG par trame, ou segments en ajout seul avec "
+             "télémétrie et index (relus avec recorder.open_recording)."
+    )
+    parser.add_argument(
+        '--record-queue',
+        type=int,
+        default=64,
+        help="Nombre maximal de trames en attente d'écriture avant abandon."
+    )
+    parser.add_argument(
+        '--world-size',
+        type=int,
+        default=200,
+        help="Taille de la carte du monde, en cellules de côté."
+    )
+    parser.add_argument(
+        '--cell-size',
+        type=float,
+        default=1.0,
+        help="Taille d'une cellule de la carte, en mètres."
+    )
+    parser.add_argument(
+        '--map-dtype',
+        choices=['float64', 'float32', 'uint16', 'uint32'],
+        default='float64',
+        help="Type des canaux de la carte (uint16 : compteurs compacts saturés)."
+    )
+    parser.add_argument(
+        '--tiled-map',
+        action='store_true',
+        help="Carte par tuiles allouées à la demande (mémoire proportionnelle à la surface explorée)."
+    )
+    parser.add_argument(
+        '--map-weighting',
+        choices=WEIGHTINGS,
+        default='none',
+        help="Pondération des détections fusionnées dans la carte : none (chaque pixel compte 1) ou "
+             "distance (confiance décroissant avec la distance au rover, cartes flottantes seulement)."
+    )
+    parser.add_argument(
+        '--log-odds',
+        action='store_true',
+        help="Tenir à jour une grille d'occupation en log-odds en parallèle des compteurs (voir map_fusion.py)."
+    )
+    parser.add_argument(
+        '--inset-rate',
+        type=float,
+        default=0,
+        help="Cadence (Hz) de production des images d'incrustation en arrière-plan. "
+             "0 : images produites à chaque trame avant l'envoi des commandes."
+    )
+    parser.add_argument(
+        '--explore',
+        action='store_true',
+        help="Diriger le rover vers les frontières de la carte (planificateur d'exploration A*)."
+    )
+    parser.add_argument(
+        '--clearance',
+        action='store_true',
+        help="Ralentir et contourner les obstacles cartographiés (carte de dégagement, voir costmap.py)."
+    )
+    parser.add_argument(
+        '--rock-seek-distance',
+        type=float,
+        default=0,
+        help="Rejoindre un rocher déjà détecté, sorti du champ de la caméra, s'il est à moins de cette "
+             "distance (mètres) et devant le rover. 0 : désactivé."
+    )
+    parser.add_argument(
+        '--max-tilt',
+        type=float,
+        default=0,
+        help="Corriger la perspective pour un tangage / roulis jusqu'à cet angle (degrés) et pondérer "
+             "les détections par leur erreur de projection (voir pose_fusion.py). "
+             "0 : seules les trames à moins de 1° d'inclinaison mettent la carte à jour."
+    )
+    parser.add_argument(
+        '--pose-latency',
+        type=float,
+        default=0,
+        help="Retard de l'image sur la télémétrie (en trames, fractionnaire) avec --max-tilt : la pose de "
+             "la trame est interpolée entre les dernières poses reçues."
+    )
+    parser.add_argument(
+        '--color-lut',
+        type=str,
+        default='',
+        help="Table de segmentation couleur apprise par calibrate_colors.py, rechargée à chaud quand le "
+             "fichier change (ou via http://localhost:4567/color-lut/reload)."
+    )
+    parser.add_argument(
+        '--perception-mode',
+        choices=sorted(PERCEPTION_MODES) + ['auto'],
+        default='full',
+        help="Mode de perception : full (vue complète), roi (région utile seulement), fast (région utile à "
+             "demi-résolution) ou auto (fast à grande vitesse, sinon le mode le plus fin qui tient dans "
+             "--perception-budget). Le coût par mode est publié sur /metrics (perception_<mode>)."
+    )
+    parser.add_argument(
+        '--perception-budget',
+        type=float,
+        default=0,
+        help="Coût médian maximal (ms) d'une trame de perception en mode auto (0 : pas de limite)."
+    )
+    parser.add_argument(
+        '--control-rate',
+        type=float,
+        default=0,
+        help="Cadence fixe (Hz) des décisions : la perception tourne en arrière-plan sur la dernière trame "
+             "reçue et les trames en retard sont abandonnées (voir control_loop.py). "
+             "0 : une décision par trame de télémétrie."
+    )
+    parser.add_argument(
+        '--snapshot',
+        type=str,
+        default='',
+        help="Dossier où enregistrer périodiquement la carte, les rochers détectés et l'état du rover "
+             "(seules les tuiles modifiées sont réécrites ; voir map_snapshot.py)."
+    )
+    parser.add_argument(
+        '--snapshot-interval',
+        type=float,
+        default=5.0,
+        help="Intervalle (secondes) entre deux instantanés."
+    )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="Reprendre la course à partir de l'instantané de --snapshot au lieu de repartir d'une carte vide."
+    )
+    parser.add_argument(
+        '--score-log',
+        type=str,
+        default='',
+        help="Fichier (lignes JSON) où relever le score de la course par rapport à la vérité terrain : "
+             "carte couverte, fidélité, échantillons localisés et collectés (voir scoring.py)."
+    )
+    parser.add_argument(
+        '--score-report',
+        type=str,
+        default='',
+        help="Rapport JSON du score écrit à la fin de la course (comparable avec python scoring.py). "
+             "Le score courant est aussi disponible sur http://localhost:4567/score."
+    )
+    parser.add_argument(
+        '--score-interval',
+        type=float,
+        default=1.0,
+        help="Intervalle (secondes de course) entre deux relevés de la série temporelle du score."
+    )
+    parser.add_argument(
+        '--compact',
+        action='store_true',
+        help="Accepter le protocole compact proposé par le client (nombres packés, images JPEG en pièces "
+             "jointes binaires, incrustations envoyées seulement quand elles changent ; voir "
+             "compact_protocol.py). Les clients qui ne le proposent pas restent au format texte."
+    )
+    parser.add_argument(
+        '--resume-grace',
+        type=float,
+        default=10.0,
+        help="Durée (secondes) pendant laquelle la session d'un client déconnecté est gardée : s'il se "
+             "reconnecte à temps, il reprend son rover (carte, enregistrements, score) au lieu d'en ouvrir "
+             "un nouveau. Le client est reconnu par l'identifiant d'authentification 'rover' s'il en donne "
+             "un, sinon par son adresse. 0 : la session est fermée dès la déconnexion."
+    )
+    parser.add_argument(
+        '--metrics-log',
+        type=float,
+        default=0,
+        help="Intervalle (secondes) d'affichage d'une ligne de métriques. 0 : désactivé "
+             "(les métriques restent disponibles sur http://localhost:4567/metrics)."
+    )
+    parser.add_argument(
+        '--profile',
+        type=int,
+        default=0,
+        help="Profiler les N premières trames avec cProfile (voir --profile-out)."
+    )
+    parser.add_argument(
+        '--profile-out',
+        type=str,
+        default='drive_rover.prof',
+        help="Fichier de sortie du profil cProfile (aussi utilisé par /metrics/profile)."
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=4567,
+        help="Port d'écoute du serveur (premier port si --workers > 1)."
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help="Nombre de processus serveurs, sur des ports consécutifs à partir de --port. "
+             "Chaque processus pilote autant de simulateurs que de connexions."
+    )
+    return parser
+
+
+# Options des sessions (valeurs par défaut, remplacées par la ligne de commande)
+config = build_parser().parse_args([])
+# Une session par connexion (sid) : chaque simulateur connecté pilote son propre rover.
+# Les sessions sont numérotées dans l'ordre d'ouverture ; une session déconnectée est gardée
+# --resume-grace secondes (client -> (session, fermeture programmée)) pour que le même client la reprenne,
+# sans quoi une coupure passagère partagerait une course en plusieurs courses partielles.
+sessions = {}
+parked = {}
+session_count = 0
+
+
+def suffixed_path(path, suffix):
+    if path == '':
+        return path
+    for extension in ('.log.gz', '.jsonl', '.json'):
+        if path.endswith(extension):
+            return '{}_{}{}'.format(path[:-len(extension)], suffix, extension)
+    return '{}_{}'.format(path.rstrip(os.sep), suffix)
+
+
+# Chemin d'enregistrement de la session n : la première garde le chemin demandé, les suivantes sont suffixées
+def session_path(path, number):
+    return path if number == 0 else suffixed_path(path, 'rover{}'.format(number))
+
+
+class RoverSession():
+    def __init__(self, number, config, sid=None, client=None):
+        self.number = number
+        self.sid = sid  # Connexion actuelle
+        self.client = client  # Identité du client, pour la reprise après une déconnexion
+        # Initialisez notre rover
+        self.Rover = RoverState(ground_truth_3d, make_worldmap(config.world_size, config.cell_size,
+                                                               config.map_dtype, tiled=config.tiled_map))
+        self.Rover.map_fusion = MapFusion(config.map_weighting, log_odds=config.log_odds)
+        if config.explore:
+            self.Rover.explorer = ExplorationPlanner(self.Rover.worldmap)
+        if config.clearance:
+            self.Rover.costmap = ClearanceMap(self.Rover.worldmap)
+        self.Rover.rock_seek_distance = config.rock_seek_distance
+        self.Rover.perception_mode = config.perception_mode
+        if config.perception_budget > 0:
+            self.Rover.perception_budget = config.perception_budget / 1000
+        if config.color_lut != '':
+            self.Rover.segmenter = LutSegmenter(path=config.color_lut)
+        if config.max_tilt > 0:
+            self.Rover.pose_fusion = PoseAwareFusion(get_perception_kernel((160, 320, 3)), max_tilt=config.max_tilt,
+                                                     latency=config.pose_latency, cell_size=config.cell_size)
+        # Production des images d'incrustation en arrière-plan (optionnelle, voir --inset-rate)
+        self.output_worker = OutputImageWorker(config.inset_rate) if config.inset_rate > 0 else None
+        # Journal de télémétrie brute (optionnel, pour le rejeu hors ligne avec replay.py)
+        self.telemetry_recorder = None
+        if config.record_telemetry != '':
+            self.telemetry_recorder = TelemetryRecorder(session_path(config.record_telemetry, number))
+        # Enregistrement asynchrone des images de la caméra (si un dossier d'images est indiqué)
+        self.frame_recorder = None
+        if config.image_folder != '':
+            folder = session_path(config.image_folder, number)
+            if os.path.exists(folder):
+                shutil.rmtree(folder)
+            os.makedirs(folder)
+            self.frame_recorder = FrameRecorder(folder, config.record_format, queue_size=config.record_queue)
+        # Instantanés de la carte (optionnels), après la reprise éventuelle du précédent
+        self.snapshot = None
+        if config.snapshot != '':
+            path = session_path(config.snapshot, number)
+            if config.resume and restore_snapshot(path, self.Rover) is not None:
+                print("Rover {} : reprise de l'instantané {}".format(number, path))
+            self.snapshot = MapSnapshot(path, self.Rover, config.snapshot_interval, resume=config.resume)
+        # Score par rapport à la vérité terrain (optionnel) ; après la reprise, qui remplit déjà la carte
+        self.score_report = session_path(config.score_report, number)
+        if config.score_log != '' or config.score_report != '':
+            self.Rover.score = RunScore(self.Rover, config.score_interval, session_path(config.score_log, number))
+        self.control_loop = None
+        # Protocole négocié avec le client (TEXT_PROTOCOL : format d'origine du simulateur)
+        self.protocol = TEXT_PROTOCOL
+        self.insets = InsetCache()  # Dernières incrustations envoyées (format compact)
+
+    # Boucle de contrôle à cadence fixe (voir --control-rate), sur la connexion actuelle de la session
+    def start_control_loop(self, rate):
+        self.control_loop = ControlLoop(self.Rover, lambda Rover: act(self, self.sid), rate=rate,
+                                        on_frame=lambda image, data: record_frame(self, image, data),
+                                        metrics=metrics)
+        eventlet.spawn(self.control_loop.run, eventlet.sleep)
+
+    def close(self):
+        if self.control_loop is not None:
+            self.control_loop.close()
+        if self.snapshot is not None:
+            self.snapshot.close(self.Rover)
+        if self.Rover.score is not None:
+            if self.score_report != '':
+                self.Rover.score.write_report(self.score_report, self.Rover, {'session': self.number})
+            self.Rover.score.close()
+        if self.output_worker is not None:
+            self.output_worker.close()
+        if self.telemetry_recorder is not None:
+            self.telemetry_recorder.close()
+        if self.frame_recorder is not None:
+            self.frame_recorder.close()
+
+
+def open_session(sid, client=None):
+    global session_count
+    session = resume_session(sid, client)
+    if session is None:
+        session = RoverSession(session_count, config, sid, client)
+        session_count += 1
+        if config.control_rate > 0:
+            session.start_control_loop(config.control_rate)
+        print("Rover {} connecté (sid {})".format(session.number, sid))
+    sessions[sid] = session
+    metrics.gauge('sessions', len(sessions))
+    return session
+
+
+# Session gardée du même client, reprise sur la nouvelle connexion (protocole à renégocier)
+def resume_session(sid, client):
+    if client is None or client not in parked:
+        return None
+    session, closing = parked.pop(client)
+    closing.cancel()
+    session.sid = sid
+    session.protocol = TEXT_PROTOCOL
+    session.insets = InsetCache()
+    metrics.gauge('parked_sessions', len(parked))
+    print("Rover {} reconnecté (sid {})".format(session.number, sid))
+    return session
+
+
+# Identité du client : identifiant 'rover' transmis à la connexion (auth={'rover': ...}), sinon son adresse
+def client_id(environ, auth=None):
+    if isinstance(auth, dict) and auth.get('rover') is not None:
+        return str(auth['rover'])
+    return environ.get('REMOTE_ADDR')
+
+
+@sio.on('connect')
+def connect(sid, environ, auth=None):
+    open_session(sid, client_id(environ, auth))
+
+
+# Négociation du protocole : le client propose ses versions, la réponse (accusé de réception) donne
+# la version retenue. Sans cet appel, la session reste au format texte.
+@sio.on('protocol')
+def protocol(sid, offer):
+    session = sessions.get(sid)
+    if session is None:
+        session = open_session(sid)
+    session.protocol = negotiate(offer, (PROTOCOL_VERSION,) if config.compact else ())
+    metrics.gauge('compact_sessions', sum(s.protocol != TEXT_PROTOCOL for s in sessions.values()))
+    return {'version': session.protocol}
+
+
+@sio.on('disconnect')
+def disconnect(sid, *args):
+    session = sessions.pop(sid, None)
+    if session is None:
+        return
+    metrics.gauge('sessions', len(sessions))
+    if config.resume_grace > 0 and session.client is not None:
+        # Une seule session gardée par client : la précédente, jamais reprise, est fermée
+        if session.client in parked:
+            close_parked(session.client)
+        session.sid = None
+        parked[session.client] = (session, eventlet.spawn_after(config.resume_grace, close_parked, session.client))
+        metrics.gauge('parked_sessions', len(parked))
+        print("Rover {} déconnecté, reprise possible pendant {:g} s".format(session.number, config.resume_grace))
+    else:
+        session.close()
+        print("Rover {} déconnecté".format(session.number))
+
+
+def close_parked(client):
+    session, closing = parked.pop(client)
+    closing.cancel()
+    session.close()
+    metrics.gauge('parked_sessions', len(parked))
+    print("Rover {} fermé".format(session.number))
+
+
+def close_sessions():
+    while sessions:
+        sessions.popitem()[1].close()
+    while parked:
+        close_parked(next(iter(parked)))
+
+
+# Créez les images de sortie puis envoyez les commandes du rover de la session `sid`
+def act(session, sid):
+    # Session gardée après une déconnexion (boucle de contrôle) : plus de connexion où répondre
+    if sid is None:
+        return
+    Rover = session.Rover
+    # Au format compact, les images sont envoyées en octets JPEG bruts plutôt qu'en base64
+    encode = encode_jpeg if session.protocol != TEXT_PROTOCOL else encode_image
+    # Créez des images de sortie à envoyer au serveur
+    # (en arrière-plan si demandé, pour ne pas retarder l'envoi des commandes)
+    with metrics.time('output_images'):
+        if session.output_worker is not None:
+            out_image_string1, out_image_string2 = session.output_worker.update(Rover, encode)
+        else:
+            out_image_string1, out_image_string2 = create_output_images(Rover, encode)
+
+    # L'étape d'action ! Envoyez des commandes au rover !
+
+    # Ne pas envoyer les deux, elles déclenchent toutes deux le simulateur
+    # pour renvoyer de nouvelles données de télémétrie, nous devons donc en envoyer une seule
+    # en réponse aux données de télémétrie actuelles.
+
+    # Si vous êtes dans un état où vous voulez collecter un rocher, envoyez la commande de collecte
+    if Rover.send_pickup and not Rover.picking_up:
+        send_pickup(sid)
+        # Réinitialisez les indicateurs de Rover
+        Rover.send_pickup = False
+    else:
+        # Envoyez des commandes au rover !
+        commands = (Rover.throttle, Rover.brake, Rover.steer)
+        send_control(commands, out_image_string1, out_image_string2, sid, session)
+    if Rover.score is not None:
+        with metrics.time('score'):
+            Rover.score.update(Rover)
+    if session.snapshot is not None:
+        with metrics.time('snapshot'):
+            session.snapshot.update(Rover)
+    if session.control_loop is not None:
+        metrics.frame_done()
+
+
+# Si vous souhaitez enregistrer des images de la caméra lors de la conduite autonome, spécifiez un chemin
+# Exemple : $ python drive_rover.py image_folder_path
+# Condition pour enregistrer une image si un dossier a été spécifié
+# (l'écriture se fait en arrière-plan, les trames sont abandonnées si le disque ne suit pas)
+def record_frame(session, image, data):
+    if session.frame_recorder is not None:
+        with metrics.time('record'):
+            # Métadonnées au format texte, l'image est enregistrée à part
+            session.frame_recorder.record(image, text_telemetry(data, image=False) if is_compact(data) else data)
+        metrics.gauge('recorder_dropped', sum(s.frame_recorder.dropped for s in sessions.values()
+                                              if s.frame_recorder is not None))
+
 
 # Définissez la fonction de télémétrie pour ce que vous voulez faire avec les données entrantes
 @sio.on('telemetry')
 def telemetry(sid, data):
-    global frame_counter, second_counter, fps
-    frame_counter += 1
-    # Faites un calcul approximatif des images par seconde (FPS)
-    if (time.time() - second_counter) > 1:
-        fps = frame_counter
-        frame_counter = 0
-        second_counter = time.time()
-
+    session = sessions.get(sid)
+    if session is None:
+        session = open_session(sid)
     if data:
-        global Rover
+        Rover = session.Rover
+        if session.telemetry_recorder is not None:
+            with metrics.time('record'):
+                # Le journal reste au format texte, relu tel quel par replay.py
+                session.telemetry_recorder.write(text_telemetry(data) if is_compact(data) else data)
+        # Boucle à cadence fixe : la trame est seulement conservée, la boucle la décode et la perçoit
+        if session.control_loop is not None:
+            session.control_loop.submit(data)
+            metrics.gauge('frames_dropped', session.control_loop.frames_dropped)
+            return
         # Initialisez/Mettez à jour Rover avec la télémétrie actuelle
-        Rover, image = update_rover(Rover, data)
+        with metrics.time('decode'):
+            Rover, image = update_rover(Rover, data)
 
         if np.isfinite(Rover.vel):
 
             # Exécutez les étapes de perception et de décision pour mettre à jour l'état du Rover
-            Rover = perception_step(Rover)
-            Rover = decision_step(Rover)
+            with metrics.time('perception'):
+                Rover = perception_step(Rover)
+            metrics.observe('perception_' + Rover.perception_mode_used, Rover.perception_cost)
+            with metrics.time('decision'):
+                Rover = decision_step(Rover)
+            session.Rover = Rover
+            act(session, sid)
+
+        # En cas de télémétrie non valide, envoyez des commandes nulles
+        else:
+            metrics.count('invalid_frames')
 
-            # Créez des images de sortie à envoyer au serveur
-            out_image_string1, out_image_string2 = create_output_images(Rover)
+            # Envoyez des zéros pour l'accélération, le frein et la direction et des images vides
+            send_control((0, 0, 0), '', '', sid, session)
+        session.Rover = Rover
+        record_frame(session, image, data)
 
-            # L'étape d'action ! Envoyez des commandes au rover !
+    else:
+        metrics.count('empty_frames')
+        sio.emit('manual', data={}, room=sid)
+    metrics.frame_done()
 
-            # Ne pas envoyer les deux, elles déclenchent toutes deux le simulateur
-            # pour renvoyer de nouvelles données de télémétrie, nous devons donc en envoyer une seule
-            # en réponse aux données de télémétrie actuelles.
 
-            # Si vous êtes dans un état où vous voulez collecter un rocher, envoyez la commande de collecte
-            if Rover.send_pickup and not Rover.picking_up:
-                send_pickup()
-                # Réinitialisez les indicateurs de Rover
-                Rover.send_pickup = False
-            else:
-                # Envoyez des commandes au rover !
-                commands = (Rover.throttle, Rover.brake, Rover.steer)
-                send_control(commands, out_image_string1, out_image_string2)
+# Mesures au format JSON : http://localhost:4567/metrics
+@app.route('/metrics')
+def metrics_endpoint():
+    return jsonify(metrics.summary())
 
-        # En cas de télémétrie non valide, envoyez des commandes nulles
-        else:
 
-            # Envoyez des zéros pour l'accélération, le frein et la direction et des images vides
-            send_control((0, 0, 0), '', '')
+# Profil cProfile des N prochaines trames : http://localhost:4567/metrics/profile?frames=N
+@app.route('/metrics/profile')
+def profile_endpoint():
+    frames = request.args.get('frames', default=200, type=int)
+    started = metrics.start_profile(frames)
+    return jsonify({'started': started, 'frames': frames, 'path': metrics.profile_path})
 
-        # Si vous souhaitez enregistrer des images de la caméra lors de la conduite autonome, spécifiez un chemin
-        # Exemple : $ python drive_rover.py image_folder_path
-        # Condition pour enregistrer une image si un dossier a été spécifié
-        if args.image_folder != '':
-            timestamp = datetime.utcnow().strftime('%Y_%m_%d_%H_%M_%S_%f')[:-3]
-            image_filename = os.path.join(args.image_folder, timestamp)
-            image.save('{}.jpg'.format(image_filename))
 
-    else:
-        sio.emit('manual', data={}, skip_sid=True)
+# Score courant de chaque rover (sans la série temporelle) : http://localhost:4567/score
+@app.route('/score')
+def score_endpoint():
+    reports = {}
+    for session in sessions.values():
+        if session.Rover.score is not None:
+            report = session.Rover.score.report(session.Rover)
+            del report['series']
+            reports[session.number] = report
+    return jsonify(reports)
+
+
+# Rechargement immédiat de la table de couleurs de tous les rovers : http://localhost:4567/color-lut/reload
+@app.route('/color-lut/reload')
+def color_lut_endpoint():
+    segmenters = [s.Rover.segmenter for s in sessions.values() if isinstance(s.Rover.segmenter, LutSegmenter)]
+    reloaded = sum(segmenter.reload(force=True) for segmenter in segmenters)
+    return jsonify({'path': config.color_lut, 'sessions': len(segmenters), 'reloaded': reloaded})
+
 
-# Fonction pour envoyer les commandes de contrôle
-def send_control(commands, image_string1, image_string2):
+# Fonction pour envoyer les commandes de contrôle au simulateur `sid`
+def send_control(commands, image_string1, image_string2, sid, session=None):
     # Définissez les commandes à envoyer au rover
-    data = {
-        'throttle': commands[0].__str__(),
-        'brake': commands[1].__str__(),
-        'steering_angle': commands[2].__str__(),
-        'inset_image1': image_string1,
-        'inset_image2': image_string2,
-    }
-    # Envoyez les commandes via le serveur socketIO
-    sio.emit(
-        "data",
-        data,
-        skip_sid=True)
+    if session is not None and session.protocol != TEXT_PROTOCOL:
+        # Format compact : commandes packées, incrustations seulement si elles ont changé
+        data = pack_commands(commands, *session.insets.filter(image_string1, image_string2))
+    else:
+        data = {
+            'throttle': commands[0].__str__(),
+            'brake': commands[1].__str__(),
+            'steering_angle': commands[2].__str__(),
+            'inset_image1': image_string1,
+            'inset_image2': image_string2,
+        }
+    # Envoyez les commandes via le serveur socketIO, au seul client d'origine
+    with metrics.time('emit'):
+        sio.emit(
+            "data",
+            data,
+            room=sid)
     eventlet.sleep(0)
 
 # Définissez une fonction pour envoyer la commande de "pickup"
-def send_pickup():
+def send_pickup(sid):
     print("Ramassage en cours")
     pickup = {}
-    sio.emit(
-        "pickup",
-        pickup,
-        skip_sid=True)
+    with metrics.time('emit'):
+        sio.emit(
+            "pickup",
+            pickup,
+            room=sid)
     eventlet.sleep(0)
 
+
+# Applique les options et sert les connexions sur `port` (également point d'entrée des processus serveurs)
+def serve(args, port):
+    global config
+    config = args
+    metrics.log_interval = args.metrics_log
+    metrics.profile_path = args.profile_out
+    if args.profile > 0:
+        metrics.start_profile(args.profile)
+
+    # Arrêt par Ctrl-C ou par le processus parent (terminate) : les sessions sont fermées (instantané,
+    # rapport de score, fin des enregistrements) avant de quitter ; les processus serveurs quittant par
+    # os._exit, un gestionnaire atexit n'y serait jamais appelé
+    signal.signal(signal.SIGINT, stop_serving)
+    signal.signal(signal.SIGTERM, stop_serving)
+    try:
+        # Enveloppez l'application Flask avec le middleware socketio
+        # et déployez en tant que serveur WSGI eventlet
+        eventlet.wsgi.server(eventlet.listen(('', port)), socketio.Middleware(sio, app))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_sessions()
+
+
+# Un seul arrêt : les signaux suivants (Ctrl-C reçu en même temps que l'arrêt transmis par le parent)
+# sont ignorés pour ne pas interrompre la fermeture des sessions. Un gestionnaire vide plutôt que
+# SIG_IGN : un signal déjà reçu mais pas encore traité lèverait sinon une OSError
+def stop_serving(signum, frame):
+    signal.signal(signal.SIGINT, ignore_signal)
+    signal.signal(signal.SIGTERM, ignore_signal)
+    raise KeyboardInterrupt
+
+
+def ignore_signal(signum, frame):
+    pass
+
+
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser(description='Conduite à distance')
-    parser.add_argument(
-        'image_folder',
-        type=str,
-        nargs='?',
-        default='',
-        help="Chemin du dossier d'images. C'est l'endroit où les images de la course seront enregistrées."
-    )
-    args = parser.parse_args()
+    args = build_parser().parse_args()
 
-    # os.system('rm -rf IMG_stream/*')
     if args.image_folder != '':
         print("Création du dossier d'images à l'adresse {}".format(args.image_folder))
-        if not os.path.exists(args.image_folder):
-            os.makedirs(args.image_folder)
-        else:
-            shutil.rmtree(args.image_folder)
-            os.makedirs(args.image_folder)
         print("Enregistrement de cette course...")
     else:
         print("PAS d'enregistrement de cette course...")
 
-    # Enveloppez l'application Flask avec le middleware socketio
-    app = socketio.Middleware(sio, app)
+    if args.workers > 1:
+        # Répartition des rovers : chaque processus a son port, ses sessions et sa copie de la vérité terrain
+        ports = [args.port + i for i in range(args.workers)]
+        workers = []
+        for port in ports:
+            # Enregistrements distincts par processus
+            worker_args = argparse.Namespace(**vars(args))
+            worker_args.image_folder = suffixed_path(args.image_folder, 'port{}'.format(port))
+            worker_args.record_telemetry = suffixed_path(args.record_telemetry, 'port{}'.format(port))
+            worker_args.profile_out = suffixed_path(args.profile_out, 'port{}'.format(port))
+            worker_args.snapshot = suffixed_path(args.snapshot, 'port{}'.format(port))
+            worker_args.score_log = suffixed_path(args.score_log, 'port{}'.format(port))
+            worker_args.score_report = suffixed_path(args.score_report, 'port{}'.format(port))
+            workers.append(Process(target=serve, args=(worker_args, port)))
+        for worker in workers:
+            worker.start()
+        print("Serveurs démarrés sur les ports {}".format(', '.join(str(port) for port in ports)))
 
-    # Déployez en tant que serveur WSGI eventlet
-    eventlet.wsgi.server(eventlet.listen(('', 4567)), app)
+        # Arrêt transmis aux processus serveurs, qui ferment leurs sessions avant de quitter
+        def stop_workers(signum, frame):
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+        signal.signal(signal.SIGINT, stop_workers)
+        signal.signal(signal.SIGTERM, stop_workers)
+        for worker in workers:
+            worker.join()
+    else:
+        serve(args, args.port)
@@ -0,0 +1,198 @@
+import heapq
+
+import numpy as np
+
+# Exploration par frontières.
+# Une frontière est une cellule navigable connue voisine d'une cellule inconnue. L'ensemble des
+# frontières et une carte de coût sous-échantillonnée (blocs de `downsample` x `downsample` cellules :
+# libre, inconnu ou bloqué) sont mis à jour uniquement dans la région de la carte modifiée depuis la
+# trame précédente. Un A* sur la carte de coût choisit un chemin vers le bloc frontière le plus proche
+# et l'angle du point de passage situé à `lookahead` mètres est transmis à decision_step.
+
+FREE = 0
+UNKNOWN = 1
+BLOCKED = 2
+# Coût d'un pas vers un bloc selon son état (les blocs bloqués sont infranchissables)
+STEP_COSTS = (1.0, 4.0, np.inf)
+NEIGHBORS = [(dy, dx, np.hypot(dy, dx)) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx]
+
+
+def _block_sum(values, d):
+    height, width = values.shape
+    padded = np.zeros((-(-height // d) * d, -(-width // d) * d), dtype=np.int32)
+    padded[:height, :width] = values
+    return padded.reshape(padded.shape[0] // d, d, padded.shape[1] // d, d).sum(axis=(1, 3))
+
+
+# A* 8-connexe ; renvoie la liste des blocs (cy, cx) du départ (exclu) au but, ou None
+def astar(cost, start, goal, max_expansions=20000):
+    height, width = cost.shape
+    open_set = [(0.0, 0.0, start)]
+    came_from = {start: None}
+    g_score = {start: 0.0}
+    expansions = 0
+    while open_set:
+        _, g, node = heapq.heappop(open_set)
+        if node == goal:
+            path = []
+            while node != start:
+                path.append(node)
+                node = came_from[node]
+            return path[::-1]
+        if g > g_score[node]:
+            continue
+        expansions += 1
+        if expansions > max_expansions:
+            return None
+        y, x = node
+        for dy, dx, length in NEIGHBORS:
+            ny, nx = y + dy, x + dx
+            if not (0 <= ny < height and 0 <= nx < width):
+                continue
+            step = STEP_COSTS[cost[ny, nx]]
+            if step == np.inf:
+                continue
+            new_g = g + length * step
+            if new_g < g_score.get((ny, nx), np.inf):
+                g_score[(ny, nx)] = new_g
+                came_from[(ny, nx)] = node
+                # Heuristique octile (admissible : le coût minimal d'un pas est sa longueur)
+                ay, ax = abs(goal[0] - ny), abs(goal[1] - nx)
+                h = max(ay, ax) + (np.sqrt(2) - 1) * min(ay, ax)
+                heapq.heappush(open_set, (new_g + h, new_g, (ny, nx)))
+    return None
+
+
+class ExplorationPlanner():
+    def __init__(self, worldmap, downsample=4, replan_frames=25, lookahead=4.0, goal_radius=2.0,
+                 min_frontier=3, window=0.4, min_pixels=50, candidates=5):
+        self.worldmap = worldmap
+        self.dirty = worldmap.track()
+        self.downsample = downsample
+        self.replan_frames = replan_frames
+        self.lookahead = lookahead  # Distance (mètres) du point de passage visé
+        self.goal_radius = goal_radius  # Distance (mètres) à laquelle le but est atteint
+        self.min_frontier = min_frontier  # Nombre minimal de cellules frontières d'un bloc but
+        self.window = window  # Demi-largeur (radians) du secteur navigable autour de la cible
+        self.min_pixels = min_pixels  # Pixels navigables nécessaires dans ce secteur
+        self.candidates = candidates  # Nombre de buts essayés par planification
+
+        size = worldmap.size
+        self.free = np.zeros((size, size), dtype=bool)
+        self.obstacle = np.zeros((size, size), dtype=bool)
+        self.frontier = np.zeros((size, size), dtype=bool)
+        coarse = -(-size // downsample)
+        self.cost = np.full((coarse, coarse), UNKNOWN, dtype=np.uint8)
+        self.frontier_count = np.zeros((coarse, coarse), dtype=np.int32)
+
+        self.goal = None
+        self.path = []
+        self.unreachable = set()
+        self.frames_since_plan = 0
+        self.target = None  # Point de passage (x, y) en mètres
+        self.target_angle = None  # Angle du point de passage dans le repère du rover (radians)
+        self._refresh(0, size, 0, size)
+
+    # Recalcule frontières et coûts dans une région de la carte (bornes hautes exclues)
+    def _refresh(self, y0, y1, x0, x1):
+        d, size = self.downsample, self.worldmap.size
+        # Fenêtre alignée sur les blocs, élargie d'une cellule : les voisins des cellules modifiées changent aussi
+        ay0, ax0 = max(0, y0 - 1) // d * d, max(0, x0 - 1) // d * d
+        ay1, ax1 = min(size, -(-(y1 + 1) // d) * d), min(size, -(-(x1 + 1) // d) * d)
+        # Lecture avec une marge d'une cellule pour le test des voisins
+        ry0, rx0 = max(0, ay0 - 1), max(0, ax0 - 1)
+        ry1, rx1 = min(size, ay1 + 1), min(size, ax1 + 1)
+        region = self.worldmap.region(ry0, ry1, rx0, rx1)
+        obs, nav = region[:, :, 0], region[:, :, 2]
+        known = (obs > 0) | (nav > 0)
+        free = known & (nav >= obs)
+        # Hors de la carte : considéré comme connu (pas de frontière sur les bords du monde)
+        padded = np.pad(known, 1, constant_values=True)
+        enclosed = padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+        window = (slice(ay0 - ry0, ay1 - ry0), slice(ax0 - rx0, ax1 - rx0))
+        self.free[ay0:ay1, ax0:ax1] = free[window]
+        self.obstacle[ay0:ay1, ax0:ax1] = (known & ~free)[window]
+        self.frontier[ay0:ay1, ax0:ax1] = (free & ~enclosed)[window]
+
+        blocks = (slice(ay0 // d, -(-ay1 // d)), slice(ax0 // d, -(-ax1 // d)))
+        n_free = _block_sum(self.free[ay0:ay1, ax0:ax1], d)
+        n_obstacle = _block_sum(self.obstacle[ay0:ay1, ax0:ax1], d)
+        self.cost[blocks] = np.where(n_free + n_obstacle == 0, UNKNOWN, np.where(n_obstacle > n_free, BLOCKED, FREE))
+        self.frontier_count[blocks] = _block_sum(self.frontier[ay0:ay1, ax0:ax1], d)
+
+    def _block(self, x, y):
+        scale = self.worldmap.cell_size * self.downsample
+        limit = self.cost.shape[0] - 1
+        return min(max(int(y / scale), 0), limit), min(max(int(x / scale), 0), limit)
+
+    def _center(self, block):
+        scale = self.worldmap.cell_size * self.downsample
+        return (block[1] + 0.5) * scale, (block[0] + 0.5) * scale
+
+    def _plan(self, start):
+        self.goal, self.path = None, []
+        candidates = np.argwhere(self.frontier_count >= self.min_frontier)
+        if len(candidates) == 0:
+            return
+        dists = np.hypot(candidates[:, 0] - start[0], candidates[:, 1] - start[1])
+        tried = 0
+        for idx in np.argsort(dists, kind='stable'):
+            goal = tuple(int(v) for v in candidates[idx])
+            if goal == start or goal in self.unreachable:
+                continue
+            path = astar(self.cost, start, goal)
+            if path is not None:
+                self.goal, self.path = goal, path
+                return
+            self.unreachable.add(goal)
+            tried += 1
+            if tried >= self.candidates:
+                return
+
+    def update(self, Rover):
+        bbox = self.dirty.take()
+        if bbox is not None:
+            self._refresh(*bbox)
+        x, y = Rover.pos[0], Rover.pos[1]
+        start = self._block(x, y)
+        self.frames_since_plan += 1
+
+        # Nouveau but si le précédent est atteint, n'est plus une frontière, ou périodiquement
+        if self.goal is not None:
+            gx, gy = self._center(self.goal)
+            if np.hypot(gx - x, gy - y) <= self.goal_radius or self.frontier_count[self.goal] < self.min_frontier:
+                self.goal = None
+        if self.goal is None or self.frames_since_plan >= self.replan_frames:
+            self._plan(start)
+            self.frames_since_plan = 0
+
+        # Point de passage : premier bloc du chemin à au moins `lookahead` mètres
+        self.target = None
+        for block in self.path:
+            self.target = self._center(block)
+            if np.hypot(self.target[0] - x, self.target[1] - y) >= self.lookahead:
+                break
+        if self.target is None:
+            self.target_angle = None
+        else:
+            angle = np.arctan2(self.target[1] - y, self.target[0] - x) - Rover.yaw * np.pi / 180
+            self.target_angle = (angle + np.pi) % (2 * np.pi) - np.pi
+        return self.target_angle
+
+    # Angle de direction (radians) vers la cible, limité au terrain navigable vu par la caméra :
+    # moyenne des angles navigables proches de la cible, ou bord du secteur navigable du côté de la cible
+    # si elle est derrière le rover. None si aucune cible ou pas assez de terrain dans sa direction.
+    # `pixel_area` : pixels de la vue complète représentés par chaque angle (perception sous-échantillonnée)
+    def steering_angle(self, nav_angles, pixel_area=1):
+        if self.target_angle is None or len(nav_angles) == 0:
+            return None
+        near = nav_angles[np.abs(nav_angles - self.target_angle) < self.window]
+        if len(near) * pixel_area >= self.min_pixels:
+            return float(np.mean(near))
+        if abs(self.target_angle) > np.pi / 2:
+            return float(nav_angles.max() if self.target_angle > 0 else nav_angles.min())
+        return None
+
+    @property
+    def frontier_cells(self):
+        return int(np.count_nonzero(self.frontier))
@@ -0,0 +1,266 @@
+import argparse
+import base64
+import queue
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from perception import get_perception_kernel, SCALE
+from pose_fusion import CameraModel
+from compact_protocol import (PROTOCOL_VERSION, TEXT_PROTOCOL, pack_telemetry, unpack_commands,
+                              payload_size)
+
+# Simulateur factice : remplace le simulateur Unity pour exercer la chaîne complète hors ligne.
+# La caméra est rendue à partir de la carte de vérité terrain en inversant la transformation de
+# perspective de perception.py, et le rover suit un modèle cinématique simple piloté par les commandes.
+# run_client le connecte à drive_rover.py comme le ferait le simulateur :
+#   $ python drive_rover.py --compact
+#   $ python fake_sim.py --frames 1000
+
+# Couleurs utilisées pour le rendu (compatibles avec les seuils de perception par défaut)
+NAVIGABLE_COLOR = (190, 180, 170)
+OBSTACLE_COLOR = (70, 60, 50)
+ROCK_COLOR = (200, 170, 30)
+SKY_COLOR = (120, 140, 180)
+
+
+# Carte synthétique : des disques navigables creusés le long d'une marche aléatoire
+def synthetic_ground_truth(size=200, seed=0, steps=400, radius=(3, 8)):
+    rng = np.random.default_rng(seed)
+    ground_truth = np.zeros((size, size), dtype=np.uint8)
+    x, y = size / 2, size / 2
+    heading = 0.0
+    for _ in range(steps):
+        heading += rng.normal(0, 0.5)
+        x = np.clip(x + 3 * np.cos(heading), 15, size - 15)
+        y = np.clip(y + 3 * np.sin(heading), 15, size - 15)
+        cv2.circle(ground_truth, (int(x), int(y)), int(rng.integers(*radius)), 255, -1)
+    return ground_truth
+
+
+class FakeSimulator():
+    def __init__(self, ground_truth=None, start=None, yaw=0.0, samples=None, n_samples=6,
+                 dt=1 / 25, seed=0, img_shape=(160, 320), tilt_noise=0.0, render_tilt=False):
+        if ground_truth is None:
+            ground_truth = synthetic_ground_truth(seed=seed)
+        if ground_truth.ndim == 3:
+            ground_truth = ground_truth[:, :, 1]
+        self.ground_truth = ground_truth > 0
+        self.rng = np.random.default_rng(seed)
+        self.kernel = get_perception_kernel(img_shape)
+        self.dt = dt
+        self.tilt_noise = tilt_noise
+        # Rendu de l'inclinaison : la caméra tourne avec le rover (même modèle que pose_fusion.py)
+        self.camera = CameraModel(self.kernel) if render_tilt else None
+
+        nav_y, nav_x = self.ground_truth.nonzero()
+        if start is None:
+            center = np.array(self.ground_truth.shape[::-1]) / 2
+            idx = np.argmin((nav_x - center[0]) ** 2 + (nav_y - center[1]) ** 2)
+            start = (nav_x[idx] + 0.5, nav_y[idx] + 0.5)
+        if samples is None:
+            idx = self.rng.choice(len(nav_x), size=n_samples, replace=False)
+            samples = np.stack([nav_x[idx] + 0.5, nav_y[idx] + 0.5], axis=1)
+        self.samples = np.asarray(samples, dtype=float).reshape(-1, 2)
+        self.initial_samples = self.samples.copy()
+
+        self.t = 0.0
+        self.pos = np.array(start, dtype=float)
+        self.yaw = float(yaw) % 360
+        self.pitch = 0.0
+        self.roll = 0.0
+        self.vel = 0.0
+        self.throttle = 0.0
+        self.brake = 0.0
+        self.steer = 0.0
+        self.picking_up = 0
+        self._pickup_frames = 0
+
+    def is_navigable(self, x, y):
+        ix, iy = int(x), int(y)
+        if 0 <= iy < self.ground_truth.shape[0] and 0 <= ix < self.ground_truth.shape[1]:
+            return bool(self.ground_truth[iy, ix])
+        return False
+
+    def near_sample(self):
+        if len(self.samples) == 0:
+            return 0
+        return int(np.min(np.hypot(*(self.samples - self.pos).T)) < 1.0)
+
+    # Rendu de la caméra : vue de dessus construite depuis la carte, puis transformation inverse
+    def render(self):
+        kernel = self.kernel
+        yaw_rad = self.yaw * np.pi / 180
+        cos_yaw, sin_yaw = np.cos(yaw_rad), np.sin(yaw_rad)
+        x_world = (kernel.x_pixel * cos_yaw - kernel.y_pixel * sin_yaw) / SCALE + self.pos[0]
+        y_world = (kernel.x_pixel * sin_yaw + kernel.y_pixel * cos_yaw) / SCALE + self.pos[1]
+        ix = np.int_(x_world)
+        iy = np.int_(y_world)
+        inside = (ix >= 0) & (iy >= 0) & (ix < self.ground_truth.shape[1]) & (iy < self.ground_truth.shape[0])
+        navigable = np.zeros(ix.shape, dtype=bool)
+        navigable[inside] = self.ground_truth[iy[inside], ix[inside]]
+
+        top_view = np.empty(ix.shape + (3,), dtype=np.uint8)
+        top_view[:] = OBSTACLE_COLOR
+        top_view[navigable] = NAVIGABLE_COLOR
+        for sample_x, sample_y in self.samples:
+            rock = (x_world - sample_x) ** 2 + (y_world - sample_y) ** 2 < 0.3 ** 2
+            top_view[rock] = ROCK_COLOR
+
+        img = cv2.warpPerspective(top_view, kernel.M, kernel.img_size,
+                                  flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP,
+                                  borderMode=cv2.BORDER_CONSTANT, borderValue=SKY_COLOR)
+        if self.camera is not None and (self.pitch or self.roll):
+            img = cv2.warpPerspective(img, self.camera.tilt_homography(self.pitch, self.roll), kernel.img_size,
+                                      flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=SKY_COLOR)
+        return img
+
+    def encode_jpeg(self, img):
+        buff = BytesIO()
+        Image.fromarray(img).save(buff, format="JPEG")
+        return buff.getvalue()
+
+    def encode_image(self, img):
+        return base64.b64encode(self.encode_jpeg(img)).decode("utf-8")
+
+    # Dictionnaire de télémétrie au format du simulateur (toutes les valeurs sont des chaînes),
+    # ou au format compact (voir compact_protocol.py)
+    def telemetry(self, compact=False):
+        if self.tilt_noise > 0:
+            self.pitch = self.rng.normal(0, self.tilt_noise) % 360
+            self.roll = self.rng.normal(0, self.tilt_noise) % 360
+        if compact:
+            return pack_telemetry(self.vel, self.pos, self.yaw, self.pitch, self.roll, self.throttle, self.steer,
+                                  self.near_sample(), self.picking_up, len(self.samples),
+                                  self.initial_samples[:, 0], self.initial_samples[:, 1],
+                                  self.encode_jpeg(self.render()))
+        return {
+            'speed': str(self.vel),
+            'position': '{};{}'.format(self.pos[0], self.pos[1]),
+            'yaw': str(self.yaw),
+            'pitch': str(self.pitch),
+            'roll': str(self.roll),
+            'throttle': str(self.throttle),
+            'steering_angle': str(self.steer),
+            'near_sample': str(self.near_sample()),
+            'picking_up': str(self.picking_up),
+            'sample_count': str(len(self.samples)),
+            'samples_x': ';'.join(str(x) for x in self.initial_samples[:, 0]),
+            'samples_y': ';'.join(str(y) for y in self.initial_samples[:, 1]),
+            'image': self.encode_image(self.render()),
+        }
+
+    # Avance la simulation d'un pas avec les commandes (accélération, frein, direction en degrés)
+    def step(self, commands=None, dt=None):
+        dt = self.dt if dt is None else dt
+        if commands is not None:
+            self.throttle, self.brake, self.steer = (float(c) for c in commands)
+        self.t += dt
+
+        if self._pickup_frames > 0:
+            self._pickup_frames -= 1
+            if self._pickup_frames == 0:
+                dists = np.hypot(*(self.samples - self.pos).T)
+                self.samples = np.delete(self.samples, np.argmin(dists), axis=0)
+                self.picking_up = 0
+            return
+
+        self.vel += (4.0 * self.throttle - 0.5 * self.vel) * dt
+        if self.brake > 0:
+            self.vel -= np.sign(self.vel) * min(abs(self.vel), self.brake * dt)
+        if abs(self.vel) < 0.2 and self.brake == 0:
+            # Comme dans le simulateur, braquer à l'arrêt fait pivoter le rover sur place
+            self.yaw = (self.yaw + 2.0 * self.steer * dt) % 360
+        else:
+            self.yaw = (self.yaw + np.degrees(self.vel * np.tan(np.radians(self.steer)) / 2.0 * dt)) % 360
+
+        yaw_rad = np.radians(self.yaw)
+        new_pos = self.pos + self.vel * dt * np.array([np.cos(yaw_rad), np.sin(yaw_rad)])
+        if self.is_navigable(*new_pos):
+            self.pos = new_pos
+        else:
+            # Collision : le rover reste bloqué contre l'obstacle
+            self.vel = 0.0
+
+    def pickup(self):
+        if self.near_sample() and not self.picking_up:
+            self.picking_up = 1
+            self.vel = 0.0
+            self._pickup_frames = int(round(2.0 / self.dt))
+
+
+# Client socketio de remplacement du simulateur : envoie la télémétrie de `sim`, attend la réponse du
+# serveur (commandes ou ramassage), l'applique et avance la simulation d'un pas. Le protocole compact
+# est proposé si `compact` est vrai ; sans réponse du serveur, le client reste au format texte.
+# Renvoie le volume échangé et le temps d'aller-retour par trame.
+def run_client(sim, url='http://localhost:4567', frames=500, compact=True, timeout=1.0):
+    # Le client socketio et ses transports ne sont nécessaires que pour ce mode
+    import socketio
+    client = socketio.Client()
+    replies = queue.Queue()
+    client.on('data', lambda data: replies.put(('data', data)))
+    client.on('pickup', lambda data: replies.put(('pickup', data)))
+    client.connect(url)
+    protocol = TEXT_PROTOCOL
+    if compact:
+        try:
+            protocol = client.call('protocol', {'versions': [PROTOCOL_VERSION]}, timeout=timeout)['version']
+        except socketio.exceptions.TimeoutError:
+            pass
+    stats = {'protocol': protocol, 'frames': 0, 'timeouts': 0, 'sent_bytes': 0, 'received_bytes': 0,
+             'insets_received': 0, 'round_trip_s': 0.0}
+    insets = [None, None]
+    try:
+        for _ in range(frames):
+            data = sim.telemetry(compact=protocol != TEXT_PROTOCOL)
+            stats['sent_bytes'] += payload_size(data)
+            start = time.perf_counter()
+            client.emit('telemetry', data)
+            try:
+                event, reply = replies.get(timeout=timeout)
+            except queue.Empty:
+                stats['timeouts'] += 1
+                sim.step()
+                continue
+            stats['round_trip_s'] += time.perf_counter() - start
+            stats['received_bytes'] += payload_size(reply)
+            stats['frames'] += 1
+            if event == 'pickup':
+                sim.pickup()
+                sim.step()
+                continue
+            commands, inset1, inset2 = unpack_commands(reply)
+            # Une incrustation absente garde la précédente
+            for i, inset in enumerate((inset1, inset2)):
+                if inset is not None:
+                    insets[i] = inset
+                    stats['insets_received'] += 1
+            sim.step(commands)
+    finally:
+        client.disconnect()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulateur factice connecté à drive_rover.py')
+    parser.add_argument('--url', default='http://localhost:4567', help='Adresse du serveur drive_rover.py')
+    parser.add_argument('--frames', type=int, default=500, help='Nombre de trames envoyées')
+    parser.add_argument('--seed', type=int, default=0, help='Graine de la carte synthétique')
+    parser.add_argument('--text', action='store_true', help='Ne pas proposer le protocole compact')
+    args = parser.parse_args()
+
+    stats = run_client(FakeSimulator(seed=args.seed), args.url, args.frames, compact=not args.text)
+    frames = max(stats['frames'], 1)
+    print('protocole : {}  trames : {}  sans réponse : {}'.format(
+        'compact v{}'.format(stats['protocol']) if stats['protocol'] != TEXT_PROTOCOL else 'texte',
+        stats['frames'], stats['timeouts']))
+    print('octets par trame : {:.0f} envoyés, {:.0f} reçus ; incrustations reçues : {}'.format(
+        stats['sent_bytes'] / frames, stats['received_bytes'] / frames, stats['insets_received']))
+    print('aller-retour moyen : {:.2f} ms'.format(stats['round_trip_s'] / frames * 1e3))
+
+
+if __name__ == '__main__':
+    main()
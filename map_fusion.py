@@ -0,0 +1,96 @@
+import numpy as np
+
+from worldmap import TiledWorldMap, make_worldmap
+
+# Fusion des détections d'une trame dans la carte du monde.
+# Toutes les détections d'un canal sont agrégées par un seul np.bincount sur les indices de cellules
+# aplatis, puis ajoutées en une écriture par canal : une cellule vue par 40 pixels reçoit 40 fois
+# l'évidence, alors que `worldmap[y, x, 0] += 1` ne la comptait qu'une fois.
+# Par défaut chaque détection vaut 1 (la carte reste une carte de compteurs). Sur demande, l'évidence
+# peut être pondérée par une confiance décroissant avec la distance au rover (les pixels lointains de
+# l'image redressée sont les plus déformés), et une grille d'occupation en log-odds (obstacle positif,
+# navigable négatif, bornée) peut être tenue à jour en parallèle des compteurs.
+
+LOG_ODDS_OCCUPIED = 0.85
+LOG_ODDS_FREE = -0.4
+LOG_ODDS_LIMITS = (-10.0, 10.0)
+
+
+# Pondérations de l'évidence : aucune (compteurs) ou confiance selon la distance
+WEIGHTINGS = ('none', 'distance')
+
+
+# Confiance dans [floor, 1] : 1 au pied du rover, `floor` à la distance `limit` (pixels redressés)
+def distance_confidence(dist, limit=80, floor=0.1):
+    return np.clip(1.0 - np.asarray(dist, dtype=float) / limit, floor, 1.0)
+
+
+class MapFusion():
+    def __init__(self, weighting='none', limit=80, floor=0.1, log_odds=False,
+                 l_occupied=LOG_ODDS_OCCUPIED, l_free=LOG_ODDS_FREE, limits=LOG_ODDS_LIMITS):
+        if weighting not in WEIGHTINGS:
+            raise ValueError("Pondération inconnue : {}".format(weighting))
+        self.weighting = weighting
+        self.limit = limit
+        self.floor = floor
+        self.log_odds = log_odds
+        self.l_occupied = l_occupied
+        self.l_free = l_free
+        self.limits = limits
+        self.occupancy = None  # Grille log-odds (un canal), créée à la première trame
+
+    # Poids des détections (None : chaque détection vaut 1). `area` : pixels de la vue complète représentés
+    # par chaque détection (mode sous-échantillonné). Pour les cartes à compteurs entiers, où des poids
+    # fractionnaires seraient arrondis, seule la surface (entière) est appliquée.
+    def weights(self, worldmap, dist, scale=None, area=1):
+        if worldmap.max_value is not None:
+            return None if area == 1 else area
+        if self.weighting == 'none' or dist is None:
+            weights = None
+        else:
+            weights = distance_confidence(dist, self.limit, self.floor)
+        if scale is not None:
+            weights = scale if weights is None else weights * scale
+        if area != 1:
+            weights = area if weights is None else weights * area
+        return weights
+
+    # Poids scalaire étendu à toutes les détections (np.bincount attend un poids par détection)
+    def _per_detection(self, weights, count):
+        if weights is not None and np.ndim(weights) == 0:
+            return np.full(count, float(weights))
+        return weights
+
+    def _occupancy(self, worldmap):
+        if self.occupancy is None:
+            tiled = isinstance(worldmap, TiledWorldMap)
+            self.occupancy = make_worldmap(worldmap.size, worldmap.cell_size, np.float32, tiled=tiled,
+                                           tile_size=getattr(worldmap, 'tile_size', 32), channels=1)
+        return self.occupancy
+
+    # obstacle, navigable : (iy, ix, dist), dist en pixels redressés (None : sans pondération) ;
+    # rock : (iy, ix) ; `scales` : facteurs de poids supplémentaires facultatifs par classe ;
+    # `area` : surface représentée par chaque détection (voir weights)
+    def fuse(self, worldmap, obstacle, rock, navigable, scales=None, area=1):
+        scales = scales or {}
+        obs_y, obs_x, obs_dist = obstacle
+        nav_y, nav_x, nav_dist = navigable
+        obs_w = self._per_detection(self.weights(worldmap, obs_dist, scales.get('obstacle'), area), len(obs_y))
+        nav_w = self._per_detection(self.weights(worldmap, nav_dist, scales.get('navigable'), area), len(nav_y))
+        worldmap.scatter_add(0, obs_y, obs_x, obs_w)
+        worldmap.assign(1, rock[0], rock[1], 255)
+        worldmap.scatter_add(2, nav_y, nav_x, nav_w)
+
+        if self.log_odds:
+            occupancy = self._occupancy(worldmap)
+            # Une seule accumulation pour les deux classes : +l_occupied par obstacle, l_free par pixel navigable
+            obs_l = self.l_occupied * (1.0 if obs_w is None else obs_w) * np.ones(len(obs_y))
+            nav_l = self.l_free * (1.0 if nav_w is None else nav_w) * np.ones(len(nav_y))
+            occupancy.scatter_add(0, np.concatenate((obs_y, nav_y)), np.concatenate((obs_x, nav_x)),
+                                  np.concatenate((obs_l, nav_l)), limits=self.limits)
+
+    # Probabilité d'occupation (0.5 là où rien n'a été observé)
+    def probability(self):
+        if self.occupancy is None:
+            return None
+        return 1.0 / (1.0 + np.exp(-self.occupancy.channel(0)))
@@ -0,0 +1,200 @@
+import cv2
+import numpy as np
+
+from scoring import MapScorer
+from worldmap import split_bbox
+
+# Rendu incrémental de la carte du monde pour l'image d'affichage.
+# Seule la région de la carte modifiée par perception_step (boîte englobante des cellules touchées)
+# est recalculée ; les pixels cartographiés et la fidélité sont tenus à jour sur les mêmes régions
+# (voir scoring.py). La vérité terrain est lue région par région (worldmap.GroundTruthGrid) et la copie
+# locale des canaux obstacles / navigable est une carte de même implémentation que la carte du monde :
+# avec une carte par tuiles, seules les tuiles observées sont allouées.
+# La carte superposée est tenue en uint8, déjà retournée pour l'affichage (axe y vers le haut), et réduite
+# au fil des rendus de région vers une image affichée de taille fixe : une trame de sortie ne copie,
+# n'annote et n'encode que cette petite image.
+
+# Côté des blocs du premier relevé d'une carte dense (une carte par tuiles est relevée par tuiles)
+SNAPSHOT_BLOCK = 64
+# Côté des blocs d'un rendu complet
+RENDER_BLOCK = 256
+
+
+class MapRenderer():
+    # `grid` : vérité terrain sur la grille de la carte (worldmap.GroundTruthGrid)
+    # `display_size` : côté minimal de l'image affichée ; une carte plus grande est réduite d'un facteur
+    # entier (un pixel par bloc de `factor` x `factor` cellules)
+    def __init__(self, grid, rescale_tolerance=0.02, rock_size=2, display_size=200):
+        self.grid = grid
+        self.scorer = MapScorer(grid)
+        # Tolérance relative sur l'échelle de normalisation avant un nouveau rendu complet
+        self.rescale_tolerance = rescale_tolerance
+        self.rock_size = rock_size
+        # Taille des cellules de la carte en mètres
+        self.cell_size = grid.cell_size
+        self.factor = max(1, grid.size // display_size)
+        # Côté de la carte superposée, complétée (en haut et à droite) jusqu'à un multiple du facteur
+        self.padded = -(-grid.size // self.factor) * self.factor
+        self.reset()
+
+    def reset(self):
+        self.map_add = None
+        self.display = None
+        self.seen = None
+        self.full_snapshot = True
+        self.observed = None  # Boîte englobante des cellules observées (obstacle ou navigable)
+        self.nav_scale = None
+        self.obs_scale = None
+        # Sommes et nombres de cellules non nulles (obstacles, navigable) pour les moyennes de normalisation
+        self.obs_sum = 0.0
+        self.obs_count = 0
+        self.nav_sum = 0.0
+        self.nav_count = 0
+        # Compteurs de pixels navigables cartographiés
+        self.scorer.reset()
+        self.located = None
+
+    @property
+    def samples_located(self):
+        return 0 if self.located is None else int(np.count_nonzero(self.located))
+
+    def perc_mapped(self):
+        return self.scorer.perc_mapped()
+
+    def fidelity(self):
+        return self.scorer.fidelity()
+
+    # Échelle de normalisation d'un canal : 255 / moyenne des cellules non nulles
+    def _scale(self, total, count):
+        return 255 / (total / count) if count > 0 else 1.0
+
+    def _update_counters(self, bbox, patch):
+        old = self.seen.region(*bbox)
+        old_obs = old[:, :, 0]
+        old_nav = old[:, :, 1]
+        new_obs = patch[:, :, 0]
+        new_nav = patch[:, :, 2]
+        self.obs_sum += new_obs[new_obs > 0].sum() - old_obs[old_obs > 0].sum()
+        self.obs_count += int(np.count_nonzero(new_obs)) - int(np.count_nonzero(old_obs))
+        self.nav_sum += new_nav[new_nav > 0].sum() - old_nav[old_nav > 0].sum()
+        self.nav_count += int(np.count_nonzero(new_nav > 0)) - int(np.count_nonzero(old_nav > 0))
+        self.scorer.apply(bbox, new_nav)
+        self.seen.set_region(bbox[0], bbox[2], np.dstack((new_obs, new_nav)))
+        if new_obs.any() or new_nav.any():
+            observed = self.observed or bbox
+            self.observed = (min(observed[0], bbox[0]), max(observed[1], bbox[1]),
+                             min(observed[2], bbox[2]), max(observed[3], bbox[3]))
+
+    # Le rendu se fait à partir de la copie locale des canaux obstacles/navigable (self.seen),
+    # ce qui permet de l'exécuter hors du fil de contrôle
+    def _render(self, bbox):
+        y0, y1, x0, x1 = bbox
+        seen = self.seen.region(*bbox)
+        navigable = seen[:, :, 1] * self.nav_scale
+        obstacle = seen[:, :, 0] * self.obs_scale
+        obstacle[navigable >= obstacle] = 0
+        rgb = np.array(self.grid.half(*bbox), dtype=float)
+        rgb[:, :, 0] += obstacle.clip(0, 255)
+        rgb[:, :, 2] += navigable.clip(0, 255)
+        # La ligne y de la carte est la ligne padded - 1 - y de l'image retournée
+        top, bottom = self.padded - y1, self.padded - y0
+        self.map_add[top:bottom, x0:x1] = rgb[::-1]
+        self._reduce(top, bottom, x0, x1)
+
+    # Réduit une région de l'image retournée dans l'image affichée (blocs entiers de factor x factor)
+    def _reduce(self, r0, r1, c0, c1):
+        f = self.factor
+        if f == 1:
+            return
+        r0, r1, c0, c1 = r0 // f * f, -(-r1 // f) * f, c0 // f * f, -(-c1 // f) * f
+        self.display[r0 // f:r1 // f, c0 // f:c1 // f] = cv2.resize(
+            self.map_add[r0:r1, c0:c1], ((c1 - c0) // f, (r1 - r0) // f), interpolation=cv2.INTER_AREA)
+
+    # Rendu complet. Seules les cellules observées dépendent des échelles de normalisation : hors du
+    # premier rendu, le reste de la carte garde le fond de vérité terrain déjà rendu.
+    def _render_all(self, background=False):
+        bbox = (0, self.grid.size, 0, self.grid.size) if background else self.observed
+        if bbox is not None:
+            for block in split_bbox(bbox, RENDER_BLOCK):
+                self._render(block)
+
+    def _locate_samples(self, bbox, patch, samples_pos):
+        if samples_pos is None:
+            return
+        if self.located is None:
+            self.located = np.zeros(len(samples_pos[0]), dtype=bool)
+        rock_y, rock_x = patch[:, :, 1].nonzero()
+        if len(rock_y) == 0:
+            return
+        rock_y = (rock_y + bbox[0]) * self.cell_size
+        rock_x = (rock_x + bbox[2]) * self.cell_size
+        for idx in np.flatnonzero(~self.located):
+            # Si des rochers ont été détectés à moins de 3 mètres des positions d'échantillons connues
+            # considérez-le comme un succès
+            dists = np.sqrt((samples_pos[0][idx] - rock_x) ** 2 + (samples_pos[1][idx] - rock_y) ** 2)
+            if np.min(dists) < 3:
+                self.located[idx] = True
+
+    # Copie des régions modifiées de la carte : liste de (boîte, données) à transmettre à apply().
+    # Le premier relevé porte sur la carte entière, par blocs, en omettant les blocs vides.
+    def snapshot(self, worldmap, dirty_bbox):
+        if self.seen is None:
+            self.seen = self.grid.new_map(worldmap.dtype, 2)
+        if self.full_snapshot:
+            self.full_snapshot = False
+            regions = []
+            for bbox in split_bbox((0, worldmap.size, 0, worldmap.size),
+                                   getattr(worldmap, 'tile_size', SNAPSHOT_BLOCK)):
+                patch = worldmap.region(*bbox)
+                if patch.any():
+                    regions.append((bbox, np.array(patch)))
+            return regions
+        if dirty_bbox is None:
+            return []
+        return [(tuple(dirty_bbox), np.array(worldmap.region(*dirty_bbox)))]
+
+    # Met à jour la carte superposée avec des régions copiées de la carte du monde (snapshot)
+    # et renvoie une copie de l'image affichée, échantillons localisés compris. `located` : échantillons
+    # déjà localisés par un index des rochers (RockIndex) ; sans lui, ils sont cherchés dans le canal
+    # rochers des régions.
+    def apply(self, regions, samples_pos=None, located=None):
+        if self.map_add is None:
+            self.map_add = np.zeros((self.padded, self.padded, 3), dtype=np.uint8)
+            size = self.padded // self.factor
+            self.display = self.map_add if self.factor == 1 else np.zeros((size, size, 3), dtype=np.uint8)
+        for bbox, patch in regions:
+            self._update_counters(bbox, patch)
+            if located is None:
+                self._locate_samples(bbox, patch, samples_pos)
+        if located is not None:
+            self.located = located
+
+        # Si la normalisation a trop changé depuis le dernier rendu complet, on redessine toute la carte
+        nav_scale = self._scale(self.nav_sum, self.nav_count)
+        obs_scale = self._scale(self.obs_sum, self.obs_count)
+        if self.nav_scale is None or \
+                abs(nav_scale - self.nav_scale) > self.rescale_tolerance * self.nav_scale or \
+                abs(obs_scale - self.obs_scale) > self.rescale_tolerance * self.obs_scale:
+            background = self.nav_scale is None
+            self.nav_scale = nav_scale
+            self.obs_scale = obs_scale
+            self._render_all(background)
+        else:
+            for bbox, _ in regions:
+                self._render(bbox)
+
+        # Tracez l'emplacement des échantillons localisés sur l'image affichée
+        image = self.display.copy()
+        if self.located is not None:
+            size = max(1, int(round(self.rock_size / self.cell_size)))
+            f = self.factor
+            for idx in np.flatnonzero(self.located):
+                rock_x = int(samples_pos[0][idx] / self.cell_size)
+                rock_y = int(samples_pos[1][idx] / self.cell_size)
+                top, bottom = max(0, self.padded - rock_y - size), max(0, self.padded - rock_y + size)
+                left, right = max(0, rock_x - size), max(0, rock_x + size)
+                image[top // f:-(-bottom // f), left // f:-(-right // f), :] = 255
+        return image
+
+    def update(self, worldmap, dirty_bbox, samples_pos=None, located=None):
+        return self.apply(self.snapshot(worldmap, dirty_bbox), samples_pos, located)
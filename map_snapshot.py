@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from worldmap import DenseWorldMap, DirtyTiles
+
+# Instantanés de la carte du monde, pour reprendre une course après un arrêt du serveur.
+# Un instantané est un dossier :
+#   - worldmap.npy  : la carte (size x size x canaux), au format .npy et projetée en mémoire (np.memmap) ;
+#                     seules les tuiles modifiées depuis l'instantané précédent y sont écrites ;
+#   - occupancy.npy : la grille log-odds de MapFusion, si elle est tenue à jour (mêmes tuiles) ;
+#   - state.json    : dimensions de la carte, index des rochers et champs utiles de RoverState.
+# state.json est écrit en dernier, dans un fichier temporaire renommé atomiquement, après la
+# synchronisation des tuiles : après un arrêt brutal, la carte relue contient au moins tout ce que
+# décrit state.json (éventuellement quelques tuiles plus récentes, ce qui est sans conséquence pour
+# des compteurs). Sans state.json, il n'y a rien à reprendre.
+# Un outil hors ligne peut ouvrir l'instantané d'un serveur en cours d'exécution en lecture seule, sans
+# copie de la carte (open_snapshot) :
+#   $ python map_snapshot.py instantane/
+
+MAP_FILE = 'worldmap.npy'
+OCCUPANCY_FILE = 'occupancy.npy'
+STATE_FILE = 'state.json'
+SNAPSHOT_VERSION = 1
+
+
+def read_snapshot_state(path):
+    state_path = os.path.join(path, STATE_FILE)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as f:
+        state = json.load(f)
+    if state.get('version') != SNAPSHOT_VERSION:
+        raise ValueError("Version d'instantané inconnue : {}".format(state_path))
+    return state
+
+
+def _write_json(path, data):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# Tableau .npy projeté en mémoire, réutilisé s'il a déjà la bonne forme (sinon recréé)
+def _open_array(path, shape, dtype):
+    if os.path.exists(path):
+        array = np.load(path, mmap_mode='r+')
+        if array.shape == tuple(shape) and array.dtype == dtype:
+            return array
+        del array
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+
+
+# Écriture périodique des instantanés d'un rover (au plus un toutes les `interval` secondes)
+class MapSnapshot():
+    def __init__(self, path, Rover, interval=5.0, tile_size=32, resume=False):
+        self.path = path
+        self.interval = interval
+        self.last_save = None
+        self.saves = 0
+        os.makedirs(path, exist_ok=True)
+        if not resume and os.path.exists(os.path.join(path, STATE_FILE)):
+            # Nouvelle course : l'ancien instantané n'est plus valable dès que ses tuiles sont réécrites
+            os.remove(os.path.join(path, STATE_FILE))
+        state = read_snapshot_state(path)
+        self.sequence = state['sequence'] if state is not None else 0
+        worldmap = Rover.worldmap
+        self.map_file = _open_array(os.path.join(path, MAP_FILE), worldmap.shape, worldmap.dtype)
+        self.occupancy_file = None
+        # Le premier instantané écrit toute la carte, les suivants seulement les tuiles modifiées
+        self.dirty = worldmap.track(DirtyTiles(worldmap.size, tile_size))
+        self.dirty.add_bbox(0, worldmap.size, 0, worldmap.size)
+
+    def _occupancy_file(self, occupancy):
+        if self.occupancy_file is None:
+            self.occupancy_file = _open_array(os.path.join(self.path, OCCUPANCY_FILE), occupancy.shape,
+                                              occupancy.dtype)
+            return self.occupancy_file, True
+        return self.occupancy_file, False
+
+    def save(self, Rover):
+        tiles = self.dirty.take()
+        occupancy = Rover.map_fusion.occupancy
+        for y0, y1, x0, x1 in tiles:
+            self.map_file[y0:y1, x0:x1] = Rover.worldmap.region(y0, y1, x0, x1)
+        self.map_file.flush()
+        if occupancy is not None:
+            occupancy_file, created = self._occupancy_file(occupancy)
+            # La grille log-odds est modifiée dans les mêmes cellules que la carte
+            boxes = [(0, occupancy.size, 0, occupancy.size)] if created else tiles
+            for y0, y1, x0, x1 in boxes:
+                occupancy_file[y0:y1, x0:x1] = occupancy.region(y0, y1, x0, x1)
+            occupancy_file.flush()
+        self.sequence += 1
+        _write_json(os.path.join(self.path, STATE_FILE), snapshot_state(Rover, self.sequence))
+        self.saves += 1
+        return len(tiles)
+
+    # Instantané si `interval` secondes se sont écoulées depuis le précédent ; renvoie le nombre de tuiles écrites
+    def update(self, Rover):
+        now = Rover.clock()
+        if self.last_save is not None and now - self.last_save < self.interval:
+            return None
+        self.last_save = now
+        return self.save(Rover)
+
+    def close(self, Rover):
+        self.save(Rover)
+        self.map_file = None
+        self.occupancy_file = None
+
+
+def _floats(values):
+    return None if values is None else [float(v) for v in values]
+
+
+# Contenu de state.json
+def snapshot_state(Rover, sequence=0):
+    worldmap = Rover.worldmap
+    samples_pos = None
+    if Rover.samples_pos is not None:
+        samples_pos = [_floats(Rover.samples_pos[0]), _floats(Rover.samples_pos[1])]
+    return {
+        'version': SNAPSHOT_VERSION,
+        'sequence': sequence,
+        'saved_at': time.time(),
+        'map': {'size': worldmap.size, 'cell_size': worldmap.cell_size, 'dtype': worldmap.dtype.str,
+                'channels': worldmap.channels, 'occupancy': Rover.map_fusion.occupancy is not None},
+        'rover': {
+            'total_time': Rover.total_time,
+            'pos': _floats(Rover.pos),
+            'yaw': None if Rover.yaw is None else float(Rover.yaw),
+            'samples_pos': samples_pos,
+            'samples_to_find': Rover.samples_to_find,
+            'samples_collected': Rover.samples_collected,
+        },
+        'rocks': Rover.rock_index.state(),
+    }
+
+
+# Restaure dans `Rover` (neuf) le dernier instantané de `path` ; renvoie son état, ou None s'il n'y en a pas
+def restore_snapshot(path, Rover):
+    state = read_snapshot_state(path)
+    if state is None:
+        return None
+    worldmap = Rover.worldmap
+    meta = state['map']
+    if (meta['size'], meta['cell_size'], np.dtype(meta['dtype']), meta['channels']) != \
+            (worldmap.size, worldmap.cell_size, worldmap.dtype, worldmap.channels):
+        raise ValueError("Instantané {} incompatible avec la carte (taille {}, cellule {} m, type {})".format(
+            path, meta['size'], meta['cell_size'], meta['dtype']))
+    saved = np.load(os.path.join(path, MAP_FILE), mmap_mode='r')
+    _copy_map(saved, worldmap)
+    if meta['occupancy'] and Rover.map_fusion.log_odds:
+        _copy_map(np.load(os.path.join(path, OCCUPANCY_FILE), mmap_mode='r'),
+                  Rover.map_fusion._occupancy(worldmap))
+
+    rover = state['rover']
+    if rover['samples_pos'] is not None:
+        Rover.samples_pos = (np.int_(rover['samples_pos'][0]), np.int_(rover['samples_pos'][1]))
+        Rover.rock_index.set_samples(Rover.samples_pos)
+        Rover.samples_to_find = rover['samples_to_find']
+        Rover.samples_collected = rover['samples_collected']
+        # La durée de la course se poursuit ; update_rover ne réinitialise plus les échantillons
+        Rover.total_time = rover['total_time'] or 0
+        Rover.start_time = Rover.clock() - Rover.total_time
+    Rover.rock_index.restore(state['rocks'])
+    return state
+
+
+# Copie une carte enregistrée (tableau dense) dans une carte du monde ; pour une carte par tuiles,
+# seules les tuiles non vides sont allouées
+def _copy_map(saved, worldmap):
+    tile = getattr(worldmap, 'tile_size', worldmap.size)
+    for y0 in range(0, worldmap.size, tile):
+        for x0 in range(0, worldmap.size, tile):
+            block = saved[y0:y0 + tile, x0:x0 + tile]
+            if block.any():
+                worldmap[y0:y0 + tile, x0:x0 + tile] = block
+
+
+# Instantané ouvert en lecture seule : (carte projetée en mémoire sans copie, état). La carte reflète
+# les tuiles écrites depuis par un serveur en cours d'exécution ; relire l'état avec read_snapshot_state.
+def open_snapshot(path):
+    state = read_snapshot_state(path)
+    if state is None:
+        raise FileNotFoundError("Aucun instantané dans {}".format(path))
+    data = np.load(os.path.join(path, MAP_FILE), mmap_mode='r')
+    meta = state['map']
+    return DenseWorldMap(meta['size'], meta['cell_size'], data.dtype, meta['channels'], data=data), state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Résumé d'un instantané de carte (lecture seule)")
+    parser.add_argument('path', help="Dossier de l'instantané (drive_rover.py --snapshot)")
+    args = parser.parse_args()
+
+    worldmap, state = open_snapshot(args.path)
+    rover = state['rover']
+    observed = [int(np.count_nonzero(worldmap.channel(k))) for k in range(worldmap.channels)]
+    print('instantané n° {}, il y a {:.1f} s'.format(state['sequence'], time.time() - state['saved_at']))
+    print('carte : {0} x {0} cellules de {1} m ({2})'.format(worldmap.size, worldmap.cell_size, worldmap.dtype))
+    print('cellules observées : obstacles {}, rochers {}, navigable {}'.format(*observed[:3]))
+    print('durée : {} s  échantillons collectés : {}/{}  groupes de rochers : {}'.format(
+        None if rover['total_time'] is None else round(rover['total_time'], 1), rover['samples_collected'],
+        rover['samples_to_find'], len(state['rocks']['count'])))
+
+
+if __name__ == '__main__':
+    main()
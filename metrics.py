@@ -0,0 +1,130 @@
+import cProfile
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+# Instrumentation du chemin critique de drive_rover.py.
+# Chaque étape est chronométrée avec une horloge monotone et alimente un histogramme glissant
+# (les N dernières mesures) dont on tire p50/p95/p99 à la demande ; des compteurs suivent les trames
+# non valides ou abandonnées. Un profil cProfile peut être capturé sur N trames.
+
+
+class RollingHistogram():
+    def __init__(self, size=1024):
+        self.values = np.zeros(size)
+        self.count = 0  # Nombre total de mesures depuis le démarrage
+        self.total = 0.0
+
+    def add(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+        self.total += value
+
+    def summary(self):
+        window = self.values[:min(self.count, len(self.values))] * 1e3
+        if len(window) == 0:
+            return {'n': self.count}
+        p50, p95, p99 = np.percentile(window, [50, 95, 99])
+        stats = {'mean_ms': window.mean(), 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p99, 'max_ms': window.max(),
+                 'total_s': self.total}
+        result = {k: round(float(v), 4) for k, v in stats.items()}
+        result['n'] = self.count
+        return result
+
+
+class Metrics():
+    def __init__(self, window=1024, log_interval=0):
+        self.window = window
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.frames = 0
+        self.frame_times = deque(maxlen=64)  # Instants des dernières trames, pour le débit
+        self.started = time.monotonic()
+        # Ligne de journal périodique (secondes, 0 : désactivée)
+        self.log_interval = log_interval
+        self.last_log = self.started
+        self.profiler = None
+        self.profile_frames = 0
+        self.profile_path = 'drive_rover.prof'
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = RollingHistogram(self.window)
+        histogram.add(seconds)
+
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    # Valeur instantanée fournie par un autre composant (ex. trames abandonnées par l'enregistreur)
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    def fps(self):
+        if len(self.frame_times) < 2:
+            return None
+        elapsed = self.frame_times[-1] - self.frame_times[0]
+        return round((len(self.frame_times) - 1) / elapsed, 1) if elapsed > 0 else None
+
+    # À appeler une fois par trame reçue, après son traitement
+    def frame_done(self):
+        now = time.monotonic()
+        self.frames += 1
+        self.frame_times.append(now)
+        if self.profiler is not None:
+            self.profile_frames -= 1
+            if self.profile_frames <= 0:
+                self._stop_profile()
+        if self.log_interval > 0 and now - self.last_log >= self.log_interval:
+            self.last_log = now
+            print(self.format_line())
+
+    def summary(self):
+        return {
+            'uptime_s': round(time.monotonic() - self.started, 1),
+            'frames': self.frames,
+            'fps': self.fps(),
+            'counters': dict(self.counters),
+            'gauges': dict(self.gauges),
+            'stages': {stage: histogram.summary() for stage, histogram in self.histograms.items()},
+            'profiling': self.profiler is not None,
+        }
+
+    def format_line(self):
+        parts = ['fps {}'.format(self.fps())]
+        for stage, histogram in self.histograms.items():
+            s = histogram.summary()
+            if 'p50_ms' in s:
+                parts.append('{} {:.2f}/{:.2f}/{:.2f} ms'.format(stage, s['p50_ms'], s['p95_ms'], s['p99_ms']))
+        for name, value in list(self.counters.items()) + list(self.gauges.items()):
+            parts.append('{} {}'.format(name, value))
+        return 'métriques : ' + ', '.join(parts)
+
+    # Profile les `frames` prochaines trames avec cProfile et écrit le résultat dans `path`
+    # (par défaut le dernier chemin utilisé ; lisible avec pstats ou snakeviz)
+    def start_profile(self, frames, path=None):
+        if self.profiler is not None:
+            return False
+        self.profile_frames = frames
+        if path is not None:
+            self.profile_path = path
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return True
+
+    def _stop_profile(self):
+        self.profiler.disable()
+        self.profiler.dump_stats(self.profile_path)
+        print("Profil enregistré dans {}".format(self.profile_path))
+        self.profiler = None
@@ -1,20 +1,162 @@
+import json
+import os
+import time
+from collections import deque
+
 import numpy as np
 import cv2
 
+from assets import cached
+from metrics import RollingHistogram
+
+# Géométrie de la caméra (fixe) : points source dans l'image et taille de la grille 1m x 1m
+SOURCE_POINTS = np.float32([[14, 140], [301, 140], [200, 96], [118, 96]])
+DST_SIZE = 5
+BOTTOM_OFFSET = 6
+# Nombre de pixels de l'image transformée par mètre
+SCALE = 2 * DST_SIZE
+
+
+def destination_points(img_size, dst_size=DST_SIZE, bottom_offset=BOTTOM_OFFSET):
+    return np.float32([[img_size[0] / 2 - dst_size, img_size[1] - bottom_offset],
+                       [img_size[0] / 2 + dst_size, img_size[1] - bottom_offset],
+                       [img_size[0] / 2 + dst_size, img_size[1] - 2 * dst_size - bottom_offset],
+                       [img_size[0] / 2 - dst_size, img_size[1] - 2 * dst_size - bottom_offset]])
+
 
 def perspect_transform(img):
     img_size = (img.shape[1], img.shape[0])
-    dst_size = 5
-    bottom_offset = 6
-    src = np.float32([[14, 140], [301, 140], [200, 96], [118, 96]])
-    dst = np.float32([[img_size[0] / 2 - dst_size, img_size[1] - bottom_offset],
-                      [img_size[0] / 2 + dst_size, img_size[1] - bottom_offset],
-                      [img_size[0] / 2 + dst_size, img_size[1] - 2 * dst_size - bottom_offset],
-                      [img_size[0] / 2 - dst_size, img_size[1] - 2 * dst_size - bottom_offset]])
-    M = cv2.getPerspectiveTransform(src, dst)
+    M = cv2.getPerspectiveTransform(SOURCE_POINTS, destination_points(img_size))
     return cv2.warpPerspective(img, M, img_size)
 
 
+# Noyau de perception calibré : la géométrie de la caméra étant fixe, on calcule une seule fois
+# la matrice de transformation, les cartes de remappage et, pour chaque pixel de l'image
+# transformée, ses coordonnées rover ainsi que sa distance et son angle polaires.
+# Chaque trame se résume ensuite à un remap et à des lectures dans ces tables.
+# Avec `roi`, seule la fenêtre de la vue de dessus contenant les pixels à moins de `limit` est calculée
+# (le remap ne lit dans l'image source que les pixels de sol correspondants) ; avec `downsample`,
+# chaque pixel calculé représente `downsample` x `downsample` pixels de la vue de dessus complète.
+# Les tables restent exprimées en pixels de la vue complète : la projection dans le monde est inchangée.
+class PerceptionKernel():
+    # Tables précalculées (enregistrables dans le cache d'assets)
+    TABLES = ('M', 'map_x', 'map_y', 'x_pixel', 'y_pixel', 'dist', 'angles',
+              'roi_idx', 'roi_x', 'roi_y', 'roi_dist', 'roi_angles', 'roi_visible')
+
+    def __init__(self, img_shape=(160, 320), limit=80, src=SOURCE_POINTS,
+                 dst_size=DST_SIZE, bottom_offset=BOTTOM_OFFSET, tables=None, roi=False, downsample=1):
+        height, width = img_shape[:2]
+        self.img_shape = (height, width)
+        self.img_size = (width, height)
+        self.limit = limit
+        # Fenêtre (y0, y1, x0, x1) de la vue complète couverte, et taille de la vue produite
+        if roi:
+            self.window = (max(0, height - limit), height, max(0, width // 2 - limit), min(width, width // 2 + limit))
+        else:
+            self.window = (0, height, 0, width)
+        y0, y1, x0, x1 = self.window
+        self.downsample = downsample
+        self.full = not roi and downsample == 1
+        self.out_shape = ((y1 - y0) // downsample, (x1 - x0) // downsample)
+        self.out_size = self.out_shape[::-1]
+        # Vue complète -> vue produite (centres des pixels alignés), à composer avec une transformation
+        offset = (downsample - 1) / 2
+        self.window_matrix = np.array([[1 / downsample, 0, -(x0 + offset) / downsample],
+                                       [0, 1 / downsample, -(y0 + offset) / downsample], [0, 0, 1.0]])
+        if tables is not None:
+            for name in self.TABLES:
+                setattr(self, name, tables[name])
+            return
+        self.M = cv2.getPerspectiveTransform(src, destination_points(self.img_size, dst_size, bottom_offset))
+
+        # Cartes de remappage : pour chaque pixel de destination, la position source correspondante
+        Minv = np.linalg.inv(self.M)
+        out_height, out_width = self.out_shape
+        xs, ys = np.meshgrid(x0 + offset + downsample * np.arange(out_width, dtype=np.float64),
+                             y0 + offset + downsample * np.arange(out_height, dtype=np.float64))
+        w = Minv[2, 0] * xs + Minv[2, 1] * ys + Minv[2, 2]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            map_x = (Minv[0, 0] * xs + Minv[0, 1] * ys + Minv[0, 2]) / w
+            map_y = (Minv[1, 0] * xs + Minv[1, 1] * ys + Minv[1, 2]) / w
+        # Les points à l'infini (horizon) tombent hors de l'image et restent noirs
+        self.map_x = np.nan_to_num(map_x, nan=-1, posinf=-1, neginf=-1).astype(np.float32)
+        self.map_y = np.nan_to_num(map_y, nan=-1, posinf=-1, neginf=-1).astype(np.float32)
+
+        # Tables par pixel dans le repère du rover (mêmes formules que rover_coords / to_polar_coords)
+        self.x_pixel = -(ys - height)
+        self.y_pixel = -(xs - width / 2)
+        self.dist, self.angles = to_polar_coords(self.x_pixel, self.y_pixel)
+        # Indices (à plat, dans l'ordre des lignes) des pixels situés à moins de `limit`
+        self.roi_idx = np.flatnonzero(self.dist < limit)
+        self.roi_x = self.x_pixel.ravel()[self.roi_idx]
+        self.roi_y = self.y_pixel.ravel()[self.roi_idx]
+        self.roi_dist = self.dist.ravel()[self.roi_idx]
+        self.roi_angles = self.angles.ravel()[self.roi_idx]
+        # Pixels de la région utile réellement vus par la caméra : hors champ, l'image transformée est noire
+        # et passerait pour un obstacle
+        visible = (self.map_x >= 0) & (self.map_x <= width - 1) & (self.map_y >= 0) & (self.map_y <= height - 1)
+        self.roi_visible = visible.ravel()[self.roi_idx]
+
+    def tables(self):
+        return {name: getattr(self, name) for name in self.TABLES}
+
+    def warp(self, img, out=None):
+        return cv2.remap(img, self.map_x, self.map_y, cv2.INTER_LINEAR, dst=out)
+
+    # Copie d'une image de la vue produite dans une image de la taille de la vue complète
+    # (pixels répétés si sous-échantillonnée)
+    def paste(self, img, out):
+        y0, y1, x0, x1 = self.window
+        if self.downsample > 1:
+            img = cv2.resize(np.ascontiguousarray(img), (x1 - x0, y1 - y0), interpolation=cv2.INTER_NEAREST)
+        out[y0:y1, x0:x1] = img
+        return out
+
+    # Indices (dans la région utile) des pixels non nuls d'une image binaire
+    def _hits(self, binary_img):
+        return binary_img.ravel()[self.roi_idx].nonzero()[0]
+
+    def rover_coords(self, binary_img):
+        hits = self._hits(binary_img)
+        return self.roi_x[hits], self.roi_y[hits]
+
+    # Coordonnées rover et polaires en une seule lecture de table
+    # (`visible_only` : uniquement les pixels dans le champ de la caméra ; `mask` : masque booléen de la
+    # vue produite, seuls ses pixels sont retenus)
+    def polar_coords(self, binary_img, visible_only=False, mask=None):
+        hits = self._hits(binary_img)
+        if visible_only:
+            hits = hits[self.roi_visible[hits]]
+        if mask is not None:
+            hits = hits[mask.ravel()[self.roi_idx[hits]]]
+        return self.roi_x[hits], self.roi_y[hits], self.roi_dist[hits], self.roi_angles[hits]
+
+
+# Modes de perception : (fenêtre utile seulement, sous-échantillonnage)
+#   full : vue de dessus entière (cartographie, image de vision complète)
+#   roi  : fenêtre des pixels à moins de `limit`, 4 fois moins de pixels, mêmes détections
+#   fast : cette fenêtre à demi-résolution, 16 fois moins de pixels (conduite rapide, carte moins fine)
+PERCEPTION_MODES = {'full': (False, 1), 'roi': (True, 1), 'fast': (True, 2)}
+
+_kernels = {}
+
+
+# Noyau partagé pour une taille d'image et un mode ; ses tables sont relues du cache d'assets si possible
+def get_perception_kernel(img_shape, mode='full'):
+    key = (tuple(img_shape[:2]), mode)
+    if key not in _kernels:
+        roi, downsample = PERCEPTION_MODES[mode]
+        shape = key[0]
+        params = [list(shape), SOURCE_POINTS.tolist(), DST_SIZE, BOTTOM_OFFSET, 80, list(PerceptionKernel.TABLES)]
+        if mode != 'full':
+            params.append([roi, downsample])
+        tables, _ = cached('perception_kernel', params,
+                           lambda: (PerceptionKernel(shape, roi=roi, downsample=downsample).tables(), {}),
+                           sources=(os.path.abspath(__file__),))
+        _kernels[key] = PerceptionKernel(shape, tables=tables, roi=roi, downsample=downsample)
+    return _kernels[key]
+
+
 def color_thresh(img, low_thresh=(0, 0, 0), high_thresh=(255, 255, 255)):
     color_select = np.zeros_like(img[:, :, 0])
     thresh_img = (img[:, :, 0] >= low_thresh[0]) & (img[:, :, 1] >= low_thresh[1]) & (img[:, :, 2] >= low_thresh[2]) \
@@ -24,10 +166,187 @@ def color_thresh(img, low_thresh=(0, 0, 0), high_thresh=(255, 255, 255)):
     return color_select
 
 
+# Seuils RGB (bas, haut) par classe, dans l'ordre des canaux de Rover.vision_image
+OBSTACLE_THRESH = ((0, 0, 0), (100, 100, 100))
+ROCK_THRESH = ((110, 110, 0), (255, 255, 80))
+NAVIGABLE_THRESH = ((160, 160, 160), (255, 255, 255))
+
+
+# Segmentation multi-classes en une passe : un cv2.inRange par classe écrit dans un tampon partagé
+# (un plan par classe, valeurs 0/255), puis les plans sont fusionnés directement dans l'image de vision.
+# Les classes sont disjointes avec les seuils par défaut : chaque pixel reçoit au plus une étiquette.
+class ColorSegmenter():
+    OBSTACLE = 0
+    ROCK = 1
+    NAVIGABLE = 2
+
+    def __init__(self, img_shape=(160, 320), obstacle=OBSTACLE_THRESH, rock=ROCK_THRESH,
+                 navigable=NAVIGABLE_THRESH):
+        self.thresholds = [obstacle, rock, navigable]
+        self.masks = np.zeros((3,) + tuple(img_shape[:2]), dtype=np.uint8)
+        self._planes = tuple(self.masks[k] for k in range(3))
+
+    def set_thresholds(self, obstacle=None, rock=None, navigable=None):
+        for k, thresh in enumerate((obstacle, rock, navigable)):
+            if thresh is not None:
+                self.thresholds[k] = thresh
+
+    def segment(self, warped, out=None):
+        if warped.shape[:2] != self.masks.shape[1:]:
+            self.masks = np.zeros((3,) + warped.shape[:2], dtype=np.uint8)
+            self._planes = tuple(self.masks[k] for k in range(3))
+        for plane, (low, high) in zip(self._planes, self.thresholds):
+            cv2.inRange(warped, low, high, dst=plane)
+        if out is not None:
+            if out.dtype == np.uint8 and out.flags.c_contiguous:
+                cv2.merge(self._planes, dst=out)
+            else:
+                out[:] = self.masks.transpose(1, 2, 0)
+        return self.masks
+
+    # Masques binaires (0/255) de la dernière trame, sous forme de vues sur le tampon partagé
+    @property
+    def obstacles(self):
+        return self.masks[self.OBSTACLE]
+
+    @property
+    def rocks(self):
+        return self.masks[self.ROCK]
+
+    @property
+    def navigable(self):
+        return self.masks[self.NAVIGABLE]
+
+    # Image d'étiquettes : 0 = inconnu, 1 = obstacle, 2 = rocher, 3 = navigable
+    def labels(self, out=None):
+        if out is None:
+            out = np.zeros(self.masks.shape[1:], dtype=np.uint8)
+        else:
+            out[:] = 0
+        for k in range(3):
+            out[self._planes[k] > 0] = k + 1
+        return out
+
+
+# Table de classification couleur précalculée : RGB -> étiquette (mêmes valeurs que ColorSegmenter.labels),
+# indexée par la couleur réduite en RGB565 (5 bits de rouge, 6 de vert, 5 de bleu : 65536 cases, 64 Kio).
+# cv2.cvtColor calcule l'indice de toute l'image en un appel ; la classification d'une trame se résume
+# ensuite à une lecture indexée, quel que soit le nombre de classes ou la forme de leurs frontières.
+# Les tables sont apprises sur des trames étiquetées par calibrate_colors.py.
+LUT_SIZE = 1 << 16
+N_LABELS = 4
+
+
+# Indice RGB565 de chaque pixel d'une image RGB (tampon `out` H x W x 2 réutilisable)
+def lut_index(img, out=None):
+    out = cv2.cvtColor(np.ascontiguousarray(img), cv2.COLOR_RGB2BGR565, dst=out)
+    return out.view(np.uint16)[:, :, 0]
+
+
+# Couleur RGB au centre de chaque case de la table (LUT_SIZE x 3)
+def lut_bin_colors():
+    idx = np.arange(LUT_SIZE)
+    return np.column_stack((((idx >> 11) << 3) + 4, (((idx >> 5) & 63) << 2) + 2, ((idx & 31) << 3) + 4)).astype(float)
+
+
+# Table équivalente à des seuils (bas, haut) par classe (obstacle, rocher, navigable), évalués au centre des cases
+def lut_from_thresholds(thresholds=(OBSTACLE_THRESH, ROCK_THRESH, NAVIGABLE_THRESH)):
+    colors = lut_bin_colors()
+    table = np.zeros(LUT_SIZE, dtype=np.uint8)
+    for k, (low, high) in enumerate(thresholds):
+        table[np.all((colors >= low) & (colors <= high), axis=1)] = k + 1
+    return table
+
+
+# Écriture atomique (fichier temporaire puis os.replace) : un serveur qui relit la table ne voit jamais
+# un fichier partiel
+def save_color_lut(path, table, meta=None):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.savez(f, table=np.asarray(table, dtype=np.uint8), meta=json.dumps(meta or {}))
+    os.replace(tmp, path)
+
+
+def load_color_lut(path):
+    with np.load(path) as data:
+        table = np.ascontiguousarray(data['table'], dtype=np.uint8)
+    if table.shape != (LUT_SIZE,) or table.max() >= N_LABELS:
+        raise ValueError("table de couleurs invalide : {}".format(path))
+    return table
+
+
+# Segmentation par table de couleurs, interchangeable avec ColorSegmenter.
+# Si `path` est indiqué, le fichier est surveillé (au plus une fois par `check_interval` secondes) et
+# la table est remplacée à chaud quand il change ; une table invalide est ignorée.
+class LutSegmenter(ColorSegmenter):
+    def __init__(self, table=None, img_shape=(160, 320), path=None, check_interval=1.0):
+        ColorSegmenter.__init__(self, img_shape)
+        self.path = path
+        self.check_interval = check_interval
+        self.mtime = None
+        self.last_check = time.monotonic()
+        if table is None:
+            table = load_color_lut(path) if path else lut_from_thresholds()
+            self.mtime = os.path.getmtime(path) if path else None
+        elif path:
+            self.mtime = os.path.getmtime(path)
+        self.table = table
+        self.reloads = 0
+        self._index = np.zeros(tuple(img_shape[:2]) + (2,), dtype=np.uint8)  # Tampon RGB565
+        self._labels = np.zeros(tuple(img_shape[:2]), dtype=np.uint8)
+
+    def set_thresholds(self, obstacle=None, rock=None, navigable=None):
+        ColorSegmenter.set_thresholds(self, obstacle, rock, navigable)
+        self.table = lut_from_thresholds(self.thresholds)
+
+    # Relit la table si le fichier a changé ; renvoie True si elle a été remplacée
+    def reload(self, force=False):
+        if not self.path:
+            return False
+        try:
+            mtime = os.path.getmtime(self.path)
+            if not force and mtime == self.mtime:
+                return False
+            table = load_color_lut(self.path)
+        except (OSError, ValueError, KeyError) as e:
+            print("Table de couleurs non rechargée ({}) : {}".format(self.path, e))
+            return False
+        self.table, self.mtime = table, mtime
+        self.reloads += 1
+        return True
+
+    def segment(self, warped, out=None):
+        if self.path:
+            now = time.monotonic()
+            if now - self.last_check >= self.check_interval:
+                self.last_check = now
+                self.reload()
+        if warped.shape[:2] != self._labels.shape:
+            self.masks = np.zeros((3,) + warped.shape[:2], dtype=np.uint8)
+            self._planes = tuple(self.masks[k] for k in range(3))
+            self._labels = np.zeros(warped.shape[:2], dtype=np.uint8)
+            self._index = np.zeros(warped.shape[:2] + (2,), dtype=np.uint8)
+        np.take(self.table, lut_index(warped, out=self._index), out=self._labels)
+        for k, plane in enumerate(self._planes):
+            cv2.compare(self._labels, k + 1, cv2.CMP_EQ, dst=plane)
+        if out is not None:
+            if out.dtype == np.uint8 and out.flags.c_contiguous:
+                cv2.merge(self._planes, dst=out)
+            else:
+                out[:] = self.masks.transpose(1, 2, 0)
+        return self.masks
+
+    def labels(self, out=None):
+        if out is None:
+            return self._labels.copy()
+        out[:] = self._labels
+        return out
+
+
 def rover_coords(binary_img, limit=80):
     ypos, xpos = binary_img.nonzero()
-    x_pixel = -(ypos - binary_img.shape[0]).astype(np.float)
-    y_pixel = -(xpos - binary_img.shape[1] / 2).astype(np.float)
+    x_pixel = -(ypos - binary_img.shape[0]).astype(float)
+    y_pixel = -(xpos - binary_img.shape[1] / 2).astype(float)
     dist = np.sqrt(x_pixel ** 2 + y_pixel ** 2)
     return x_pixel[dist < limit], y_pixel[dist < limit]
 
@@ -35,10 +354,21 @@ def rover_coords(binary_img, limit=80):
 # MODIFICATION ICI : Ajout de world_size et scale dans les arguments
 def pix_to_world(xpix, ypix, xpos, ypos, yaw, world_size, scale):
     dist, angles = to_polar_coords(xpix, ypix)
+    return polar_to_world(dist, angles, xpos, ypos, yaw, world_size, scale)
+
+
+# Coordonnées monde (en mètres, non arrondies) de pixels dont les coordonnées polaires sont connues
+def polar_to_world_coords(dist, angles, xpos, ypos, yaw, scale):
     yaw_rad = yaw * np.pi / 180
     pix_angles = angles + yaw_rad
     x_world = (dist / scale) * np.cos(pix_angles) + xpos
     y_world = (dist / scale) * np.sin(pix_angles) + ypos
+    return x_world, y_world
+
+
+# Variante de pix_to_world pour des pixels dont les coordonnées polaires sont déjà connues
+def polar_to_world(dist, angles, xpos, ypos, yaw, world_size, scale):
+    x_world, y_world = polar_to_world_coords(dist, angles, xpos, ypos, yaw, scale)
     x_pix_world = np.clip(np.int_(x_world), 0, world_size - 1)
     y_pix_world = np.clip(np.int_(y_world), 0, world_size - 1)
     return x_pix_world, y_pix_world
@@ -50,46 +380,109 @@ def to_polar_coords(xpix, ypix):
     return dist, angles
 
 
-def perception_step(Rover):
-    warped = perspect_transform(Rover.img)
+# Mode de perception de la trame : Rover.perception_mode, ou avec 'auto' : 'fast' au-delà de
+# Rover.fast_speed, sinon le mode le plus fin dont le coût médian récent tient dans Rover.perception_budget.
+# Toutes les `probe_interval` trames, les coûts récents des modes plus fins sont oubliés pour suivre
+# l'évolution de la charge : chacun est alors réessayé `probe_frames` trames, dont la médiane décide.
+def select_perception_mode(Rover, probe_interval=100, probe_frames=3):
+    if Rover.perception_mode != 'auto':
+        return Rover.perception_mode
+    if Rover.vel is not None and Rover.vel >= Rover.fast_speed:
+        return 'fast'
+    if Rover.perception_budget is None:
+        return 'full'
+    Rover.perception_frames += 1
+    if Rover.perception_frames % probe_interval == 0:
+        for mode in ('full', 'roi'):
+            Rover.perception_recent.pop(mode, None)
+    for mode in ('full', 'roi'):
+        recent = Rover.perception_recent.get(mode, ())
+        if len(recent) < probe_frames or np.median(recent) <= Rover.perception_budget:
+            return mode
+    return 'fast'
 
-    # Seuillage
-    navigable = color_thresh(warped, low_thresh=(160, 160, 160))
-    obstacles = color_thresh(warped, high_thresh=(100, 100, 100))
-    rocks = color_thresh(warped, low_thresh=(110, 110, 0), high_thresh=(255, 255, 80))
 
-    Rover.vision_image[:, :, 0] = obstacles * 255
-    Rover.vision_image[:, :, 1] = rocks * 255
-    Rover.vision_image[:, :, 2] = navigable * 255
+def perception_step(Rover):
+    start = time.perf_counter()
+    mode = select_perception_mode(Rover)
+    kernel = get_perception_kernel(Rover.img.shape, mode)
+    xpos, ypos, yaw = Rover.pos[0], Rover.pos[1], Rover.yaw
+    pose_fusion = Rover.pose_fusion
+    if pose_fusion is None:
+        # Mise à jour de la carte seulement si le rover est stable
+        stable = (Rover.pitch < 1.0 or Rover.pitch > 359.0) and (Rover.roll < 1.0 or Rover.roll > 359.0)
+        level = True
+        visible = None
+        warped = kernel.warp(Rover.img)
+    else:
+        # Pose interpolée de la trame ; inclinaison corrigée jusqu'à pose_fusion.max_tilt
+        xpos, ypos, yaw, pitch, roll = pose_fusion.update(Rover)
+        stable = pose_fusion.usable(pitch, roll)
+        level = not stable or pose_fusion.level(pitch, roll)
+        warped = pose_fusion.warp(Rover.img, pitch, roll, kernel=kernel) if stable else kernel.warp(Rover.img)
+        # Vue corrigée : pixels vus par la caméra (None si la transformation calibrée est utilisée)
+        visible = pose_fusion.visible if stable else None
 
-    xpix, ypix = rover_coords(navigable)
-    obsx, obsy = rover_coords(obstacles)
-    rockx, rocky = rover_coords(rocks)
+    # Seuillage : une seule passe de segmentation écrite directement dans l'image de vision
+    # (hors mode complet, dans la fenêtre correspondante de l'image de vision)
+    if Rover.segmenter is None:
+        Rover.segmenter = ColorSegmenter(warped.shape)
+    if kernel.full:
+        Rover.segmenter.segment(warped, out=Rover.vision_image)
+    else:
+        masks = Rover.segmenter.segment(warped)
+        if Rover.perception_mode_used != mode:
+            Rover.vision_image[:] = 0
+        kernel.paste(masks.transpose(1, 2, 0), Rover.vision_image)
+    Rover.perception_mode_used = mode
+    obstacles = Rover.segmenter.obstacles
+    rocks = Rover.segmenter.rocks
+    navigable = Rover.segmenter.navigable
 
-    world_size = Rover.worldmap.shape[0]
-    scale = 10
+    # Coordonnées rover et polaires lues dans les tables précalculées du noyau
+    # (hors champ de la vue corrigée, toutes les détections sont écartées par le masque de visibilité)
+    xpix, ypix, dist, angles = kernel.polar_coords(navigable, mask=visible)
+    obsx, obsy, obs_dist, obs_angles = kernel.polar_coords(obstacles, visible_only=level, mask=visible)
+    rockx, rocky, rdist, rangles = kernel.polar_coords(rocks, mask=visible)
 
-    # Appels corrigés avec le bon nombre d'arguments
-    nav_x_world, nav_y_world = pix_to_world(xpix, ypix, Rover.pos[0], Rover.pos[1], Rover.yaw, world_size, scale)
-    obs_x_world, obs_y_world = pix_to_world(obsx, obsy, Rover.pos[0], Rover.pos[1], Rover.yaw, world_size, scale)
-    rock_x_world, rock_y_world = pix_to_world(rockx, rocky, Rover.pos[0], Rover.pos[1], Rover.yaw, world_size, scale)
+    if stable:
+        worldmap = Rover.worldmap
+        # Coordonnées monde, puis cellules de la carte (taille de cellule propre à la carte)
+        nav_x_world, nav_y_world = worldmap.world_to_cell(
+            *polar_to_world_coords(dist, angles, xpos, ypos, yaw, SCALE))
+        obs_x_world, obs_y_world = worldmap.world_to_cell(
+            *polar_to_world_coords(obs_dist, obs_angles, xpos, ypos, yaw, SCALE))
+        rock_x, rock_y = polar_to_world_coords(rdist, rangles, xpos, ypos, yaw, SCALE)
+        rock_x_world, rock_y_world = worldmap.world_to_cell(rock_x, rock_y)
+        # Index des rochers : regroupement incrémental des détections en positions candidates
+        Rover.rock_index.add(rock_x, rock_y)
+        Rover.samples_located = Rover.rock_index.samples_located
 
-    # Mise à jour de la carte si le rover est stable
-    if (Rover.pitch < 1.0 or Rover.pitch > 359.0) and (Rover.roll < 1.0 or Rover.roll > 359.0):
-        Rover.worldmap[obs_y_world, obs_x_world, 0] += 1
-        Rover.worldmap[rock_y_world, rock_x_world, 1] = 255
-        Rover.worldmap[nav_y_world, nav_x_world, 2] += 1
+        # Détections pondérées par leur erreur de projection estimée, et par la surface qu'elles
+        # représentent en mode sous-échantillonné
+        scales = None
+        if pose_fusion is not None:
+            scales = {'obstacle': pose_fusion.weights(obs_dist, pitch, roll),
+                      'navigable': pose_fusion.weights(dist, pitch, roll)}
+        # Fusion : toutes les détections de la trame en une écriture par canal, doublons compris
+        Rover.map_fusion.fuse(worldmap, (obs_y_world, obs_x_world, obs_dist), (rock_y_world, rock_x_world),
+                              (nav_y_world, nav_x_world, dist), scales=scales, area=kernel.downsample ** 2)
 
-    dist, angles = to_polar_coords(xpix, ypix)
     Rover.nav_dists = dist
     Rover.nav_angles = angles
+    Rover.nav_pixel_area = kernel.downsample ** 2
 
     if rocks.any():
-        rdist, rangles = to_polar_coords(rockx, rocky)
         Rover.samples_dists = rdist
         Rover.samples_angles = rangles
     else:
         Rover.samples_dists = np.asarray([])
         Rover.samples_angles = np.asarray([])
 
+    # Coût de la trame, par mode
+    Rover.perception_cost = time.perf_counter() - start
+    if mode not in Rover.perception_costs:
+        Rover.perception_costs[mode] = RollingHistogram(64)
+    Rover.perception_costs[mode].add(Rover.perception_cost)
+    Rover.perception_recent.setdefault(mode, deque(maxlen=16)).append(Rover.perception_cost)
     return Rover
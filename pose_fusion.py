@@ -0,0 +1,177 @@
+from collections import deque
+
+import cv2
+import numpy as np
+
+from perception import SCALE
+
+# Couleur des zones hors champ après correction, pour l'affichage : les détections y sont écartées par le
+# masque de visibilité (PoseAwareFusion.visible), quelle que soit la segmentation (seuils, table apprise)
+UNSEEN_COLOR = (130, 130, 130)
+
+# Fusion tenant compte de la pose.
+# Au lieu d'ignorer toutes les trames dont le tangage ou le roulis dépasse 1°, la transformation de
+# perspective est corrigée pour de petites inclinaisons : le modèle de caméra (focale, orientation)
+# est déduit une fois de la transformation calibrée, et l'inclinaison du rover est traitée comme une
+# rotation de la caméra autour de son centre (homographie K R K^-1 dans l'image).
+# La pose de la trame est interpolée dans un court historique de télémétrie, et chaque détection
+# est pondérée par l'erreur de projection estimée (mouvement pendant la trame, inclinaison résiduelle).
+
+
+def _signed(angle):
+    return (angle + 180.0) % 360.0 - 180.0
+
+
+def _rotation_x(a):
+    c, s = np.cos(a), np.sin(a)
+    return np.array([[1, 0, 0], [0, c, -s], [0, s, c]])
+
+
+def _rotation_y(a):
+    c, s = np.cos(a), np.sin(a)
+    return np.array([[c, 0, s], [0, 1, 0], [-s, 0, c]])
+
+
+# Modèle sténopé déduit de la matrice M (image -> vue de dessus) d'un PerceptionKernel.
+# Repère sol du rover : X vers l'avant, Y vers la gauche, Z vers le haut, en mètres.
+# Le point principal est supposé au centre de l'image et les pixels carrés.
+# `pitch_sign` / `roll_sign` fixent la convention des angles du simulateur (tangage positif : nez vers le haut).
+class CameraModel():
+    def __init__(self, kernel, scale=SCALE, pitch_sign=1.0, roll_sign=1.0):
+        height, width = kernel.img_shape
+        self.kernel = kernel
+        self.pitch_sign = pitch_sign
+        self.roll_sign = roll_sign
+        # Sol (mètres) -> vue de dessus (pixels), mêmes conventions que rover_coords
+        ground_to_top = np.array([[0, -scale, width / 2], [-scale, 0, height], [0, 0, 1.0]])
+        H = np.linalg.inv(kernel.M) @ ground_to_top
+        H = np.array([[1, 0, -width / 2], [0, 1, -height / 2], [0, 0, 1.0]]) @ (H / H[2, 2])
+        h1, h2, h3 = H[:, 0], H[:, 1], H[:, 2]
+        # Focale : colonnes de rotation de même norme (ou orthogonales si la première équation est dégénérée)
+        denominator = h2[2] ** 2 - h1[2] ** 2
+        focal2 = (h1[0] ** 2 + h1[1] ** 2 - h2[0] ** 2 - h2[1] ** 2) / denominator if denominator else -1
+        if focal2 <= 0:
+            focal2 = -(h1[0] * h2[0] + h1[1] * h2[1]) / (h1[2] * h2[2])
+        self.focal = float(np.sqrt(focal2))
+        self.K = np.array([[self.focal, 0, width / 2], [0, self.focal, height / 2], [0, 0, 1.0]])
+        # H est déjà centré sur le point principal : il reste à diviser par la focale
+        unfocus = np.array([1 / self.focal, 1 / self.focal, 1.0])
+        r1, r2, t = h1 * unfocus, h2 * unfocus, h3 * unfocus
+        scale_factor = 2.0 / (np.linalg.norm(r1) + np.linalg.norm(r2))
+        # Le sol devant le rover doit être devant la caméra (profondeur positive)
+        if (r1[2] * 5.0 + t[2]) * scale_factor < 0:
+            scale_factor = -scale_factor
+        r1, r2, t = r1 * scale_factor, r2 * scale_factor, t * scale_factor
+        u, _, vt = np.linalg.svd(np.column_stack((r1, r2, np.cross(r1, r2))))
+        self.R = u @ vt  # Axes du repère sol exprimés dans le repère caméra
+        self.t = t
+        # Hauteur de la caméra au-dessus du sol (mètres)
+        self.height = float(abs((-self.R.T @ t)[2]))
+
+    # Homographie image de niveau -> image inclinée pour un tangage / roulis donnés (degrés)
+    def tilt_homography(self, pitch, roll):
+        pitch = np.radians(self.pitch_sign * _signed(pitch))
+        roll = np.radians(self.roll_sign * _signed(roll))
+        # Rotation du rover (nez vers le haut : l'axe X monte, rotation de -pitch autour de Y)
+        body = _rotation_y(-pitch) @ _rotation_x(roll)
+        return self.K @ self.R @ body.T @ self.R.T @ np.linalg.inv(self.K)
+
+    # Matrice image inclinée -> vue de dessus, à utiliser à la place de kernel.M
+    def warp_matrix(self, pitch, roll):
+        return self.kernel.M @ np.linalg.inv(self.tilt_homography(pitch, roll))
+
+
+# Historique court des poses reçues (x, y, lacet, tangage, roulis), indexé en trames
+class PoseHistory():
+    def __init__(self, size=8):
+        self.poses = deque(maxlen=size)
+
+    def add(self, x, y, yaw, pitch, roll):
+        self.poses.append(np.array([x, y, yaw, pitch, roll], dtype=float))
+
+    # Pose `ticks` trames avant la dernière reçue (fractionnaire : interpolation linéaire, angles déroulés)
+    def at(self, ticks=0.0):
+        if not self.poses:
+            return None
+        ticks = min(max(ticks, 0.0), len(self.poses) - 1)
+        i = len(self.poses) - 1 - int(np.floor(ticks))
+        frac = ticks - np.floor(ticks)
+        pose = self.poses[i].copy()
+        if frac > 0:
+            previous = self.poses[i - 1]
+            delta = pose - previous
+            delta[2:] = _signed(delta[2:])
+            pose -= frac * delta
+            pose[2:] %= 360.0
+        return pose
+
+    # Déplacement (mètres) et rotation de lacet (degrés) pendant la dernière trame
+    def motion(self):
+        if len(self.poses) < 2:
+            return 0.0, 0.0
+        delta = self.poses[-1] - self.poses[-2]
+        return float(np.hypot(delta[0], delta[1])), float(abs(_signed(delta[2])))
+
+
+class PoseAwareFusion():
+    def __init__(self, kernel, max_tilt=5.0, latency=0.0, timing_uncertainty=0.5, tilt_residual=0.2,
+                 level_tolerance=0.1, cell_size=1.0, history=8, pitch_sign=1.0, roll_sign=1.0):
+        self.camera = CameraModel(kernel, pitch_sign=pitch_sign, roll_sign=roll_sign)
+        self.history = PoseHistory(history)
+        self.max_tilt = max_tilt  # Inclinaison maximale corrigée (degrés) ; au-delà la trame est ignorée
+        self.latency = latency  # Retard de l'image sur la télémétrie, en trames (interpolation de la pose)
+        self.timing_uncertainty = timing_uncertainty  # Incertitude sur l'instant de l'image, en trames
+        self.tilt_residual = tilt_residual  # Part de l'inclinaison supposée non corrigée par le modèle
+        self.level_tolerance = level_tolerance  # En deçà (degrés), la transformation calibrée est utilisée telle quelle
+        self.cell_size = cell_size
+        self.frames_used = 0
+        self.frames_skipped = 0
+        self.visible = None  # Pixels de la dernière vue corrigée vus par la caméra (None : vue calibrée)
+        self._ones = None
+
+    # Pose de la trame courante (x, y, lacet, tangage, roulis), après ajout de la télémétrie reçue
+    def update(self, Rover):
+        self.history.add(Rover.pos[0], Rover.pos[1], Rover.yaw, Rover.pitch, Rover.roll)
+        return self.history.at(self.latency)
+
+    def usable(self, pitch, roll):
+        usable = abs(_signed(pitch)) <= self.max_tilt and abs(_signed(roll)) <= self.max_tilt
+        if usable:
+            self.frames_used += 1
+        else:
+            self.frames_skipped += 1
+        return usable
+
+    def level(self, pitch, roll):
+        return abs(_signed(pitch)) < self.level_tolerance and abs(_signed(roll)) < self.level_tolerance
+
+    # Vue de dessus corrigée de l'inclinaison (transformation calibrée si le rover est de niveau) ;
+    # `kernel` : noyau d'un autre mode de perception (fenêtre, sous-échantillonnage) que celui du modèle.
+    # Pour une vue corrigée, self.visible reçoit le masque des pixels entièrement vus par la caméra
+    def warp(self, img, pitch, roll, out=None, kernel=None):
+        kernel = kernel if kernel is not None else self.camera.kernel
+        if self.level(pitch, roll):
+            self.visible = None
+            return kernel.warp(img, out=out)
+        matrix = kernel.window_matrix @ self.camera.warp_matrix(pitch, roll)
+        self.visible = self.visibility(img.shape[:2], matrix, kernel.out_size)
+        return cv2.warpPerspective(img, matrix, kernel.out_size, dst=out, flags=cv2.INTER_LINEAR,
+                                   borderMode=cv2.BORDER_CONSTANT, borderValue=UNSEEN_COLOR)
+
+    # Masque de la vue produite par `matrix` : image uniforme transformée de la même façon, un pixel
+    # interpolé en partie avec le bord (hors champ) n'est pas retenu
+    def visibility(self, img_shape, matrix, out_size):
+        if self._ones is None or self._ones.shape != tuple(img_shape):
+            self._ones = np.full(img_shape, 255, dtype=np.uint8)
+        mask = cv2.warpPerspective(self._ones, matrix, out_size, flags=cv2.INTER_LINEAR,
+                                   borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+        return mask == 255
+
+    # Poids des détections (distances en pixels de la vue de dessus) : 1 / (1 + (erreur / cellule)^2)
+    def weights(self, dist, pitch, roll, scale=SCALE):
+        ground = np.asarray(dist, dtype=float) / scale
+        moved, turned = self.history.motion()
+        tilt = np.radians(self.tilt_residual * np.hypot(_signed(pitch), _signed(roll)))
+        error = self.timing_uncertainty * (moved + ground * np.radians(turned)) \
+            + tilt * (ground + ground ** 2 / max(self.camera.height, 1e-3))
+        return 1.0 / (1.0 + (error / self.cell_size) ** 2)
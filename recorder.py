@@ -0,0 +1,216 @@
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+
+# Enregistrement asynchrone des images de la caméra.
+# Les trames sont placées dans une file bornée et écrites par des fils dédiés ; si les disques ne
+# suivent pas, les trames excédentaires sont abandonnées (et comptées) au lieu de bloquer la boucle.
+# Deux formats :
+#   - 'jpg'      : un fichier JPEG par trame, comme auparavant (octets reçus écrits tels quels) ;
+#   - 'segments' : fichiers segments en ajout seul (JPEG brut + télémétrie JSON) et un index binaire
+#                  à enregistrements fixes, relu par memmap.
+
+INDEX_DTYPE = np.dtype([('t', '<f8'), ('segment', '<u4'), ('offset', '<u8'),
+                        ('image_len', '<u4'), ('meta_len', '<u4')])
+INDEX_FILE = 'index.bin'
+SEGMENT_NAME = 'seg_{:05d}.bin'
+
+
+class FrameRecorder():
+    def __init__(self, path, format='jpg', queue_size=64, workers=2, drop=True,
+                 segment_size=64 * 1024 * 1024):
+        if format not in ('jpg', 'segments'):
+            raise ValueError("Format d'enregistrement inconnu : {}".format(format))
+        self.path = path
+        self.format = format
+        self.drop = drop
+        self.segment_size = segment_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.recorded = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        if format == 'segments':
+            # L'ordre des trames compte : un seul fil écrit les segments et l'index
+            workers = 1
+            self.segment = 0
+            self.segment_file = None
+            self.index_file = open(os.path.join(path, INDEX_FILE), 'ab')
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    # image : EncodedFrame (octets JPEG reçus), data : télémétrie associée (facultative)
+    def record(self, image, data=None, t=None):
+        if t is None:
+            t = time.time()
+        item = (t, image.data, data)
+        if self.drop:
+            try:
+                self.queue.put_nowait(item)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+        else:
+            self.queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.format == 'jpg':
+                    self._write_jpg(*item)
+                else:
+                    self._write_segment(*item)
+                with self._lock:
+                    self.recorded += 1
+            finally:
+                self.queue.task_done()
+
+    def _write_jpg(self, t, jpeg, data):
+        timestamp = datetime.fromtimestamp(t, timezone.utc).strftime('%Y_%m_%d_%H_%M_%S_%f')[:-3]
+        with open(os.path.join(self.path, timestamp + '.jpg'), 'wb') as f:
+            f.write(jpeg)
+
+    def _write_segment(self, t, jpeg, data):
+        if self.segment_file is not None and self.segment_file.tell() >= self.segment_size:
+            self.segment_file.close()
+            self.segment_file = None
+            self.segment += 1
+        if self.segment_file is None:
+            # Reprise d'un enregistrement existant : on ajoute à la suite du dernier segment
+            while os.path.exists(os.path.join(self.path, SEGMENT_NAME.format(self.segment + 1))):
+                self.segment += 1
+            self.segment_file = open(os.path.join(self.path, SEGMENT_NAME.format(self.segment)), 'ab')
+        meta = b''
+        if data is not None:
+            meta = json.dumps({k: v for k, v in data.items() if k != 'image'}, separators=(',', ':')).encode()
+        offset = self.segment_file.tell()
+        self.segment_file.write(jpeg)
+        self.segment_file.write(meta)
+        # Le segment est vidé avant l'écriture de l'index : une entrée d'index pointe toujours sur des données écrites
+        self.segment_file.flush()
+        record = np.array([(t, self.segment, offset, len(jpeg), len(meta))], dtype=INDEX_DTYPE)
+        self.index_file.write(record.tobytes())
+        if self.queue.empty():
+            self.index_file.flush()
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.format == 'segments':
+            if self.segment_file is not None:
+                self.segment_file.close()
+            self.index_file.close()
+
+
+# Lecture d'un enregistrement au format 'segments'
+class SegmentRecording():
+    def __init__(self, path):
+        self.path = path
+        self.refresh()
+
+    # Relit l'index (utile pour suivre un enregistrement en cours)
+    def refresh(self):
+        self._segments = {}
+        index_path = os.path.join(self.path, INDEX_FILE)
+        size = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+        if size > 0:
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(size,))
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def timestamps(self):
+        return self.index['t']
+
+    def _read(self, i):
+        entry = self.index[i]
+        segment = int(entry['segment'])
+        if segment not in self._segments:
+            self._segments[segment] = np.memmap(os.path.join(self.path, SEGMENT_NAME.format(segment)),
+                                                dtype=np.uint8, mode='r')
+        data = self._segments[segment]
+        start = int(entry['offset'])
+        image_end = start + int(entry['image_len'])
+        jpeg = data[start:image_end]
+        meta = bytes(data[image_end:image_end + int(entry['meta_len'])])
+        return float(entry['t']), jpeg, json.loads(meta) if meta else {}
+
+    def jpeg(self, i):
+        return bytes(self._read(i)[1])
+
+    def telemetry(self, i):
+        return self._read(i)[2]
+
+    # Image RGB décodée de la trame i
+    def image(self, i):
+        return cv2.cvtColor(cv2.imdecode(self._read(i)[1], cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+
+    def __getitem__(self, i):
+        t, jpeg, meta = self._read(i)
+        return t, cv2.cvtColor(cv2.imdecode(jpeg, cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB), meta
+
+    def frames(self, start=0, stop=None):
+        for i in range(start, len(self) if stop is None else stop):
+            yield self[i]
+
+    # Trames au format du journal de télémétrie (instant, dictionnaire avec l'image en base64),
+    # pour le rejeu avec replay.py
+    def telemetry_frames(self):
+        for i in range(len(self)):
+            t, jpeg, meta = self._read(i)
+            data = dict(meta)
+            data['image'] = base64.b64encode(bytes(jpeg)).decode('utf-8')
+            yield t, data
+
+    # Poses (x, y, lacet, tangage, roulis) lues dans la télémétrie enregistrée ; NaN si absente
+    def poses(self):
+        poses = np.full((len(self), 5), np.nan)
+        for i in range(len(self)):
+            meta = self._read(i)[2]
+            if 'position' in meta:
+                x, y = (float(v.replace(',', '.')) for v in meta['position'].split(';'))
+                poses[i] = (x, y) + tuple(float(meta[k].replace(',', '.')) for k in ('yaw', 'pitch', 'roll'))
+        return poses
+
+
+# Lecture d'un dossier d'images JPEG (format 'jpg', sans télémétrie)
+class JpgRecording():
+    def __init__(self, path):
+        self.path = path
+        self.files = sorted(f for f in os.listdir(path) if f.lower().endswith(('.jpg', '.jpeg')))
+
+    def __len__(self):
+        return len(self.files)
+
+    def image(self, i):
+        return cv2.cvtColor(cv2.imread(os.path.join(self.path, self.files[i])), cv2.COLOR_BGR2RGB)
+
+    def __getitem__(self, i):
+        return None, self.image(i), {}
+
+    def frames(self, start=0, stop=None):
+        for i in range(start, len(self) if stop is None else stop):
+            yield self[i]
+
+
+def open_recording(path):
+    if os.path.exists(os.path.join(path, INDEX_FILE)):
+        return SegmentRecording(path)
+    return JpgRecording(path)
@@ -0,0 +1,295 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from perception import perception_step, get_perception_kernel, LutSegmenter, PERCEPTION_MODES
+from decision import decision_step
+from supporting_functions import update_rover, create_output_images, OutputImageWorker
+from rover_state import RoverState, load_ground_truth, GROUND_TRUTH_PATH
+from telemetry_log import TelemetryRecorder, read_telemetry_log
+from fake_sim import FakeSimulator
+from worldmap import make_worldmap
+from map_fusion import MapFusion, WEIGHTINGS
+from recorder import open_recording
+from exploration import ExplorationPlanner
+from costmap import ClearanceMap
+from pose_fusion import PoseAwareFusion
+from scoring import RunScore
+
+# Rejoue un journal de télémétrie (ou un simulateur factice) à travers la chaîne
+# update_rover -> perception_step -> decision_step -> create_output_images, sans serveur socketio,
+# et mesure la latence de chaque étape.
+# Exemples :
+#   $ python replay.py course.log.gz
+#   $ python replay.py dossier_segments/
+#   $ python replay.py course.log.gz --realtime --perception mon_module:perception_step
+#   $ python replay.py --fake 500 --record synthetique.log.gz
+
+STAGES = ('update_rover', 'perception', 'decision', 'output_images')
+
+
+class StageStats():
+    def __init__(self):
+        self.durations = {stage: [] for stage in STAGES}
+        self.allocations = {stage: [] for stage in STAGES}
+        self.blocks = {stage: [] for stage in STAGES}
+        self.frames = 0
+        self.invalid_frames = 0
+        self.wall_time = 0.0
+
+    # `allocated` : pic de mémoire allouée pendant l'étape (octets, tracemalloc) ; `blocks` : nombre de blocs
+    # alloués par l'étape et encore en vie à sa fin (allocations moins libérations, sys.getallocatedblocks)
+    def add(self, stage, duration, allocated=None, blocks=None):
+        self.durations[stage].append(duration)
+        if allocated is not None:
+            self.allocations[stage].append(allocated)
+        if blocks is not None:
+            self.blocks[stage].append(blocks)
+
+    def summary(self):
+        result = {'frames': self.frames, 'invalid_frames': self.invalid_frames, 'stages': {}}
+        pipeline_time = 0.0
+        for stage in STAGES:
+            durations = np.asarray(self.durations[stage]) * 1e3
+            if len(durations) == 0:
+                continue
+            pipeline_time += durations.sum() / 1e3
+            p50, p95, p99 = np.percentile(durations, [50, 95, 99])
+            stats = {'n': len(durations), 'mean_ms': durations.mean(), 'p50_ms': p50, 'p95_ms': p95,
+                     'p99_ms': p99, 'max_ms': durations.max()}
+            if self.allocations[stage]:
+                stats['peak_alloc_kib'] = np.mean(self.allocations[stage]) / 1024
+            if self.blocks[stage]:
+                stats['alloc_blocks'] = np.mean(self.blocks[stage])
+            result['stages'][stage] = {k: v if k == 'n' else round(float(v), 4) for k, v in stats.items()}
+        result['pipeline_fps'] = round(self.frames / pipeline_time, 1) if pipeline_time > 0 else None
+        result['wall_fps'] = round(self.frames / self.wall_time, 1) if self.wall_time > 0 else None
+        return result
+
+
+def format_report(summary):
+    lines = ['{:<15}{:>7}{:>10}{:>10}{:>10}{:>10}{:>10}{:>12}{:>10}'.format(
+        'étape', 'n', 'moy ms', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms', 'pic Kio', 'blocs')]
+    for stage, s in summary['stages'].items():
+        alloc = '{:.1f}'.format(s['peak_alloc_kib']) if 'peak_alloc_kib' in s else '-'
+        blocks = '{:.1f}'.format(s['alloc_blocks']) if 'alloc_blocks' in s else '-'
+        lines.append('{:<15}{:>7}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>12}{:>10}'.format(
+            stage, s['n'], s['mean_ms'], s['p50_ms'], s['p95_ms'], s['p99_ms'], s['max_ms'], alloc, blocks))
+    for mode, s in summary.get('perception_modes', {}).items():
+        lines.append('{:<15}{:>7}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>10.3f}{:>12}{:>10}'.format(
+            'perception ' + mode, s['n'], s['mean_ms'], s['p50_ms'], s['p95_ms'], s['p99_ms'], s['max_ms'], '-', '-'))
+    lines.append('trames : {}  (non valides : {})'.format(summary['frames'], summary['invalid_frames']))
+    if 'score' in summary:
+        score = summary['score']
+        lines.append('carte : {} %  fidélité : {} %  échantillons localisés : {}  collectés : {}'.format(
+            score['perc_mapped'], score['fidelity'], score['samples_located'], score['samples_collected']))
+    lines.append('FPS chaîne : {}  FPS mur : {}'.format(summary['pipeline_fps'], summary['wall_fps']))
+    return '\n'.join(lines)
+
+
+# Charge une étape alternative sous la forme "module:fonction"
+def load_step(spec):
+    module_name, function_name = spec.split(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _timed(stats, stage, trace_allocations, function, *args):
+    if trace_allocations:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        blocks_before = sys.getallocatedblocks()
+    start = time.perf_counter()
+    result = function(*args)
+    duration = time.perf_counter() - start
+    if trace_allocations:
+        blocks = sys.getallocatedblocks() - blocks_before
+        stats.add(stage, duration, tracemalloc.get_traced_memory()[1] - before, blocks)
+    else:
+        stats.add(stage, duration)
+    return result
+
+
+# Trames d'un simulateur factice en boucle fermée : les commandes du rover font avancer la simulation
+def fake_frames(sim, count):
+    for _ in range(count):
+        yield sim.t, sim.telemetry()
+
+
+def replay(frames, Rover, perception=perception_step, decision=decision_step, realtime=False,
+           render=True, trace_allocations=False, sim=None, max_frames=None, output=create_output_images):
+    stats = StageStats()
+    if trace_allocations:
+        tracemalloc.start()
+    wall_start = time.monotonic()
+    first_t = None
+    # Horloge du rover : instant de la trame rejouée (temps simulé avec --fake), pour des rejeux reproductibles
+    now = [0.0]
+    Rover.clock = lambda: now[0]
+    try:
+        for t, data in frames:
+            if max_frames is not None and stats.frames >= max_frames:
+                break
+            now[0] = t
+            if realtime:
+                if first_t is None:
+                    first_t = t
+                delay = (t - first_t) - (time.monotonic() - wall_start)
+                if delay > 0:
+                    time.sleep(delay)
+            stats.frames += 1
+
+            Rover, image = _timed(stats, 'update_rover', trace_allocations, update_rover, Rover, data)
+            if not np.isfinite(Rover.vel):
+                stats.invalid_frames += 1
+                continue
+            Rover = _timed(stats, 'perception', trace_allocations, perception, Rover)
+            Rover = _timed(stats, 'decision', trace_allocations, decision, Rover)
+            if Rover.score is not None:
+                Rover.score.update(Rover)
+            if render:
+                _timed(stats, 'output_images', trace_allocations, output, Rover)
+
+            if sim is not None:
+                if Rover.send_pickup and not Rover.picking_up:
+                    sim.pickup()
+                    Rover.send_pickup = False
+                sim.step((Rover.throttle, Rover.brake, Rover.steer))
+    finally:
+        stats.wall_time = time.monotonic() - wall_start
+        if trace_allocations:
+            tracemalloc.stop()
+    return stats, Rover
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rejeu hors ligne de la télémétrie et banc de mesure')
+    parser.add_argument('log', nargs='?', default='',
+                        help="Journal de télémétrie (.log.gz) ou dossier d'enregistrement 'segments' à rejouer")
+    parser.add_argument('--fake', type=int, default=0,
+                        help="Nombre de trames à générer avec le simulateur factice au lieu d'un journal")
+    parser.add_argument('--seed', type=int, default=0, help='Graine de la carte synthétique du simulateur factice')
+    parser.add_argument('--ground-truth', default=GROUND_TRUTH_PATH, help='Carte de vérité terrain')
+    parser.add_argument('--realtime', action='store_true', help='Respecter la cadence enregistrée')
+    parser.add_argument('--frames', type=int, default=None, help='Nombre maximal de trames rejouées')
+    parser.add_argument('--no-output', action='store_true', help='Ne pas produire les images de sortie')
+    parser.add_argument('--allocations', action='store_true',
+                        help=("Mesurer par étape le pic moyen de mémoire allouée (Kio, tracemalloc) et le nombre "
+                              "moyen de blocs alloués encore en vie à la fin de l'étape (plus lent)"))
+    parser.add_argument('--world-size', type=int, default=200, help='Taille de la carte (cellules)')
+    parser.add_argument('--cell-size', type=float, default=1.0, help="Taille d'une cellule de la carte (mètres)")
+    parser.add_argument('--map-dtype', default='float64', help='Type des canaux de la carte (float64, uint16...)')
+    parser.add_argument('--tiled-map', action='store_true', help='Carte par tuiles allouées à la demande')
+    parser.add_argument('--map-weighting', choices=WEIGHTINGS, default='none',
+                        help='Pondération des détections fusionnées : none (compteurs) ou distance')
+    parser.add_argument('--log-odds', action='store_true', help="Tenir à jour une grille d'occupation en log-odds")
+    parser.add_argument('--inset-rate', type=float, default=0,
+                        help="Cadence (Hz) des images d'incrustation produites en arrière-plan (0 : synchrone)")
+    parser.add_argument('--explore', action='store_true', help="Activer le planificateur d'exploration par frontières")
+    parser.add_argument('--clearance', action='store_true',
+                        help='Activer la carte de dégagement (ralentir et contourner les obstacles)')
+    parser.add_argument('--rock-seek-distance', type=float, default=0,
+                        help='Distance (m) des rochers connus hors champ à rejoindre (0 : désactivé)')
+    parser.add_argument('--max-tilt', type=float, default=0,
+                        help="Corriger la perspective jusqu'à cette inclinaison (degrés, 0 : trames inclinées ignorées)")
+    parser.add_argument('--pose-latency', type=float, default=0,
+                        help="Retard de l'image sur la télémétrie (trames) : pose interpolée, avec --max-tilt")
+    parser.add_argument('--perception-mode', choices=sorted(PERCEPTION_MODES) + ['auto'], default='full',
+                        help='Mode de perception (voir perception.PERCEPTION_MODES)')
+    parser.add_argument('--perception-budget', type=float, default=0,
+                        help="Coût médian maximal (ms) d'une trame en mode auto (0 : pas de limite)")
+    parser.add_argument('--color-lut', default='', help='Table de couleurs apprise (calibrate_colors.py)')
+    parser.add_argument('--perception', default=None, help='Étape de perception alternative (module:fonction)')
+    parser.add_argument('--decision', default=None, help='Étape de décision alternative (module:fonction)')
+    parser.add_argument('--score-log', default='', help='Relever le score de la course dans ce fichier (lignes JSON)')
+    parser.add_argument('--score-report', default='', help='Écrire le rapport de score (JSON) dans ce fichier')
+    parser.add_argument('--record', default='', help='Enregistrer la télémétrie rejouée dans ce journal')
+    parser.add_argument('--json', default='', help='Écrire le rapport au format JSON dans ce fichier')
+    args = parser.parse_args()
+
+    if not args.log and not args.fake:
+        parser.error('indiquez un journal à rejouer ou --fake N')
+
+    sim = None
+    if args.fake:
+        ground_truth = None
+        if os.path.exists(args.ground_truth):
+            ground_truth = load_ground_truth(args.ground_truth)
+        sim = FakeSimulator(ground_truth, seed=args.seed)
+        if ground_truth is None:
+            gt = sim.ground_truth.astype(float)
+            ground_truth = np.dstack((gt * 0, gt * 255, gt * 0))
+        frames = fake_frames(sim, args.fake)
+    else:
+        ground_truth = None
+        if os.path.exists(args.ground_truth):
+            ground_truth = load_ground_truth(args.ground_truth)
+        elif not args.no_output:
+            print("Carte de vérité terrain introuvable : images de sortie désactivées")
+            args.no_output = True
+        if os.path.isdir(args.log):
+            frames = open_recording(args.log).telemetry_frames()
+        else:
+            frames = read_telemetry_log(args.log)
+
+    recorder = None
+    if args.record:
+        recorder = TelemetryRecorder(args.record)
+        frames = ((t, recorder.write(data, t) or data) for t, data in frames)
+
+    perception = load_step(args.perception) if args.perception else perception_step
+    decision = load_step(args.decision) if args.decision else decision_step
+    output_worker = OutputImageWorker(args.inset_rate) if args.inset_rate > 0 else None
+    output = output_worker.update if output_worker is not None else create_output_images
+    Rover = None
+    try:
+        worldmap = make_worldmap(args.world_size, args.cell_size, args.map_dtype, tiled=args.tiled_map)
+        Rover = RoverState(ground_truth, worldmap)
+        Rover.map_fusion = MapFusion(args.map_weighting, log_odds=args.log_odds)
+        if args.explore:
+            Rover.explorer = ExplorationPlanner(worldmap)
+        if args.clearance:
+            Rover.costmap = ClearanceMap(worldmap)
+        Rover.rock_seek_distance = args.rock_seek_distance
+        Rover.perception_mode = args.perception_mode
+        if args.perception_budget > 0:
+            Rover.perception_budget = args.perception_budget / 1000
+        if args.color_lut:
+            Rover.segmenter = LutSegmenter(path=args.color_lut)
+        if args.max_tilt > 0:
+            Rover.pose_fusion = PoseAwareFusion(get_perception_kernel((160, 320, 3)), max_tilt=args.max_tilt,
+                                                latency=args.pose_latency, cell_size=args.cell_size)
+        if ground_truth is not None:
+            Rover.score = RunScore(Rover, log_path=args.score_log)
+        stats, Rover = replay(frames, Rover, perception, decision, realtime=args.realtime,
+                              render=not args.no_output, trace_allocations=args.allocations, sim=sim,
+                              max_frames=args.frames, output=output)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if output_worker is not None:
+            output_worker.close()
+        if Rover is not None and Rover.score is not None:
+            Rover.score.close()
+
+    summary = stats.summary()
+    # Coût de la perception par mode (fenêtre des dernières trames de chaque mode)
+    if Rover.perception_costs:
+        summary['perception_modes'] = {mode: costs.summary() for mode, costs in sorted(Rover.perception_costs.items())}
+    if Rover.score is not None:
+        summary['score'] = Rover.score.report(Rover)['final']
+        if args.score_report:
+            Rover.score.write_report(args.score_report, Rover, {'log': args.log, 'fake': args.fake, 'seed': args.seed})
+    print(format_report(summary))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
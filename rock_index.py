@@ -0,0 +1,137 @@
+import numpy as np
+
+# Index persistant des détections de rochers.
+# Les pixels de rochers projetés dans le monde sont d'abord regroupés par case d'une grille de hachage
+# (une opération vectorisée par trame), puis chaque case est rattachée au groupe dont le centroïde
+# est à moins de `radius` mètres, cherché dans les cases voisines, ou crée un nouveau groupe.
+# Les centroïdes sont mis à jour incrémentalement (sommes et effectifs) et un groupe n'est comparé
+# aux positions d'échantillons connues que lorsqu'il est créé ou déplacé : le coût d'une trame
+# dépend du nombre de nouvelles détections, pas de la taille de la carte.
+
+
+class RockIndex():
+    def __init__(self, radius=1.5, match_radius=3.0):
+        self.radius = radius  # Rayon de regroupement des détections (mètres)
+        self.match_radius = match_radius  # Distance maximale à un échantillon connu pour le localiser
+        self.grid = {}  # Case de la grille -> indices des groupes dont le centroïde y tombe
+        self.sum_x = []
+        self.sum_y = []
+        self.count = []
+        self.visited = []
+        self.matched = []  # Indice de l'échantillon associé à chaque groupe (-1 : aucun)
+        self.samples_pos = None
+        self.located = None  # Échantillons connus localisés par au moins un groupe
+
+    def __len__(self):
+        return len(self.count)
+
+    def set_samples(self, samples_pos):
+        self.samples_pos = (np.asarray(samples_pos[0], dtype=float), np.asarray(samples_pos[1], dtype=float))
+        self.located = np.zeros(len(self.samples_pos[0]), dtype=bool)
+        self.matched = [-1] * len(self)
+        for cluster in range(len(self)):
+            self._match(cluster)
+
+    @property
+    def samples_located(self):
+        return 0 if self.located is None else int(np.count_nonzero(self.located))
+
+    def centroid(self, cluster):
+        return self.sum_x[cluster] / self.count[cluster], self.sum_y[cluster] / self.count[cluster]
+
+    def centroids(self):
+        if len(self) == 0:
+            return np.zeros((0, 2))
+        return np.column_stack((self.sum_x, self.sum_y)) / np.asarray(self.count, dtype=float)[:, None]
+
+    def _key(self, x, y):
+        return int(np.floor(x / self.radius)), int(np.floor(y / self.radius))
+
+    def _find(self, x, y):
+        kx, ky = self._key(x, y)
+        best, best_dist = None, self.radius
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for cluster in self.grid.get((kx + dx, ky + dy), ()):
+                    cx, cy = self.centroid(cluster)
+                    dist = np.hypot(cx - x, cy - y)
+                    if dist < best_dist:
+                        best, best_dist = cluster, dist
+        return best
+
+    def _match(self, cluster):
+        if self.samples_pos is None or self.matched[cluster] >= 0:
+            return
+        cx, cy = self.centroid(cluster)
+        dists = np.hypot(self.samples_pos[0] - cx, self.samples_pos[1] - cy)
+        if len(dists) > 0 and dists.min() < self.match_radius:
+            self.matched[cluster] = int(np.argmin(dists))
+            self.located[self.matched[cluster]] = True
+
+    # État sérialisable (JSON) des groupes, relu par restore
+    def state(self):
+        return {'radius': self.radius, 'sum_x': list(self.sum_x), 'sum_y': list(self.sum_y),
+                'count': list(self.count), 'visited': list(self.visited)}
+
+    # Remplace les groupes par ceux d'un état enregistré ; les associations aux échantillons sont recalculées
+    def restore(self, state):
+        if state['radius'] != self.radius:
+            raise ValueError("Index des rochers enregistré avec un autre rayon de regroupement")
+        self.sum_x = [float(v) for v in state['sum_x']]
+        self.sum_y = [float(v) for v in state['sum_y']]
+        self.count = [int(v) for v in state['count']]
+        self.visited = [bool(v) for v in state['visited']]
+        self.matched = [-1] * len(self)
+        self.grid = {}
+        for cluster in range(len(self)):
+            self.grid.setdefault(self._key(*self.centroid(cluster)), []).append(cluster)
+        if self.samples_pos is not None:
+            self.set_samples(self.samples_pos)
+
+    # Ajoute les détections d'une trame (coordonnées monde en mètres)
+    def add(self, x_world, y_world):
+        if len(x_world) == 0:
+            return
+        # Agrégation par case : sommes et effectifs en un seul passage vectorisé
+        keys = np.column_stack((np.floor(x_world / self.radius), np.floor(y_world / self.radius))).astype(np.int64)
+        keys, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.ravel()
+        sums_x = np.bincount(inverse, x_world, minlength=len(keys))
+        sums_y = np.bincount(inverse, y_world, minlength=len(keys))
+        for sx, sy, n in zip(sums_x, sums_y, counts):
+            x, y = sx / n, sy / n
+            cluster = self._find(x, y)
+            if cluster is None:
+                cluster = len(self)
+                self.sum_x.append(0.0)
+                self.sum_y.append(0.0)
+                self.count.append(0)
+                self.visited.append(False)
+                self.matched.append(-1)
+            else:
+                self.grid[self._key(*self.centroid(cluster))].remove(cluster)
+            self.sum_x[cluster] += sx
+            self.sum_y[cluster] += sy
+            self.count[cluster] += int(n)
+            self.grid.setdefault(self._key(*self.centroid(cluster)), []).append(cluster)
+            self._match(cluster)
+
+    # Groupe non visité le plus proche de (x, y) : (indice, x, y, distance), ou None
+    def nearest_unvisited(self, x, y, max_distance=np.inf):
+        if len(self) == 0:
+            return None
+        centroids = self.centroids()
+        dists = np.hypot(centroids[:, 0] - x, centroids[:, 1] - y)
+        dists[np.asarray(self.visited)] = np.inf
+        cluster = int(np.argmin(dists))
+        # Tous visités : distances toutes infinies, argmin désignerait le groupe 0
+        if not np.isfinite(dists[cluster]) or dists[cluster] > max_distance:
+            return None
+        return cluster, centroids[cluster, 0], centroids[cluster, 1], float(dists[cluster])
+
+    # Marque comme visités les groupes à moins de `radius` mètres (après un ramassage)
+    def mark_visited(self, x, y, radius=3.0):
+        for cluster in range(len(self)):
+            cx, cy = self.centroid(cluster)
+            if np.hypot(cx - x, cy - y) < radius:
+                self.visited[cluster] = True
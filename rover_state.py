@@ -0,0 +1,87 @@
+import time
+import numpy as np
+from assets import ground_truth_assets
+from perception import ColorSegmenter
+from map_fusion import MapFusion
+from rock_index import RockIndex
+from worldmap import make_worldmap
+
+# Chemin par défaut de la carte de vérité terrain
+GROUND_TRUTH_PATH = '../calibration_images/map_bw.jpg'
+
+
+# Lisez la carte de vérité terrain et créez une version verte en 3 canaux pour la superposition
+# REMARQUE : les images sont lues par défaut avec l'origine (0, 0) en haut à gauche
+# et l'axe des y augmentant vers le bas.
+# La version 3 canaux est calculée une fois puis relue en lecture seule depuis le cache (voir assets.py).
+def load_ground_truth(path=GROUND_TRUTH_PATH):
+    return ground_truth_assets(path).rgb
+
+
+# Définissez la classe RoverState() pour conserver les paramètres d'état du rover
+class RoverState():
+    def __init__(self, ground_truth=None, worldmap=None):
+        self.start_time = None  # Pour enregistrer l'heure de début de la navigation
+        self.total_time = None  # Pour enregistrer la durée totale de la navigation
+        self.clock = time.monotonic  # Horloge (secondes) des durées ; remplacée par le temps des trames lors d'un rejeu
+        self.stuck_time = None  # Début de la période sans avancer (détection de blocage)
+        self.img = None  # Image de caméra actuelle
+        self.pos = None  # Position actuelle (x, y)
+        self.yaw = None  # Angle de lacet actuel
+        self.pitch = None  # Angle de tangage actuel
+        self.roll = None  # Angle de roulis actuel
+        self.vel = None  # Vitesse actuelle
+        self.steer = 0  # Angle de direction actuel
+        self.throttle = 0  # Valeur actuelle de l'accélération
+        self.brake = 0  # Valeur actuelle du frein
+        self.nav_angles = None  # Angles des pixels de terrain navigable
+        self.nav_dists = None  # Distances des pixels de terrain navigable
+        self.ground_truth = ground_truth  # Carte du monde de vérité terrain
+        self.mode = 'forward'  # Mode actuel (peut être "forward" ou "stop")
+        self.nav_area = 0
+        self.stop_forward = 50  # Seuil pour initier l'arrêt
+        self.go_forward = 500  # Seuil pour avancer à nouveau
+        self.max_vel = 2  # Vitesse maximale (mètres/seconde)
+        self.throttle_set = 0.2  # Accélération en marche avant
+        self.brake_set = 10  # Freinage pour s'arrêter
+        self.max_steer = 15  # Braquage maximal (degrés)
+        self.wall_bias = 0.1  # Décalage (radians) ajouté aux angles navigables pour longer les murs
+        self.stuck_timeout = 2  # Durée (secondes) sans avancer avant de se déclarer bloqué
+
+        self.vision_image = np.zeros((160, 320, 3), dtype=np.uint8)
+        self.segmenter = ColorSegmenter()  # Segmentation couleur (seuils configurables)
+        # Modes de perception (voir perception.PERCEPTION_MODES) : 'full', 'roi', 'fast' ou 'auto'
+        self.perception_mode = 'full'
+        self.fast_speed = 1.5  # En mode 'auto', vitesse (m/s) à partir de laquelle la demi-résolution est utilisée
+        self.perception_budget = None  # En mode 'auto', coût médian maximal (secondes) d'une trame
+        self.perception_costs = {}  # Coût des dernières trames par mode (metrics.RollingHistogram)
+        self.perception_recent = {}  # Coûts (secondes) des toutes dernières trames par mode, pour le mode 'auto'
+        self.perception_cost = 0.0  # Coût de la dernière trame (secondes)
+        self.perception_frames = 0
+        self.perception_mode_used = None  # Mode de la dernière trame (et de l'image de vision)
+        self.nav_pixel_area = 1  # Pixels de la vue complète représentés par chaque pixel de nav_angles
+
+        # Carte du monde (dense 200 x 200 x 3 par défaut, voir worldmap.py pour les autres modes)
+        self.worldmap = worldmap if worldmap is not None else make_worldmap()
+        self.map_dirty = self.worldmap.track()  # Région de la carte modifiée depuis le dernier rendu
+        self.map_fusion = MapFusion()  # Fusion des détections dans la carte (pondération, log-odds)
+        self.explorer = None  # Planificateur d'exploration par frontières (facultatif, voir exploration.py)
+        self.pose_fusion = None  # Correction de l'inclinaison et pondération par la pose (facultative, voir pose_fusion.py)
+        self.map_renderer = None  # Rendu incrémental de la carte (créé à la première image de sortie)
+        self.score = None  # Score de la course par rapport à la vérité terrain (facultatif, voir scoring.py)
+        self.samples_pos = None  # Pour stocker les positions d'échantillons réelles
+        self.samples_to_find = 0  # Pour stocker le nombre initial d'échantillons
+        self.samples_located = 0  # Pour stocker le nombre d'échantillons situés sur la carte
+        self.rock_index = RockIndex()  # Positions candidates des rochers détectés (voir rock_index.py)
+        self.rock_seek_distance = 0  # Distance (mètres) d'un rocher connu hors champ à rejoindre (0 : désactivé)
+        self.samples_collected = 0  # Pour compter le nombre d'échantillons collectés
+        self.near_sample = 0  # Sera défini sur la valeur de télémétrie data["near_sample"]
+        self.picking_up = 0  # Sera défini sur la valeur de télémétrie data["picking_up"]
+        self.send_pickup = False  # Défini sur True pour déclencher la collecte de rochers
+        self.samples_dists = np.asarray([])
+        self.samples_angles = np.asarray([])
+        self.dist_to_obstacle = 0  # Dégagement devant le rover (mètres, calculé si costmap est défini)
+        self.costmap = None  # Carte de dégagement (facultative, voir costmap.py)
+        self.slow_distance = 4.0  # Dégagement en deçà duquel on ralentit et contourne (mètres)
+        self.stop_distance = 1.5  # Dégagement en deçà duquel on s'arrête (mètres)
+        self.decoder = None  # Décodeur de télémétrie de la session (créé à la première trame)
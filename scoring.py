@@ -0,0 +1,173 @@
+import argparse
+import json
+
+import numpy as np
+
+from worldmap import GroundTruthGrid, split_bbox
+
+# Score d'une course par rapport à la vérité terrain.
+# MapScorer tient à jour les compteurs de cellules navigables cartographiées (total, bonnes, mauvaises)
+# à partir des seules régions modifiées de la carte : une cellule change d'état quand son compteur
+# navigable devient non nul, et seule la différence avec l'état précédent de la région est comptée.
+# La vérité terrain est lue région par région sur la grille de la carte (worldmap.GroundTruthGrid) et les
+# cellules connues sont tenues dans une carte de même implémentation : avec une carte par tuiles, la
+# mémoire suit la surface explorée.
+# Il est utilisé par MapRenderer pour l'affichage, et par RunScore qui relève une série temporelle
+# (pourcentage cartographié, fidélité, échantillons localisés et collectés) et produit un rapport JSON
+# comparable d'une course à l'autre :
+#   $ python scoring.py course_a.json course_b.json
+
+
+class MapScorer():
+    # `grid` : GroundTruthGrid de la carte ; `worldmap` : carte suivie directement (update) ; sans elle,
+    # les régions sont fournies à apply
+    def __init__(self, grid, worldmap=None):
+        self.grid = grid
+        self.tot_map_pix = float(grid.nav_pixels)
+        self.worldmap = worldmap
+        self.dirty = None
+        if worldmap is not None:
+            self.dirty = worldmap.track()
+            # Premier relevé sur la carte entière (carte éventuellement déjà remplie, reprise)
+            self.dirty.add_bbox(0, worldmap.size, 0, worldmap.size)
+        self.reset()
+
+    def reset(self):
+        self.known = self.grid.new_map(bool, 1)  # Cellules cartographiées comme navigables
+        self.tot_nav_pix = 0
+        self.good_nav_pix = 0
+
+    @property
+    def bad_nav_pix(self):
+        return self.tot_nav_pix - self.good_nav_pix
+
+    # Nouvelles valeurs du canal navigable dans la région (y0, y1, x0, x1)
+    def apply(self, bbox, navigable):
+        old_known = self.known.region(*bbox)[:, :, 0]
+        new_known = navigable > 0
+        gt_nav = self.grid.nav(*bbox)
+        self.tot_nav_pix += int(np.count_nonzero(new_known)) - int(np.count_nonzero(old_known))
+        self.good_nav_pix += int(np.count_nonzero(new_known & gt_nav)) - int(np.count_nonzero(old_known & gt_nav))
+        self.known.set_region(bbox[0], bbox[2], new_known[:, :, None])
+
+    # Relève la région de la carte suivie modifiée depuis le dernier appel (par blocs, pour borner les copies
+    # lors du premier relevé sur la carte entière)
+    def update(self):
+        bbox = self.dirty.take()
+        if bbox is not None:
+            for block in split_bbox(bbox, 256):
+                self.apply(block, self.worldmap.region(*block)[:, :, 2])
+
+    def perc_mapped(self):
+        return round(100 * self.good_nav_pix / self.tot_map_pix, 1)
+
+    def fidelity(self):
+        if self.tot_nav_pix > 0:
+            return round(100 * self.good_nav_pix / self.tot_nav_pix, 1)
+        return 0
+
+
+# Seuils (%) de carte couverte dont le rapport donne l'instant d'atteinte
+COVERAGE_THRESHOLDS = (10, 20, 30, 40, 50, 60, 70, 80, 90)
+SERIES_FIELDS = ('t', 'perc_mapped', 'fidelity', 'mapped_cells', 'bad_cells', 'samples_located', 'samples_collected')
+
+
+# Score d'une course : série temporelle (un relevé toutes les `interval` secondes de course, écrit au fil
+# de l'eau en lignes JSON dans `log_path` si indiqué) et rapport final
+class RunScore():
+    def __init__(self, Rover, interval=1.0, log_path=''):
+        self.scorer = MapScorer(GroundTruthGrid(Rover.ground_truth, Rover.worldmap), Rover.worldmap)
+        self.interval = interval
+        self.series = {field: [] for field in SERIES_FIELDS}
+        self.last_sample = None
+        self.time_to_mapped = {}  # Seuil -> premier instant où il est atteint
+        self.time_to_located = []  # Instant de la n-ième localisation d'échantillon
+        self.time_to_collected = []
+        self.samples_to_find = 0
+        self.log = open(log_path, 'w') if log_path else None
+
+    def _row(self, Rover):
+        scorer = self.scorer
+        return {'t': round(float(Rover.total_time or 0.0), 3), 'perc_mapped': scorer.perc_mapped(),
+                'fidelity': scorer.fidelity(), 'mapped_cells': scorer.tot_nav_pix, 'bad_cells': scorer.bad_nav_pix,
+                'samples_located': Rover.rock_index.samples_located, 'samples_collected': int(Rover.samples_collected)}
+
+    # À appeler après chaque décision
+    def update(self, Rover):
+        self.scorer.update()
+        t = float(Rover.total_time or 0.0)
+        self.samples_to_find = int(Rover.samples_to_find)
+        perc_mapped = self.scorer.perc_mapped()
+        for threshold in COVERAGE_THRESHOLDS:
+            if threshold not in self.time_to_mapped and perc_mapped >= threshold:
+                self.time_to_mapped[threshold] = round(t, 3)
+        while len(self.time_to_located) < Rover.rock_index.samples_located:
+            self.time_to_located.append(round(t, 3))
+        while len(self.time_to_collected) < Rover.samples_collected:
+            self.time_to_collected.append(round(t, 3))
+        if self.last_sample is None or t - self.last_sample >= self.interval:
+            self.sample(Rover)
+
+    def sample(self, Rover):
+        row = self._row(Rover)
+        self.last_sample = row['t']
+        for field in SERIES_FIELDS:
+            self.series[field].append(row[field])
+        if self.log is not None:
+            self.log.write(json.dumps(row, separators=(',', ':')) + '\n')
+            self.log.flush()
+
+    def report(self, Rover=None, meta=None):
+        if Rover is not None:
+            final = self._row(Rover)
+        elif self.series['t']:
+            final = {field: self.series[field][-1] for field in SERIES_FIELDS}
+        else:
+            final = {}
+        final['samples_to_find'] = self.samples_to_find
+        return {
+            'meta': meta or {},
+            'final': final,
+            'time_to_mapped': {str(k): self.time_to_mapped.get(k) for k in COVERAGE_THRESHOLDS},
+            'time_to_located': self.time_to_located,
+            'time_to_collected': self.time_to_collected,
+            'series': self.series,
+        }
+
+    def write_report(self, path, Rover=None, meta=None):
+        with open(path, 'w') as f:
+            json.dump(self.report(Rover, meta), f, indent=1)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+
+def format_comparison(reports, names):
+    lines = ['{:<24}{:>9}{:>9}{:>9}{:>11}{:>11}{:>11}'.format(
+        'course', 'durée s', 'carte %', 'fidél. %', 't 50 % s', 'localisés', 'collectés')]
+    for name, report in zip(names, reports):
+        final = report['final']
+        t50 = report['time_to_mapped'].get('50')
+        lines.append('{:<24}{:>9}{:>9}{:>9}{:>11}{:>11}{:>11}'.format(
+            name[-24:], final.get('t', '-'), final.get('perc_mapped', '-'), final.get('fidelity', '-'),
+            '-' if t50 is None else t50,
+            '{}/{}'.format(final.get('samples_located', 0), final.get('samples_to_find', 0)),
+            '{}/{}'.format(final.get('samples_collected', 0), final.get('samples_to_find', 0))))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Comparaison de rapports de score (JSON)')
+    parser.add_argument('reports', nargs='+', help='Rapports produits par --score-report')
+    args = parser.parse_args()
+    reports = []
+    for path in args.reports:
+        with open(path) as f:
+            reports.append(json.load(f))
+    print(format_comparison(reports, args.reports))
+
+
+if __name__ == '__main__':
+    main()
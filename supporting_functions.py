@@ -1,127 +1,105 @@
 import numpy as np
 import cv2
-from PIL import Image
-from io import BytesIO, StringIO
+from io import BytesIO
 import base64
 import time
-
-# Définir une fonction pour convertir les chaînes de télémétrie en nombres à virgule flottante, indépendamment de la convention décimale
-def convert_to_float(string_to_convert):
-    if ',' in string_to_convert:
-        float_value = np.float(string_to_convert.replace(',', '.'))
-    else:
-        float_value = np.float(string_to_convert)
-    return float_value
+from concurrent.futures import ThreadPoolExecutor
+from map_renderer import MapRenderer
+from worldmap import GroundTruthGrid
+from telemetry_decoder import TelemetryDecoder
 
 def update_rover(Rover, data):
+    # Décodeur de télémétrie de la session (format des nombres, tampons d'image)
+    if Rover.decoder is None:
+        Rover.decoder = TelemetryDecoder()
+    decoder = Rover.decoder
+    # Champs numériques de la trame (format texte ou compact, voir telemetry_decoder.py)
+    (speed, x, y, yaw, pitch, roll, throttle, steer,
+     near_sample, picking_up, sample_count) = decoder.state(data)
     # Initialiser le temps de départ et les positions des échantillons
     if Rover.start_time is None:
-        Rover.start_time = time.time()
+        Rover.start_time = Rover.clock()
         Rover.total_time = 0
-        samples_xpos = np.int_([convert_to_float(pos.strip()) for pos in data["samples_x"].split(';')])
-        samples_ypos = np.int_([convert_to_float(pos.strip()) for pos in data["samples_y"].split(';')])
-        Rover.samples_pos = (samples_xpos, samples_ypos)
-        Rover.samples_to_find = np.int(data["sample_count"])
+        samples_x, samples_y = decoder.samples(data)
+        Rover.samples_pos = (np.int_(samples_x), np.int_(samples_y))
+        Rover.rock_index.set_samples(Rover.samples_pos)
+        Rover.samples_to_find = int(sample_count)
     # Ou simplement mettre à jour le temps écoulé
     else:
-        tot_time = time.time() - Rover.start_time
+        tot_time = Rover.clock() - Rover.start_time
         if np.isfinite(tot_time):
             Rover.total_time = tot_time
     # Afficher les champs du dictionnaire de données de télémétrie
     # La vitesse actuelle du rover en m/s
-    Rover.vel = convert_to_float(data["speed"])
+    Rover.vel = speed
     # La position actuelle du rover
-    Rover.pos = [convert_to_float(pos.strip()) for pos in data["position"].split(';')]
+    Rover.pos = [x, y]
     # L'angle de lacet actuel du rover
-    Rover.yaw = convert_to_float(data["yaw"])
+    Rover.yaw = yaw
     # L'angle de tangage actuel du rover
-    Rover.pitch = convert_to_float(data["pitch"])
+    Rover.pitch = pitch
     # L'angle de roulis actuel du rover
-    Rover.roll = convert_to_float(data["roll"])
+    Rover.roll = roll
     # Paramètres de gaz actuels
-    Rover.throttle = convert_to_float(data["throttle"])
+    Rover.throttle = throttle
     # L'angle de direction actuel
-    Rover.steer = convert_to_float(data["steering_angle"])
+    Rover.steer = steer
     # Indicateur de proximité d'échantillon
-    Rover.near_sample = np.int(data["near_sample"])
+    Rover.near_sample = int(near_sample)
     # Indicateur de ramassage
-    Rover.picking_up = np.int(data["picking_up"])
+    Rover.picking_up = int(picking_up)
     # Mettre à jour le nombre de rochers collectés
-    Rover.samples_collected = Rover.samples_to_find - np.int(data["sample_count"])
+    Rover.samples_collected = Rover.samples_to_find - int(sample_count)
 
-    # Obtenir l'image actuelle de la caméra centrale du rover
-    imgString = data["image"]
-    image = Image.open(BytesIO(base64.b64decode(imgString)))
-    Rover.img = np.asarray(image)
+    # Obtenir l'image actuelle de la caméra centrale du rover, décodée dans un tampon réutilisé
+    Rover.img, image = decoder.decode_image(data["image"])
 
-    # Renvoyer Rover mis à jour et une image séparée pour une éventuelle sauvegarde
+    # Renvoyer Rover mis à jour et l'image JPEG reçue (objet PIL construit seulement si nécessaire)
     return Rover, image
 
-# Définir une fonction pour créer une sortie d'affichage en fonction des résultats de la carte du monde
-def create_output_images(Rover):
-    # Créer une carte mise à l'échelle pour le tracé et nettoyer un peu les pixels obs/nav
-    if np.max(Rover.worldmap[:, :, 2]) > 0:
-        nav_pix = Rover.worldmap[:, :, 2] > 0
-        navigable = Rover.worldmap[:, :, 2] * (255 / np.mean(Rover.worldmap[nav_pix, 2]))
-    else:
-        navigable = Rover.worldmap[:, :, 2]
-    if np.max(Rover.worldmap[:, :, 0]) > 0:
-        obs_pix = Rover.worldmap[:, :, 0] > 0
-        obstacle = Rover.worldmap[:, :, 0] * (255 / np.mean(Rover.worldmap[obs_pix, 0]))
-    else:
-        obstacle = Rover.worldmap[:, :, 0]
-
-    likely_nav = navigable >= obstacle
-    obstacle[likely_nav] = 0
-    plotmap = np.zeros_like(Rover.worldmap)
-    plotmap[:, :, 0] = obstacle
-    plotmap[:, :, 2] = navigable
-    plotmap = plotmap.clip(0, 255)
-
-    # Superposer la carte des obstacles et du terrain navigable avec la carte de vérité terrain
-    map_add = cv2.addWeighted(plotmap, 1, Rover.ground_truth, 0.5, 0)
-
-    # Vérifiez si des détections de rochers sont présentes dans la carte du monde
-    rock_world_pos = Rover.worldmap[:, :, 1].nonzero()
-    # S'il y en a, nous allons parcourir les positions d'échantillons connues
-    # pour confirmer si les détections sont réelles
-    samples_located = 0
-    if rock_world_pos[0].any():
-
-        rock_size = 2
-        for idx in range(len(Rover.samples_pos[0])):
-            test_rock_x = Rover.samples_pos[0][idx]
-            test_rock_y = Rover.samples_pos[1][idx]
-            rock_sample_dists = np.sqrt((test_rock_x - rock_world_pos[1]) ** 2 + \
-                                        (test_rock_y - rock_world_pos[0]) ** 2)
-            # Si des rochers ont été détectés à moins de 3 mètres des positions d'échantillons connues
-            # considérez-le comme un succès et tracez l'emplacement de l'échantillon connu sur la carte
-            if np.min(rock_sample_dists) < 3:
-                samples_located += 1
-                map_add[test_rock_y - rock_size:test_rock_y + rock_size,
-                        test_rock_x - rock_size:test_rock_x + rock_size, :] = 255
-
-    # Calculez certaines statistiques sur les résultats de la carte
-    # Tout d'abord, obtenez le nombre total de pixels dans la carte du terrain navigable
-    tot_nav_pix = np.float(len((plotmap[:, :, 2].nonzero()[0])))
-    # Ensuite, déterminez combien de ces pixels correspondent aux pixels de vérité terrain
-    good_nav_pix = np.float(len(((plotmap[:, :, 2] > 0) & (Rover.ground_truth[:, :, 1] > 0)).nonzero()[0]))
-    # Ensuite, trouvez combien ne correspondent pas aux pixels de vérité terrain
-    bad_nav_pix = np.float(len(((plotmap[:, :, 2] > 0) & (Rover.ground_truth[:, :, 1] == 0)).nonzero()[0]))
-    # Obtenez le nombre total de pixels de carte
-    tot_map_pix = np.float(len((Rover.ground_truth[:, :, 1].nonzero()[0])))
-    # Calculez le pourcentage de la carte de vérité terrain qui a été trouvée avec succès
-    perc_mapped = round(100 * good_nav_pix / tot_map_pix, 1)
-    # Calculez le nombre de bonnes détections de pixels de carte divisé par le nombre total de pixels
-    # trouvés pour être du terrain navigable
-    if tot_nav_pix > 0:
-        fidelity = round(100 * good_nav_pix / (tot_nav_pix), 1)
-    else:
-        fidelity = 0
-    # Inverser la carte pour le tracé de sorte que l'axe y pointe vers le haut dans l'affichage
-    map_add = np.flipud(map_add).astype(np.float32)
+
+# Données d'une trame de sortie, copiées depuis Rover pour pouvoir être rendues hors du fil de contrôle
+class OutputFrame():
+    def __init__(self, Rover):
+        self.regions = Rover.map_renderer.snapshot(Rover.worldmap, Rover.map_dirty.take())
+        self.vision_image = np.array(Rover.vision_image, dtype=np.uint8)
+        self.samples_pos = Rover.samples_pos
+        # Échantillons localisés, tenus à jour par l'index des rochers
+        located = Rover.rock_index.located
+        self.located = None if located is None else located.copy()
+        self.total_time = Rover.total_time
+        self.samples_collected = Rover.samples_collected
+
+
+# Octets JPEG d'une image RGB (format compact)
+def encode_jpeg(img):
+    # PIL n'est importé qu'au premier encodage
+    from PIL import Image
+    pil_img = Image.fromarray(img)
+    buff = BytesIO()
+    pil_img.save(buff, format="JPEG")
+    return buff.getvalue()
+
+
+# JPEG en base64 (format texte du simulateur)
+def encode_image(img):
+    return base64.b64encode(encode_jpeg(img)).decode("utf-8")
+
+
+# Rendu et encodage d'une trame de sortie
+def render_output_frame(renderer, frame, encode=encode_image):
+    # Le rendu de la carte est incrémental : seule la région modifiée depuis la trame précédente
+    # est recalculée, et les statistiques de la carte sont tenues à jour au fil de l'eau. L'image
+    # renvoyée est déjà retournée (axe y vers le haut) et réduite à la taille d'affichage.
+    map_add = renderer.apply(frame.regions, frame.samples_pos, frame.located)
+
+    # Pourcentage de la carte de vérité terrain trouvée avec succès, et nombre de bonnes détections
+    # de pixels de carte divisé par le nombre total de pixels trouvés pour être du terrain navigable
+    perc_mapped = renderer.perc_mapped()
+    fidelity = renderer.fidelity()
+    samples_located = renderer.samples_located
     # Ajouter du texte sur les résultats de la carte et de la détection d'échantillon de roche
-    cv2.putText(map_add, "Temps : " + str(np.round(Rover.total_time, 1)) + ' s', (0, 10),
+    cv2.putText(map_add, "Temps : " + str(np.round(frame.total_time, 1)) + ' s', (0, 10),
                 cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
     cv2.putText(map_add, "Cartographiee : " + str(perc_mapped) + '%', (0, 25),
                 cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
@@ -131,17 +109,45 @@ def create_output_images(Rover):
                 cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
     cv2.putText(map_add, "  Localises : " + str(samples_located), (0, 70),
                 cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-    cv2.putText(map_add, "  Collectes : " + str(Rover.samples_collected), (0, 85),
+    cv2.putText(map_add, "  Collectes : " + str(frame.samples_collected), (0, 85),
                 cv2.FONT_HERSHEY_COMPLEX, 0.4, (255, 255, 255), 1)
-    # Convertir la carte et l'image de vision en chaînes base64 pour les envoyer au serveur
-    pil_img = Image.fromarray(map_add.astype(np.uint8))
-    buff = BytesIO()
-    pil_img.save(buff, format="JPEG")
-    encoded_string1 = base64.b64encode(buff.getvalue()).decode("utf-8")
+    # Convertir la carte et l'image de vision en JPEG (chaînes base64 par défaut) pour les envoyer au serveur
+    return encode(map_add), encode(frame.vision_image)
 
-    pil_img = Image.fromarray(Rover.vision_image.astype(np.uint8))
-    buff = BytesIO()
-    pil_img.save(buff, format="JPEG")
-    encoded_string2 = base64.b64encode(buff.getvalue()).decode("utf-8")
 
-    return encoded_string1, encoded_string2
+def _output_frame(Rover):
+    if Rover.map_renderer is None:
+        Rover.map_renderer = MapRenderer(GroundTruthGrid(Rover.ground_truth, Rover.worldmap))
+    return OutputFrame(Rover)
+
+
+# Définir une fonction pour créer une sortie d'affichage en fonction des résultats de la carte du monde
+def create_output_images(Rover, encode=encode_image):
+    frame = _output_frame(Rover)
+    return render_output_frame(Rover.map_renderer, frame, encode)
+
+
+# Production des images d'incrustation en arrière-plan, à une cadence réduite : le fil de contrôle
+# se contente de copier la région modifiée de la carte, le rendu et l'encodage JPEG se font dans
+# un fil dédié, et les dernières images encodées sont réutilisées entre deux rendus.
+class OutputImageWorker():
+    def __init__(self, rate=5.0):
+        self.period = 1.0 / rate
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.future = None
+        self.last_submit = None
+        self.images = ('', '')
+
+    def update(self, Rover, encode=encode_image):
+        if self.future is not None and self.future.done():
+            self.images = self.future.result()
+            self.future = None
+        now = time.monotonic()
+        if self.future is None and (self.last_submit is None or now - self.last_submit >= self.period):
+            frame = _output_frame(Rover)
+            self.future = self.executor.submit(render_output_frame, Rover.map_renderer, frame, encode)
+            self.last_submit = now
+        return self.images
+
+    def close(self):
+        self.executor.shutdown(wait=True)
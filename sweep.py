@@ -0,0 +1,257 @@
+import argparse
+import itertools
+import json
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from perception import OBSTACLE_THRESH, ROCK_THRESH, NAVIGABLE_THRESH
+from rover_state import RoverState, load_ground_truth, GROUND_TRUTH_PATH
+from fake_sim import FakeSimulator
+from replay import replay, fake_frames
+from recorder import open_recording
+from telemetry_log import read_telemetry_log
+from scoring import RunScore, COVERAGE_THRESHOLDS
+
+# Balayage des paramètres de décision et de perception.
+# Chaque configuration (grille complète ou tirage aléatoire dans les plages indiquées) est évaluée
+# hors ligne dans un processus du pool : boucle fermée sur le simulateur factice (une course par graine),
+# ou rejeu de courses enregistrées. Dans ce dernier cas la trajectoire est celle de l'enregistrement,
+# seuls les paramètres de perception influent donc sur le score. Les configurations sont classées
+# par carte couverte, fidélité ou temps pour atteindre une couverture donnée (voir scoring.py).
+# Exemples :
+#   $ python sweep.py --param max_vel=1,1.5,2,2.5 --param wall_bias=0:0.3:0.1 --seeds 0 1 2 --processes 8
+#   $ python sweep.py --random 64 --param navigable_min=130:190 --param obstacle_max=80:120 --log course.log.gz
+
+
+def _set_attribute(name):
+    def apply(Rover, value):
+        setattr(Rover, name, value)
+    return apply
+
+
+# Seuils de couleur : une borne (même valeur pour les canaux indiqués) des seuils de Rover.segmenter
+def _set_threshold(k, bound, channels):
+    def apply(Rover, value):
+        bounds = [list(b) for b in Rover.segmenter.thresholds[k]]
+        for channel in channels:
+            bounds[bound][channel] = int(round(value))
+        thresholds = [None, None, None]
+        thresholds[k] = (tuple(bounds[0]), tuple(bounds[1]))
+        Rover.segmenter.set_thresholds(*thresholds)
+    return apply
+
+
+# Paramètres réglables : nom -> (application sur un RoverState neuf, valeur par défaut)
+PARAMETERS = {
+    'stop_forward': (_set_attribute('stop_forward'), 50),
+    'go_forward': (_set_attribute('go_forward'), 500),
+    'max_vel': (_set_attribute('max_vel'), 2),
+    'throttle_set': (_set_attribute('throttle_set'), 0.2),
+    'max_steer': (_set_attribute('max_steer'), 15),
+    'wall_bias': (_set_attribute('wall_bias'), 0.1),
+    'stuck_timeout': (_set_attribute('stuck_timeout'), 2),
+    'rock_seek_distance': (_set_attribute('rock_seek_distance'), 0),
+    'obstacle_max': (_set_threshold(0, 1, (0, 1, 2)), OBSTACLE_THRESH[1][0]),
+    'rock_min': (_set_threshold(1, 0, (0, 1)), ROCK_THRESH[0][0]),
+    'rock_max_blue': (_set_threshold(1, 1, (2,)), ROCK_THRESH[1][2]),
+    'navigable_min': (_set_threshold(2, 0, (0, 1, 2)), NAVIGABLE_THRESH[0][0]),
+}
+RANKINGS = ('coverage', 'fidelity', 'time')
+
+
+# "nom=a,b,c" (valeurs) ou "nom=début:fin[:pas]" (plage ; le pas n'est utilisé que pour la grille)
+def parse_param(spec):
+    name, _, values = spec.partition('=')
+    if name not in PARAMETERS:
+        raise ValueError('paramètre inconnu : {} (connus : {})'.format(name, ', '.join(sorted(PARAMETERS))))
+    if ':' in values:
+        bounds = [float(v) for v in values.split(':')]
+        if len(bounds) not in (2, 3):
+            raise ValueError('plage invalide : {}'.format(spec))
+        return name, tuple(bounds)
+    return name, [float(v) for v in values.split(',')]
+
+
+def _grid_values(values):
+    if isinstance(values, list):
+        return values
+    start, stop = values[:2]
+    step = values[2] if len(values) == 3 else (stop - start) / 4
+    return [round(float(v), 6) for v in np.arange(start, stop + step / 2, step)]
+
+
+# Toutes les combinaisons des valeurs de chaque paramètre
+def grid_configs(params):
+    names = list(params)
+    return [dict(zip(names, combo)) for combo in itertools.product(*(_grid_values(params[n]) for n in names))]
+
+
+# `count` tirages : uniforme dans les plages, au hasard parmi les listes de valeurs
+def random_configs(params, count, seed=0):
+    rng = np.random.default_rng(seed)
+    configs = []
+    for _ in range(count):
+        config = {}
+        for name, values in params.items():
+            if isinstance(values, list):
+                config[name] = float(rng.choice(values))
+            else:
+                config[name] = round(float(rng.uniform(values[0], values[1])), 4)
+        configs.append(config)
+    return configs
+
+
+def make_rover(config, ground_truth):
+    Rover = RoverState(ground_truth)
+    for name, value in config.items():
+        PARAMETERS[name][0](Rover, value)
+    return Rover
+
+
+def _run_frames(source):
+    if os.path.isdir(source):
+        return open_recording(source).telemetry_frames()
+    return read_telemetry_log(source)
+
+
+# Évalue une configuration sur chaque source : graine du simulateur factice (entier) ou enregistrement
+def evaluate(task):
+    index, config, sources, frames, ground_truth_path = task
+    ground_truth = None
+    runs = []
+    start = time.perf_counter()
+    for source in sources:
+        if isinstance(source, int):
+            sim = FakeSimulator(seed=source)
+            gt = sim.ground_truth.astype(float)
+            Rover = make_rover(config, np.dstack((gt * 0, gt * 255, gt * 0)))
+            run_frames = fake_frames(sim, frames)
+        else:
+            if ground_truth is None:
+                ground_truth = load_ground_truth(ground_truth_path)
+            sim = None
+            Rover = make_rover(config, ground_truth)
+            run_frames = _run_frames(source)
+        Rover.score = RunScore(Rover)
+        _, Rover = replay(run_frames, Rover, render=False, sim=sim, max_frames=frames)
+        report = Rover.score.report(Rover)
+        runs.append(dict(report['final'], source=source, time_to_mapped=report['time_to_mapped']))
+    return {'index': index, 'config': config, 'runs': runs, 'metrics': aggregate(runs),
+            'seconds': round(time.perf_counter() - start, 2)}
+
+
+# Moyennes sur les sources ; le temps pour atteindre chaque seuil de couverture est infini si une course
+# ne l'atteint pas
+def aggregate(runs):
+    metrics = {key: float(np.mean([run[key] for run in runs]))
+               for key in ('perc_mapped', 'fidelity', 'samples_located', 'samples_collected', 't')}
+    for threshold in COVERAGE_THRESHOLDS:
+        times = [run['time_to_mapped'][str(threshold)] for run in runs]
+        metrics['time_to_{}'.format(threshold)] = None if None in times else float(np.mean(times))
+    return metrics
+
+
+# Clé de tri (croissante) : configurations sous `min_fidelity` en dernier, puis le critère choisi
+def rank_key(result, ranking='coverage', min_fidelity=60.0, target=40):
+    metrics = result['metrics']
+    time_to_target = metrics['time_to_{}'.format(target)]
+    time_to_target = np.inf if time_to_target is None else time_to_target
+    if ranking == 'coverage':
+        key = (-metrics['perc_mapped'], -metrics['fidelity'], time_to_target)
+    elif ranking == 'fidelity':
+        key = (-metrics['fidelity'], -metrics['perc_mapped'], time_to_target)
+    else:
+        key = (time_to_target, -metrics['perc_mapped'], -metrics['fidelity'])
+    return (metrics['fidelity'] < min_fidelity,) + key
+
+
+def format_results(results, names, target, top=10):
+    header = '{:>5}{:>9}{:>9}{:>10}{:>11}  {}'.format('rang', 'carte %', 'fidél. %', 't {} % s'.format(target),
+                                                      'localisés', 'paramètres')
+    lines = [header]
+    for rank, result in enumerate(results[:top], 1):
+        metrics = result['metrics']
+        time_to_target = metrics['time_to_{}'.format(target)]
+        params = '  '.join('{}={:g}'.format(name, result['config'][name]) for name in names)
+        lines.append('{:>5}{:>9.1f}{:>9.1f}{:>10}{:>11.1f}  {}'.format(
+            rank, metrics['perc_mapped'], metrics['fidelity'],
+            '-' if time_to_target is None else '{:.1f}'.format(time_to_target), metrics['samples_located'], params))
+    return '\n'.join(lines)
+
+
+def run_sweep(configs, sources, frames=1500, processes=0, ground_truth_path=GROUND_TRUTH_PATH, progress=None):
+    tasks = [(i, config, sources, frames, ground_truth_path) for i, config in enumerate(configs)]
+    results = []
+    if processes > 1:
+        with Pool(processes) as pool:
+            for result in pool.imap_unordered(evaluate, tasks):
+                results.append(result)
+                if progress is not None:
+                    progress(result, len(results), len(tasks))
+    else:
+        for task in tasks:
+            results.append(evaluate(task))
+            if progress is not None:
+                progress(results[-1], len(results), len(tasks))
+    return sorted(results, key=lambda result: result['index'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Balayage des paramètres de décision et de perception')
+    parser.add_argument('--param', action='append', default=[],
+                        help="Paramètre à balayer : nom=a,b,c ou nom=début:fin[:pas] (répétable ; paramètres : {})"
+                        .format(', '.join(sorted(PARAMETERS))))
+    parser.add_argument('--random', type=int, default=0,
+                        help='Nombre de configurations tirées au hasard (0 : grille complète)')
+    parser.add_argument('--random-seed', type=int, default=0, help='Graine des tirages aléatoires')
+    parser.add_argument('--seeds', type=int, nargs='*', default=None,
+                        help='Graines des cartes du simulateur factice (par défaut 0, sans --log)')
+    parser.add_argument('--log', action='append', default=[],
+                        help='Course enregistrée (journal .log.gz ou dossier segments) à rejouer (répétable)')
+    parser.add_argument('--ground-truth', default=GROUND_TRUTH_PATH, help='Vérité terrain des courses enregistrées')
+    parser.add_argument('--frames', type=int, default=1500, help='Nombre de trames par course')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='Nombre de processus')
+    parser.add_argument('--rank', choices=RANKINGS, default='coverage', help='Critère de classement')
+    parser.add_argument('--min-fidelity', type=float, default=60.0,
+                        help='Fidélité (%%) en deçà de laquelle une configuration est classée en dernier')
+    parser.add_argument('--target', type=int, choices=COVERAGE_THRESHOLDS, default=40,
+                        help='Couverture (%%) dont le temps d\'atteinte est comparé')
+    parser.add_argument('--baseline', action='store_true', help='Évaluer aussi les valeurs par défaut')
+    parser.add_argument('--top', type=int, default=10, help='Nombre de configurations affichées')
+    parser.add_argument('--out', default='', help='Écrire tous les résultats (JSON) dans ce fichier')
+    args = parser.parse_args()
+
+    try:
+        params = dict(parse_param(spec) for spec in args.param)
+    except ValueError as error:
+        parser.error(str(error))
+    if not params:
+        parser.error('indiquez au moins un paramètre avec --param')
+    sources = list(args.seeds if args.seeds is not None else ([] if args.log else [0])) + args.log
+    configs = random_configs(params, args.random, args.random_seed) if args.random > 0 else grid_configs(params)
+    if args.baseline:
+        configs.insert(0, {name: PARAMETERS[name][1] for name in params})
+    names = list(params)
+
+    print('{} configurations x {} courses de {} trames, {} processus'.format(
+        len(configs), len(sources), args.frames, max(args.processes, 1)))
+    start = time.monotonic()
+
+    def progress(result, done, total):
+        print('\r{}/{}  ({:.0f} s)'.format(done, total, time.monotonic() - start), end='', flush=True)
+
+    results = run_sweep(configs, sources, args.frames, args.processes, args.ground_truth, progress)
+    print()
+    ranked = sorted(results, key=lambda result: rank_key(result, args.rank, args.min_fidelity, args.target))
+    print(format_results(ranked, names, args.target, args.top))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'params': {name: params[name] for name in names}, 'sources': sources, 'frames': args.frames,
+                       'rank': args.rank, 'results': ranked}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+import base64
+from io import BytesIO
+
+import cv2
+import numpy as np
+
+from compact_protocol import is_compact, unpack_state, unpack_samples
+
+# Décodage rapide de la télémétrie : le format des nombres (point ou virgule décimale) est détecté
+# une fois par session, et l'image JPEG est décodée avec OpenCV directement dans des tampons uint8
+# préalloués, sans passer par PIL. Les trames au format compact (voir compact_protocol.py) sont
+# reconnues à la volée : champs numériques packés et image en octets JPEG bruts.
+
+
+def _parse_comma_float(string_to_convert):
+    return float(string_to_convert.replace(',', '.'))
+
+
+# Image JPEG reçue du simulateur : l'objet PIL n'est construit qu'à la demande
+class EncodedFrame():
+    def __init__(self, data):
+        self.data = data
+
+    def to_pil(self):
+        from PIL import Image
+        return Image.open(BytesIO(self.data))
+
+    # Les octets JPEG reçus sont écrits tels quels, sans décodage ni réencodage
+    def save(self, filename):
+        if filename.lower().endswith(('.jpg', '.jpeg')):
+            with open(filename, 'wb') as f:
+                f.write(self.data)
+        else:
+            self.to_pil().save(filename)
+
+
+class TelemetryDecoder():
+    def __init__(self, img_shape=(160, 320, 3), buffers=2):
+        self.parse = float
+        # Plusieurs tampons utilisés à tour de rôle : l'image précédente reste valide pendant
+        # le décodage de la suivante (utile si elle est encore traitée dans un autre fil)
+        self.buffers = [np.empty(img_shape, dtype=np.uint8) for _ in range(buffers)]
+        self.next_buffer = 0
+
+    def parse_float(self, string_to_convert):
+        try:
+            return self.parse(string_to_convert)
+        except ValueError:
+            # Virgule décimale : on bascule définitivement sur l'analyseur correspondant
+            if self.parse is float and ',' in string_to_convert:
+                self.parse = _parse_comma_float
+                return self.parse(string_to_convert)
+            raise
+
+    def parse_list(self, string_to_convert):
+        return [self.parse_float(value) for value in string_to_convert.split(';')]
+
+    def parse_int(self, string_to_convert):
+        return int(self.parse_float(string_to_convert))
+
+    # (vitesse, x, y, lacet, tangage, roulis, accélération, direction, near_sample, picking_up, sample_count)
+    def state(self, data):
+        if is_compact(data):
+            return unpack_state(data)
+        parse = self.parse_float
+        x, y = self.parse_list(data["position"])[:2]
+        return (parse(data["speed"]), x, y, parse(data["yaw"]), parse(data["pitch"]), parse(data["roll"]),
+                parse(data["throttle"]), parse(data["steering_angle"]), self.parse_int(data["near_sample"]),
+                self.parse_int(data["picking_up"]), self.parse_int(data["sample_count"]))
+
+    # Positions (x, y) des échantillons
+    def samples(self, data):
+        if is_compact(data):
+            return unpack_samples(data)
+        return self.parse_list(data["samples_x"]), self.parse_list(data["samples_y"])
+
+    # Image en base64 (format texte) ou en octets JPEG bruts (format compact)
+    def decode_image(self, img_string):
+        if isinstance(img_string, (bytes, bytearray)):
+            data = bytes(img_string)
+        else:
+            data = base64.b64decode(img_string)
+        bgr = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if bgr is None:
+            raise ValueError("Image de télémétrie illisible")
+        buffer = self.buffers[self.next_buffer]
+        if buffer.shape != bgr.shape:
+            buffer = self.buffers[self.next_buffer] = np.empty(bgr.shape, dtype=np.uint8)
+        self.next_buffer = (self.next_buffer + 1) % len(self.buffers)
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=buffer)
+        return buffer, EncodedFrame(data)
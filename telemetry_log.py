@@ -0,0 +1,41 @@
+import gzip
+import json
+import time
+
+# Journal de télémétrie : une ligne JSON compressée (gzip) par trame, contenant le dictionnaire
+# brut reçu du simulateur (image base64 comprise) et l'instant de réception relatif au début.
+
+
+class TelemetryRecorder():
+    def __init__(self, path):
+        self.path = path
+        self.file = gzip.open(path, 'wt', encoding='utf-8')
+        self.start = None
+        self.frames = 0
+
+    def write(self, data, t=None):
+        if t is None:
+            t = time.monotonic()
+        if self.start is None:
+            self.start = t
+        self.file.write(json.dumps({'t': round(t - self.start, 6), 'data': data}, separators=(',', ':')))
+        self.file.write('\n')
+        self.frames += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Renvoie les trames d'un journal sous forme de paires (instant, télémétrie)
+def read_telemetry_log(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield record['t'], record['data']
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Modules du dépôt importables depuis les tests, et cache d'assets propre à la session de tests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('ROVER_ASSET_CACHE', tempfile.mkdtemp(prefix='rover_assets_'))
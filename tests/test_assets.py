@@ -0,0 +1,44 @@
+import numpy as np
+
+from assets import cached
+from perception import PerceptionKernel, get_perception_kernel
+
+
+def counting_build(calls, value=1.0):
+    def build():
+        calls.append(1)
+        return {'table': np.full(4, value)}, {'value': value}
+    return build
+
+
+def test_cached_arrays_are_reused(tmp_path):
+    calls = []
+    for _ in range(2):
+        arrays, meta = cached('test', [1, 'a'], counting_build(calls), cache_dir=str(tmp_path))
+    assert len(calls) == 1
+    np.testing.assert_array_equal(arrays['table'], np.ones(4))
+    cached('test', [2, 'a'], counting_build(calls), cache_dir=str(tmp_path))
+    assert len(calls) == 2
+
+
+def test_builder_source_change_invalidates_cache(tmp_path):
+    source = tmp_path / 'builder.py'
+    source.write_text('SCALE = 1\n')
+    calls = []
+    cache_dir = str(tmp_path / 'cache')
+    cached('test', [1], counting_build(calls, 1.0), cache_dir=cache_dir, sources=(str(source),))
+    cached('test', [1], counting_build(calls, 1.0), cache_dir=cache_dir, sources=(str(source),))
+    assert len(calls) == 1
+    # Même clé, code du calcul modifié : les tableaux enregistrés ne sont plus servis
+    source.write_text('SCALE = 2\n')
+    arrays, _ = cached('test', [1], counting_build(calls, 2.0), cache_dir=cache_dir, sources=(str(source),))
+    assert len(calls) == 2
+    np.testing.assert_array_equal(arrays['table'], np.full(4, 2.0))
+
+
+def test_cached_kernel_tables_match_fresh_build():
+    for mode, (roi, downsample) in (('full', (False, 1)), ('fast', (True, 2))):
+        kernel = get_perception_kernel((160, 320, 3), mode)
+        fresh = PerceptionKernel((160, 320), roi=roi, downsample=downsample)
+        for name in PerceptionKernel.TABLES:
+            np.testing.assert_array_equal(getattr(kernel, name), getattr(fresh, name))
@@ -0,0 +1,38 @@
+import numpy as np
+
+from batch_perception import rebuild_map
+from fake_sim import FakeSimulator
+from perception import perception_step
+from rover_state import RoverState
+from supporting_functions import update_rover
+
+
+# Trames du simulateur factice perçues une à une ; renvoie la carte et les images et poses des trames
+def live_run(frames=40, seed=2):
+    sim = FakeSimulator(seed=seed)
+    Rover = RoverState()
+    images, poses = [], []
+    for i in range(frames):
+        sim.step((0.3, 0, 10.0 if i % 10 < 5 else -10.0))
+        Rover, _ = update_rover(Rover, sim.telemetry())
+        perception_step(Rover)
+        images.append(Rover.img.copy())
+        poses.append((Rover.pos[0], Rover.pos[1], Rover.yaw, Rover.pitch, Rover.roll))
+    return Rover.worldmap, images, poses
+
+
+def test_batch_rebuild_matches_live_map():
+    worldmap, images, poses = live_run()
+    live = worldmap.region(0, worldmap.size, 0, worldmap.size)
+    assert np.count_nonzero(live[:, :, 2]) > 0
+    for batch_size in (64, 7):
+        rebuilt = rebuild_map(iter(images), poses, world_size=worldmap.size, batch_size=batch_size,
+                              worldmap=np.zeros(live.shape, dtype=live.dtype))
+        np.testing.assert_allclose(rebuilt, live)
+
+
+def test_batch_rebuild_skips_tilted_frames():
+    worldmap, images, poses = live_run(frames=10)
+    tilted = [pose[:3] + (5.0, 0.0) for pose in poses]
+    rebuilt = rebuild_map(iter(images), tilted, world_size=worldmap.size)
+    assert not rebuilt.any()
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+
+from calibrate_colors import accumulate, learn_lut, confusion
+from perception import (ColorSegmenter, LutSegmenter, lut_bin_colors, lut_from_thresholds, lut_index, save_color_lut,
+                        load_color_lut, LUT_SIZE, N_LABELS)
+
+
+# Image dont chaque pixel est la couleur centrale d'une case de la table
+def bin_center_image():
+    return lut_bin_colors().astype(np.uint8).reshape(256, 256, 3)
+
+
+def test_threshold_table_matches_color_segmenter():
+    img = bin_center_image()
+    np.testing.assert_array_equal(lut_index(img).ravel(), np.arange(LUT_SIZE))
+    lut = LutSegmenter()
+    masks = lut.segment(img).copy()
+    np.testing.assert_array_equal(masks, ColorSegmenter().segment(img))
+    np.testing.assert_array_equal(lut.labels(), lut_from_thresholds()[lut_index(img)])
+    lut.set_thresholds(navigable=((120, 120, 120), (255, 255, 255)))
+    reference = ColorSegmenter()
+    reference.set_thresholds(navigable=((120, 120, 120), (255, 255, 255)))
+    np.testing.assert_array_equal(lut.segment(img), reference.segment(img))
+
+
+def test_learned_table_reproduces_labels():
+    img = bin_center_image()
+    labels = lut_from_thresholds()[lut_index(img)]
+    counts = accumulate(np.zeros((N_LABELS, LUT_SIZE), dtype=np.int64), img, labels)
+    # Un pixel par case : le modèle gaussien (moins d'un pixel) ne départage que les cases jamais vues
+    table = learn_lut(counts, smoothing=0.5)
+    np.testing.assert_array_equal(table, lut_from_thresholds())
+    matrix = confusion(table, [(img, labels)])
+    assert np.trace(matrix) == matrix.sum() == LUT_SIZE
+    with pytest.raises(ValueError):
+        learn_lut(np.zeros((N_LABELS, LUT_SIZE)))
+    # Couleurs jamais vues (une case sur deux) : classées par le modèle gaussien
+    seen = labels.copy()
+    seen.ravel()[1::2] = 255
+    table = learn_lut(accumulate(np.zeros((N_LABELS, LUT_SIZE), dtype=np.int64), img, seen))
+    assert np.mean(table[1::2] == lut_from_thresholds()[1::2]) > 0.9
+
+
+def test_table_file_round_trip_and_hot_reload(tmp_path):
+    path = str(tmp_path / 'couleurs.npz')
+    table = lut_from_thresholds()
+    save_color_lut(path, table, {'source': 'seuils'})
+    np.testing.assert_array_equal(load_color_lut(path), table)
+    segmenter = LutSegmenter(path=path, check_interval=0.0)
+    img = bin_center_image()
+    assert segmenter.segment(img)[2].any()
+    # Nouvelle table : tout est navigable ; relue à la trame suivante
+    save_color_lut(path, np.full(LUT_SIZE, 3, dtype=np.uint8))
+    os.utime(path, (0, 1e9))
+    assert segmenter.segment(img)[2].all() and segmenter.reloads == 1
+    # Table invalide : ignorée, la précédente reste en place
+    save_color_lut(path, np.full(LUT_SIZE, 9, dtype=np.uint8))
+    os.utime(path, (0, 2e9))
+    assert not segmenter.reload() and segmenter.segment(img)[2].all()
+    with pytest.raises(ValueError):
+        load_color_lut(path)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from compact_protocol import (PROTOCOL_VERSION, TEXT_PROTOCOL, negotiate, is_compact, unpack_state, unpack_samples,
+                              text_telemetry, pack_commands, unpack_commands, InsetCache, payload_size)
+from fake_sim import FakeSimulator
+from rover_state import RoverState
+from supporting_functions import update_rover
+from telemetry_decoder import TelemetryDecoder
+
+
+@pytest.mark.parametrize('offer, version', [
+    ({'versions': [PROTOCOL_VERSION]}, PROTOCOL_VERSION),
+    ({'versions': [PROTOCOL_VERSION + 1, PROTOCOL_VERSION]}, PROTOCOL_VERSION),
+    ({'versions': [PROTOCOL_VERSION + 1]}, TEXT_PROTOCOL),
+    ({}, TEXT_PROTOCOL),
+    (None, TEXT_PROTOCOL),
+    ('1', TEXT_PROTOCOL),
+])
+def test_negotiate(offer, version):
+    assert negotiate(offer) == version
+
+
+def sim_frames():
+    sim = FakeSimulator(seed=5)
+    sim.step((0.2, 0, 5.0))
+    return sim.telemetry(compact=True), sim.telemetry(compact=False)
+
+
+def test_compact_telemetry_matches_text():
+    compact, text = sim_frames()
+    assert is_compact(compact) and not is_compact(text)
+    decoder = TelemetryDecoder()
+    np.testing.assert_allclose(decoder.state(compact), decoder.state(text), rtol=1e-6, atol=1e-5)
+    for packed, parsed in zip(decoder.samples(compact), decoder.samples(text)):
+        np.testing.assert_allclose(packed, parsed, rtol=1e-6)
+    image_compact, _ = decoder.decode_image(compact['image'])
+    image_text, _ = decoder.decode_image(text['image'])
+    np.testing.assert_array_equal(image_compact, image_text)
+    assert payload_size(compact) < payload_size(text)
+
+
+def test_text_telemetry_round_trip():
+    compact, _ = sim_frames()
+    text = text_telemetry(compact)
+    decoder = TelemetryDecoder()
+    assert decoder.state(text) == pytest.approx(unpack_state(compact))
+    np.testing.assert_array_equal(decoder.samples(text)[0], unpack_samples(compact)[0])
+    np.testing.assert_array_equal(decoder.decode_image(text['image'])[0], decoder.decode_image(compact['image'])[0])
+    assert 'image' not in text_telemetry(compact, image=False)
+
+
+def test_update_rover_from_both_formats():
+    compact, text = sim_frames()
+    rovers = []
+    for data in (compact, text):
+        Rover, _ = update_rover(RoverState(), data)
+        rovers.append(Rover)
+    a, b = rovers
+    assert a.pos == pytest.approx(b.pos, abs=1e-4) and a.yaw == pytest.approx(b.yaw, abs=1e-4)
+    assert (a.near_sample, a.samples_to_find) == (b.near_sample, b.samples_to_find)
+    np.testing.assert_array_equal(a.samples_pos[0], b.samples_pos[0])
+    np.testing.assert_array_equal(a.img, b.img)
+
+
+def test_commands_round_trip():
+    commands, inset1, inset2 = unpack_commands(pack_commands((0.2, 0.0, -7.5), b'jpeg1'))
+    assert commands == pytest.approx((0.2, 0.0, -7.5)) and (inset1, inset2) == (b'jpeg1', None)
+    text = {'throttle': '0.2', 'brake': '0', 'steering_angle': '-7.5', 'inset_image1': '', 'inset_image2': 'b64'}
+    assert unpack_commands(text) == ((0.2, 0.0, -7.5), None, 'b64')
+
+
+def test_inset_cache_sends_changed_images_only():
+    cache = InsetCache()
+    assert cache.filter(b'a', b'b') == [b'a', b'b']
+    assert cache.filter(b'a', b'c') == [None, b'c']
+    assert cache.filter(b'', b'c') == [None, None]
+    assert cache.unchanged == 2
@@ -0,0 +1,74 @@
+import threading
+
+import numpy as np
+import pytest
+
+from control_loop import ControlLoop, StateEstimator
+from fake_sim import FakeSimulator
+from rover_state import RoverState
+
+
+class Clock():
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def make_loop(perception, decisions, max_frame_age=0.5):
+    clock = Clock()
+    acted = []
+    loop = ControlLoop(RoverState(), acted.append, rate=10, perception=perception,
+                       decision=lambda Rover: decisions.append(tuple(Rover.pos)) or Rover,
+                       max_frame_age=max_frame_age, clock=clock)
+    return loop, clock, acted
+
+
+def perceive(Rover):
+    Rover.nav_angles = np.zeros(1)
+    return Rover
+
+
+def test_stale_and_superseded_frames_are_dropped():
+    sim = FakeSimulator(seed=1)
+    release = threading.Event()
+    perceived = []
+
+    def slow_perception(Rover):
+        perceived.append(tuple(Rover.pos))
+        release.wait(5)
+        return perceive(Rover)
+
+    decisions = []
+    loop, clock, acted = make_loop(slow_perception, decisions)
+    clock.t = 10.0
+    # Trame reçue il y a plus de max_frame_age : jamais perçue
+    loop.submit(sim.telemetry(), t=9.0)
+    assert loop.frames_stale == 1 and loop.future is None
+    loop.submit(sim.telemetry(), t=10.0)
+    # Perception en cours : seule la dernière des trames suivantes est gardée
+    for _ in range(3):
+        sim.step((1.0, 0, 0))
+        loop.submit(sim.telemetry(), t=10.0)
+    assert loop.frames_received == 5 and loop.frames_dropped == 2
+    release.set()
+    assert loop.tick()
+    assert len(decisions) == 1 and len(acted) == 1
+    loop.future.result()
+    assert len(perceived) == 2 and loop.pending is None
+    loop.close()
+
+
+def test_estimator_extrapolates_pose():
+    estimator = StateEstimator()
+    Rover = RoverState()
+    Rover.pos, Rover.yaw, Rover.vel = (10.0, 20.0), 0.0, 2.0
+    estimator.observe(Rover, 1.0)
+    x, y, yaw = estimator.predict(1.25)
+    assert (x, y, yaw) == pytest.approx((10.5, 20.0, 0.0))
+    # Horizon d'extrapolation borné
+    assert estimator.predict(10.0)[0] == pytest.approx(10.0 + 2.0 * estimator.max_horizon)
+    Rover.yaw = 10.0
+    estimator.observe(Rover, 1.5)
+    assert estimator.yaw_rate == pytest.approx(0.5 * 10.0 / 0.5)
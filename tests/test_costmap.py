@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from costmap import ClearanceMap
+from rover_state import RoverState
+from worldmap import make_worldmap
+
+
+def test_steer_candidates_follow_max_steer():
+    Rover = RoverState()
+    Rover.costmap = ClearanceMap(Rover.worldmap)
+    Rover.pos, Rover.yaw = (100.0, 100.0), 0.0
+    np.testing.assert_array_equal(Rover.costmap.steer_candidates, [-15, -10, -5, 0, 5, 10, 15])
+    Rover.max_steer = 30
+    Rover.costmap.update_rover(Rover)
+    assert Rover.costmap.steer_candidates.min() == -30 and Rover.costmap.steer_candidates.max() == 30
+    assert len(Rover.costmap.clearances) == Rover.costmap.steer_count
+    # Obstacle droit devant : le braquage retenu est l'un des nouveaux candidats
+    Rover.worldmap.increment(0, np.arange(95, 106), np.full(11, 103))
+    Rover.costmap.update_rover(Rover)
+    assert Rover.costmap.best_steer() in Rover.costmap.steer_candidates
+    assert Rover.costmap.best_steer() != 0
+
+
+@pytest.mark.parametrize('tiled', [False, True])
+def test_ray_stops_at_obstacle_cell(tiled):
+    worldmap = make_worldmap(200, tiled=tiled)
+    costmap = ClearanceMap(worldmap)
+    # Mur en x = 106 : le rayon vers +x depuis (100.5, 100.5) s'arrête dans la cellule du mur
+    worldmap.increment(0, np.arange(90, 111), np.full(21, 106))
+    costmap.update()
+    ahead, behind = costmap.clearance(100.5, 100.5, [0.0, np.pi])
+    assert int(100.5 + ahead) == 106
+    assert costmap.at(100.5 + ahead, 100.5)[0] == 0
+    assert behind == costmap.max_range
+    if tiled:
+        # Proximité allouée seulement pour les tuiles à moins de max_range du mur
+        assert set(costmap.proximity.tiles) == {(2, 3), (3, 3)}
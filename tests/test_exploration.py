@@ -0,0 +1,45 @@
+import numpy as np
+
+from exploration import ExplorationPlanner, astar, BLOCKED, FREE, UNKNOWN
+from worldmap import make_worldmap
+
+
+class Pose():
+    def __init__(self, x, y, yaw=0.0):
+        self.pos, self.yaw = (x, y), yaw
+
+
+# Carte 40 x 40 : moitié gauche connue et navigable, coupée par un mur (colonnes 8 à 11) ouvert en bas ;
+# les frontières sont en colonne 19, au bord de la moitié inconnue
+def walled_map():
+    worldmap = make_worldmap(40)
+    ys, xs = np.mgrid[0:40, 0:20]
+    wall = (xs >= 8) & (xs < 12) & (ys < 32)
+    worldmap.increment(2, ys[~wall], xs[~wall])
+    worldmap.increment(0, ys[wall], xs[wall])
+    return worldmap
+
+
+def test_astar_goes_around_blocked_cells():
+    cost = np.full((5, 5), FREE, dtype=np.uint8)
+    cost[0:4, 2] = BLOCKED
+    path = astar(cost, (0, 0), (0, 4))
+    assert path[-1] == (0, 4) and (4, 2) in path
+    assert all(cost[node] != BLOCKED for node in path)
+    cost[4, 2] = BLOCKED
+    assert astar(cost, (0, 0), (0, 4)) is None
+
+
+def test_planner_picks_reachable_frontier():
+    planner = ExplorationPlanner(walled_map())
+    assert planner.cost[0, 2] == BLOCKED and planner.cost[0, 6] == UNKNOWN
+    assert planner.frontier[:, 19].all() and not planner.frontier[:, :19].any()
+    angle = planner.update(Pose(2.0, 2.0))
+    assert planner.goal[1] == 19 // planner.downsample
+    # Chemin connexe depuis le rover, passant sous le mur
+    blocks = [planner._block(2.0, 2.0)] + planner.path
+    assert all(max(abs(a[0] - b[0]), abs(a[1] - b[1])) == 1 for a, b in zip(blocks, blocks[1:]))
+    assert all(planner.cost[block] != BLOCKED for block in planner.path)
+    assert max(block[0] for block in planner.path) >= 32 // planner.downsample
+    # Premier point de passage vers le bas (y croissant) : le mur barre le chemin direct vers +x
+    assert angle is not None and angle > np.pi / 4
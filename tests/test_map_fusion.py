@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from map_fusion import MapFusion
+from worldmap import make_worldmap
+
+
+# 40 pixels navigables et 3 obstacles projetés sur la même cellule
+def fuse_one_cell(fusion, dtype=float):
+    worldmap = make_worldmap(20, dtype=dtype)
+    nav = (np.full(40, 5), np.full(40, 7), np.linspace(0, 60, 40))
+    obstacle = (np.full(3, 2), np.full(3, 3), np.full(3, 70.0))
+    fusion.fuse(worldmap, obstacle, (np.array([9]), np.array([9])), nav)
+    return worldmap
+
+
+@pytest.mark.parametrize('dtype', [float, np.uint16])
+def test_default_fusion_counts_every_hit(dtype):
+    worldmap = fuse_one_cell(MapFusion(), dtype)
+    assert worldmap.channel(2)[5, 7] == 40
+    assert worldmap.channel(0)[2, 3] == 3
+    assert worldmap.channel(1)[9, 9] == 255
+    assert worldmap.channel(2).sum() == 40
+
+
+def test_distance_weighting_and_log_odds_are_opt_in():
+    fusion = MapFusion('distance', log_odds=True)
+    worldmap = fuse_one_cell(fusion)
+    assert 0 < worldmap.channel(2)[5, 7] < 40
+    probability = fusion.probability()
+    assert probability[2, 3] > 0.5 > probability[5, 7]
+    assert probability[0, 0] == 0.5
+    assert MapFusion().probability() is None
+    with pytest.raises(ValueError):
+        MapFusion('gaussienne')
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+import pytest
+
+from map_renderer import MapRenderer
+from worldmap import GroundTruthGrid, make_worldmap
+
+
+def ground_truth():
+    nav = np.random.default_rng(0).random((200, 200)) < 0.4
+    return np.dstack((nav * 0, nav * 255, nav * 0)).astype(float)
+
+
+# Détections aléatoires dans un carré de `extent` cellules
+def observe(worldmap, rng, y0, x0, extent, count=200):
+    iy, ix = rng.integers(y0, y0 + extent, count), rng.integers(x0, x0 + extent, count)
+    worldmap.scatter_add(int(rng.choice([0, 2])), iy, ix, rng.random(count) * 3)
+
+
+def test_tiled_renderer_allocates_observed_tiles_only():
+    worldmap = make_worldmap(2000, 0.1, tiled=True, tile_size=32)
+    dirty = worldmap.track()
+    renderer = MapRenderer(GroundTruthGrid(ground_truth(), worldmap))
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        observe(worldmap, rng, 1000, 1000, 60)
+        renderer.update(worldmap, dirty.take())
+    observed = len(worldmap.tiles)
+    assert observed <= 9
+    assert len(renderer.seen.tiles) <= observed
+    assert len(renderer.scorer.known.tiles) <= observed
+
+
+def run_renderer(worldmap, frames, seed=2, **kwargs):
+    dirty = worldmap.track()
+    renderer = MapRenderer(GroundTruthGrid(ground_truth(), worldmap), **kwargs)
+    rng = np.random.default_rng(seed)
+    for _ in range(frames):
+        y0, x0 = rng.integers(0, worldmap.size - 40, 2)
+        observe(worldmap, rng, y0, x0, 40)
+        image = renderer.update(worldmap, dirty.take())
+    return renderer, image
+
+
+@pytest.mark.parametrize('size, cell_size, tiled', [(200, 1.0, False), (400, 0.5, True), (455, 0.5, False)])
+def test_incremental_render_matches_full_render(size, cell_size, tiled):
+    worldmap = make_worldmap(size, cell_size, tiled=tiled)
+    renderer, image = run_renderer(worldmap, 40, rescale_tolerance=np.inf)
+    # Rendu complet avec les mêmes échelles de normalisation
+    map_add, display = renderer.map_add.copy(), renderer.display.copy()
+    renderer._render_all()
+    np.testing.assert_array_equal(renderer.map_add, map_add)
+    np.testing.assert_array_equal(renderer.display, display)
+    np.testing.assert_array_equal(image, display)
+    # Image affichée : réduction de la carte retournée entière, de taille fixe
+    f = renderer.factor
+    assert min(display.shape[:2]) >= 200 or f == 1
+    np.testing.assert_array_equal(display, cv2.resize(map_add, (map_add.shape[1] // f, map_add.shape[0] // f),
+                                                      interpolation=cv2.INTER_AREA))
+    # Carte retournée : la ligne y de la carte est en bas de l'image
+    fresh = MapRenderer(GroundTruthGrid(ground_truth(), worldmap))
+    fresh.update(worldmap, None)
+    fresh.nav_scale, fresh.obs_scale = renderer.nav_scale, renderer.obs_scale
+    fresh._render_all()
+    np.testing.assert_array_equal(fresh.map_add, map_add)
+    assert (fresh.perc_mapped(), fresh.fidelity()) == (renderer.perc_mapped(), renderer.fidelity())
+
+
+def test_located_samples_marked_on_display():
+    worldmap = make_worldmap(400, 0.5)
+    renderer, _ = run_renderer(worldmap, 1)
+    samples = (np.array([50.0, 120.0]), np.array([30.0, 150.0]))
+    image = renderer.update(worldmap, None, samples, located=np.array([True, False]))
+    f, padded = renderer.factor, renderer.padded
+    assert (image[(padded - 60) // f, 100 // f] == 255).all()
+    assert not (image[(padded - 300) // f, 240 // f] == 255).all()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from fake_sim import FakeSimulator
+from map_snapshot import MapSnapshot, restore_snapshot, open_snapshot
+from replay import replay, fake_frames
+from rover_state import RoverState
+from worldmap import make_worldmap
+
+
+def fake_run(sim, worldmap, frames, Rover=None):
+    if Rover is None:
+        gt = sim.ground_truth.astype(float)
+        Rover = RoverState(np.dstack((gt * 0, gt * 255, gt * 0)), worldmap)
+    _, Rover = replay(fake_frames(sim, frames), Rover, render=False, sim=sim, max_frames=frames)
+    return Rover
+
+
+@pytest.mark.parametrize('tiled', [False, True])
+def test_snapshot_round_trip(tmp_path, tiled):
+    sim = FakeSimulator(seed=1)
+    Rover = fake_run(sim, make_worldmap(tiled=tiled), 120)
+    snapshot = MapSnapshot(str(tmp_path), Rover)
+    snapshot.save(Rover)
+    # Instantané suivant : seules les tuiles modifiées depuis le précédent sont réécrites
+    Rover = fake_run(sim, None, 80, Rover)
+    assert snapshot.save(Rover) < (Rover.worldmap.size // 32 + 1) ** 2
+
+    restored = RoverState(Rover.ground_truth, make_worldmap(tiled=tiled))
+    restored.clock = Rover.clock
+    state = restore_snapshot(str(tmp_path), restored)
+    assert state['sequence'] == 2
+    np.testing.assert_array_equal(restored.worldmap.to_dense(), Rover.worldmap.to_dense())
+    assert restored.rock_index.state() == Rover.rock_index.state()
+    assert restored.samples_to_find == Rover.samples_to_find
+    assert restored.total_time == pytest.approx(Rover.total_time)
+    np.testing.assert_array_equal(restored.samples_pos[0], Rover.samples_pos[0])
+
+    worldmap, _ = open_snapshot(str(tmp_path))
+    np.testing.assert_array_equal(worldmap.to_dense(), Rover.worldmap.to_dense())
+
+
+def test_new_run_discards_previous_snapshot(tmp_path):
+    sim = FakeSimulator(seed=1)
+    Rover = fake_run(sim, None, 50)
+    MapSnapshot(str(tmp_path), Rover).save(Rover)
+    MapSnapshot(str(tmp_path), RoverState(Rover.ground_truth))
+    assert restore_snapshot(str(tmp_path), RoverState(Rover.ground_truth)) is None
+
+
+def test_restore_rejects_other_geometry(tmp_path):
+    Rover = fake_run(FakeSimulator(seed=1), None, 20)
+    MapSnapshot(str(tmp_path), Rover).save(Rover)
+    with pytest.raises(ValueError):
+        restore_snapshot(str(tmp_path), RoverState(Rover.ground_truth, make_worldmap(cell_size=0.5)))
@@ -0,0 +1,39 @@
+import os
+import pstats
+
+import pytest
+
+from metrics import Metrics, RollingHistogram
+
+
+def test_rolling_histogram_keeps_last_values():
+    histogram = RollingHistogram(size=4)
+    assert histogram.summary() == {'n': 0}
+    for value in (1.0, 1.0, 0.001, 0.002, 0.003, 0.004):
+        histogram.add(value)
+    summary = histogram.summary()
+    assert summary['n'] == 6 and summary['total_s'] == pytest.approx(2.01)
+    # Seules les 4 dernières mesures comptent pour les percentiles
+    assert summary['max_ms'] == pytest.approx(4.0) and summary['p50_ms'] == pytest.approx(2.5)
+
+
+def test_metrics_summary_and_profile(tmp_path):
+    metrics = Metrics(window=8)
+    for _ in range(3):
+        with metrics.time('perception'):
+            sum(range(100))
+        metrics.count('invalid_frames')
+        metrics.frame_done()
+    metrics.gauge('sessions', 2)
+    summary = metrics.summary()
+    assert summary['frames'] == 3 and summary['stages']['perception']['n'] == 3
+    assert summary['counters'] == {'invalid_frames': 3} and summary['gauges'] == {'sessions': 2}
+    assert summary['fps'] is not None and 'perception' in metrics.format_line()
+
+    path = str(tmp_path / 'profil.prof')
+    assert metrics.start_profile(2, path) and not metrics.start_profile(2, path)
+    metrics.frame_done()
+    assert metrics.summary()['profiling']
+    metrics.frame_done()
+    assert not metrics.summary()['profiling'] and os.path.exists(path)
+    pstats.Stats(path)
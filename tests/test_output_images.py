@@ -0,0 +1,36 @@
+import numpy as np
+
+from fake_sim import FakeSimulator
+from perception import perception_step
+from rover_state import RoverState
+from supporting_functions import update_rover, create_output_images, OutputImageWorker
+
+
+def perceived_rover(sim, frames=5):
+    gt = sim.ground_truth.astype(float)
+    Rover = RoverState(np.dstack((gt * 0, gt * 255, gt * 0)))
+    Rover.clock = lambda: sim.t
+    for _ in range(frames):
+        sim.step((0.3, 0, 5.0))
+        Rover, _ = update_rover(Rover, sim.telemetry())
+        perception_step(Rover)
+    return Rover
+
+
+def raw(img):
+    return img.copy()
+
+
+def test_worker_images_match_inline_rendering():
+    expected = create_output_images(perceived_rover(FakeSimulator(seed=6)), raw)
+    Rover = perceived_rover(FakeSimulator(seed=6))
+    worker = OutputImageWorker(rate=1e-3)
+    # Aucune image encore rendue : la première trame renvoie des images vides sans attendre le rendu
+    assert worker.update(Rover, raw) == ('', '')
+    worker.future.result()
+    images = worker.update(Rover, raw)
+    for image, reference in zip(images, expected):
+        np.testing.assert_array_equal(image, reference)
+    # Cadence réduite : pas de nouveau rendu avant la fin de la période
+    assert worker.future is None and worker.update(Rover, raw) is images
+    worker.close()
@@ -0,0 +1,57 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from fake_sim import FakeSimulator
+from perception import perception_step, select_perception_mode
+from rover_state import RoverState
+from worldmap import make_worldmap
+
+
+def auto_rover(budget):
+    Rover = RoverState()
+    Rover.perception_mode = 'auto'
+    Rover.perception_budget = budget
+    Rover.vel = 0.0
+    return Rover
+
+
+# Choix du mode sur `frames` trames, avec un coût fixe par mode (secondes)
+def run_modes(Rover, costs, frames, probe_interval=20):
+    modes = []
+    for _ in range(frames):
+        mode = select_perception_mode(Rover, probe_interval)
+        Rover.perception_recent.setdefault(mode, deque(maxlen=16)).append(costs[mode])
+        modes.append(mode)
+    return modes
+
+
+def test_auto_mode_returns_to_full_after_one_probe():
+    Rover = auto_rover(0.010)
+    modes = run_modes(Rover, {'full': 0.020, 'roi': 0.005, 'fast': 0.002}, 59)
+    assert modes[:3] == ['full'] * 3 and modes[-1] == 'roi'
+    # La charge baisse : le mode complet est repris dès le sondage suivant
+    modes = run_modes(Rover, {'full': 0.008, 'roi': 0.004, 'fast': 0.002}, 20)
+    assert modes[-1] == 'full'
+
+
+def test_auto_mode_falls_back_to_fast():
+    Rover = auto_rover(0.001)
+    modes = run_modes(Rover, {'full': 0.020, 'roi': 0.005, 'fast': 0.002}, 30)
+    assert modes[6:19] == ['fast'] * 13
+
+
+@pytest.mark.parametrize('dtype', [float, np.uint16])
+def test_fast_mode_keeps_map_evidence_scale(dtype):
+    sim = FakeSimulator(seed=3)
+    totals = {}
+    for mode in ('full', 'fast'):
+        Rover = RoverState(worldmap=make_worldmap(dtype=dtype))
+        Rover.perception_mode = mode
+        Rover.img = sim.render()
+        Rover.pos, Rover.yaw, Rover.pitch, Rover.roll, Rover.vel = tuple(sim.pos), sim.yaw, 0.0, 0.0, 0.0
+        perception_step(Rover)
+        totals[mode] = float(Rover.worldmap.channel(2).sum())
+    assert totals['full'] > 0
+    assert totals['fast'] == pytest.approx(totals['full'], rel=0.15)
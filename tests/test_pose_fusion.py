@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from perception import get_perception_kernel, perception_step
+from pose_fusion import PoseAwareFusion
+from rover_state import RoverState
+
+# Seuil d'obstacle pour lequel le gris des zones hors champ (pose_fusion.UNSEEN_COLOR) est un obstacle
+GREY_OBSTACLE = ((0, 0, 0), (140, 140, 140))
+
+
+def tilted_rover(pitch, roll, mode='full'):
+    Rover = RoverState()
+    Rover.pose_fusion = PoseAwareFusion(get_perception_kernel((160, 320, 3)), max_tilt=5.0)
+    Rover.segmenter.set_thresholds(obstacle=GREY_OBSTACLE)
+    Rover.perception_mode = mode
+    # Sol uniformément navigable : toute détection d'obstacle viendrait des zones hors champ
+    Rover.img = np.full((160, 320, 3), 200, dtype=np.uint8)
+    Rover.pos, Rover.yaw, Rover.pitch, Rover.roll, Rover.vel = (100.0, 100.0), 30.0, pitch, roll, 0.0
+    return Rover
+
+
+@pytest.mark.parametrize('mode', ['full', 'roi', 'fast'])
+@pytest.mark.parametrize('pitch, roll', [(3.0, 0.0), (357.0, 2.0), (0.0, 4.0)])
+def test_tilted_frame_maps_no_obstacle_out_of_view(pitch, roll, mode):
+    Rover = perception_step(tilted_rover(pitch, roll, mode))
+    assert Rover.pose_fusion.visible is not None
+    assert not Rover.pose_fusion.visible.all()
+    assert np.count_nonzero(Rover.worldmap.channel(0)) == 0
+    assert np.count_nonzero(Rover.worldmap.channel(2)) > 0
+
+
+def test_visibility_mask_matches_warp():
+    kernel = get_perception_kernel((160, 320, 3))
+    fusion = PoseAwareFusion(kernel, max_tilt=5.0)
+    img = np.full((160, 320, 3), 200, dtype=np.uint8)
+    warped = fusion.warp(img, 3.0, 2.0)
+    # Les pixels retenus sont entièrement vus : aucune part de la couleur de bord
+    assert (warped[fusion.visible] == 200).all()
+    assert fusion.warp(img, 0.0, 0.0) is not None and fusion.visible is None
+
+
+def test_pose_latency_interpolates():
+    fusion = PoseAwareFusion(get_perception_kernel((160, 320, 3)), latency=0.5)
+    Rover = RoverState()
+    for x, yaw in ((10.0, 359.0), (12.0, 1.0)):
+        Rover.pos, Rover.yaw, Rover.pitch, Rover.roll = (x, 0.0), yaw, 0.0, 0.0
+        pose = fusion.update(Rover)
+    assert pose[0] == pytest.approx(11.0)
+    assert pose[2] == pytest.approx(0.0, abs=1e-9)
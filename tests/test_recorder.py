@@ -0,0 +1,62 @@
+import base64
+import os
+
+import numpy as np
+
+from fake_sim import FakeSimulator
+from recorder import FrameRecorder, open_recording, SegmentRecording, JpgRecording
+from telemetry_decoder import TelemetryDecoder
+
+
+def sim_frames(count=6):
+    sim = FakeSimulator(seed=9)
+    decoder = TelemetryDecoder()
+    frames = []
+    for i in range(count):
+        sim.step((0.3, 0, 4.0))
+        data = sim.telemetry()
+        frames.append((100.0 + i, decoder.decode_image(data['image'])[1], data))
+    return frames
+
+
+def test_segments_read_back_through_open_recording(tmp_path):
+    path = str(tmp_path / 'course')
+    frames = sim_frames()
+    # Segments minuscules : une trame par segment
+    recorder = FrameRecorder(path, 'segments', drop=False, segment_size=1)
+    for t, image, data in frames[:4]:
+        recorder.record(image, data, t)
+    recorder.close()
+    # Reprise : les trames suivantes sont ajoutées à la suite
+    recorder = FrameRecorder(path, 'segments', drop=False, segment_size=1)
+    for t, image, data in frames[4:]:
+        recorder.record(image, data, t)
+    recorder.close()
+
+    recording = open_recording(path)
+    assert isinstance(recording, SegmentRecording) and len(recording) == len(frames)
+    # La reprise écrit d'abord à la suite du dernier segment
+    assert len([f for f in os.listdir(path) if f.startswith('seg_')]) == len(frames) - 1
+    np.testing.assert_array_equal(recording.timestamps, [t for t, _, _ in frames])
+    for i, (t, image, data) in enumerate(frames):
+        assert recording.jpeg(i) == image.data
+        assert recording.telemetry(i) == {k: v for k, v in data.items() if k != 'image'}
+        np.testing.assert_array_equal(recording.image(i), TelemetryDecoder().decode_image(data['image'])[0])
+    replayed = list(recording.telemetry_frames())
+    assert base64.b64decode(replayed[2][1]['image']) == frames[2][1].data
+    x, y = (float(v) for v in frames[3][2]['position'].split(';'))
+    assert tuple(recording.poses()[3][:2]) == (x, y)
+
+
+def test_jpg_frames_named_by_utc_time(tmp_path):
+    path = str(tmp_path / 'images')
+    frames = sim_frames(2)
+    recorder = FrameRecorder(path, 'jpg', drop=False)
+    recorder.record(frames[0][1], t=0.5)
+    recorder.record(frames[1][1], t=1.25)
+    recorder.close()
+    assert recorder.recorded == 2 and recorder.dropped == 0
+    assert sorted(os.listdir(path)) == ['1970_01_01_00_00_00_500.jpg', '1970_01_01_00_00_01_250.jpg']
+    recording = open_recording(path)
+    assert isinstance(recording, JpgRecording) and len(recording) == 2
+    assert recording.image(0).shape == (160, 320, 3)
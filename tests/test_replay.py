@@ -0,0 +1,38 @@
+import numpy as np
+
+from fake_sim import FakeSimulator
+from replay import replay, fake_frames, STAGES
+from rover_state import RoverState
+from telemetry_log import TelemetryRecorder, read_telemetry_log
+
+
+def ground_truth(sim):
+    gt = sim.ground_truth.astype(float)
+    return np.dstack((gt * 0, gt * 255, gt * 0))
+
+
+def test_fake_run_fills_map_and_replays_identically(tmp_path):
+    sim = FakeSimulator(seed=4)
+    path = str(tmp_path / 'course.log.gz')
+    with TelemetryRecorder(path) as recorder:
+        frames = ((t, recorder.write(data, t) or data) for t, data in fake_frames(sim, 40))
+        stats, Rover = replay(frames, RoverState(ground_truth(sim)), sim=sim, trace_allocations=True)
+    summary = stats.summary()
+    assert summary['frames'] == 40 and summary['invalid_frames'] == 0
+    for stage in STAGES:
+        assert summary['stages'][stage]['n'] == 40
+        assert 'peak_alloc_kib' in summary['stages'][stage] and 'alloc_blocks' in summary['stages'][stage]
+    live = Rover.worldmap.channel(2)
+    assert np.count_nonzero(live) > 0
+
+    stats, replayed = replay(read_telemetry_log(path), RoverState(ground_truth(sim)), render=False)
+    assert stats.frames == 40 and 'output_images' not in stats.summary()['stages']
+    np.testing.assert_array_equal(replayed.worldmap.channel(2), live)
+    np.testing.assert_array_equal(replayed.worldmap.channel(0), Rover.worldmap.channel(0))
+    assert (replayed.throttle, replayed.brake, replayed.steer) == (Rover.throttle, Rover.brake, Rover.steer)
+
+
+def test_max_frames_stops_the_replay():
+    sim = FakeSimulator(seed=4)
+    stats, _ = replay(fake_frames(sim, 30), RoverState(ground_truth(sim)), sim=sim, render=False, max_frames=12)
+    assert stats.frames == 12
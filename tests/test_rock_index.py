@@ -0,0 +1,30 @@
+import numpy as np
+
+from rock_index import RockIndex
+
+
+def test_detections_cluster_and_locate_samples():
+    index = RockIndex()
+    index.set_samples(([10.0, 50.0], [10.0, 50.0]))
+    index.add(np.array([10.2, 10.4, 30.0]), np.array([9.9, 10.1, 30.0]))
+    index.add(np.array([10.3]), np.array([10.0]))
+    assert len(index) == 2
+    assert index.samples_located == 1
+
+
+def test_nearest_unvisited_skips_visited_clusters():
+    index = RockIndex()
+    index.add(np.array([10.0, 20.0]), np.array([10.0, 10.0]))
+    cluster, x, y, dist = index.nearest_unvisited(11.0, 10.0)
+    assert (x, y, dist) == (10.0, 10.0, 1.0)
+    index.mark_visited(10.0, 10.0)
+    assert index.nearest_unvisited(11.0, 10.0)[1] == 20.0
+    assert index.nearest_unvisited(11.0, 10.0, max_distance=5.0) is None
+
+
+def test_nearest_unvisited_is_none_when_all_visited():
+    index = RockIndex()
+    assert index.nearest_unvisited(0.0, 0.0) is None
+    index.add(np.array([10.0, 20.0]), np.array([10.0, 10.0]))
+    index.mark_visited(15.0, 10.0, radius=10.0)
+    assert index.nearest_unvisited(11.0, 10.0) is None
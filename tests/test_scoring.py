@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from fake_sim import FakeSimulator
+from replay import replay, fake_frames
+from rover_state import RoverState
+from scoring import MapScorer, RunScore, COVERAGE_THRESHOLDS
+from worldmap import GroundTruthGrid, make_worldmap
+
+
+def ground_truth(size=200):
+    rng = np.random.default_rng(0)
+    nav = rng.random((size, size)) < 0.4
+    return np.dstack((nav * 0, nav * 255, nav * 0)).astype(float)
+
+
+# Compte direct sur la carte entière
+def brute_force(gt, worldmap):
+    known = worldmap.to_dense()[:, :, 2] > 0
+    gt_nav = gt[:, :, 1] > 0
+    good = np.count_nonzero(known & gt_nav)
+    return round(100 * good / np.count_nonzero(gt_nav), 1), \
+        round(100 * good / np.count_nonzero(known), 1) if known.any() else 0
+
+
+@pytest.mark.parametrize('tiled', [False, True])
+def test_incremental_scorer_matches_full_count(tiled):
+    gt = ground_truth()
+    worldmap = make_worldmap(tiled=tiled)
+    scorer = MapScorer(GroundTruthGrid(gt, worldmap), worldmap)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        y0, x0 = rng.integers(0, 190, 2)
+        iy, ix = rng.integers(y0, y0 + 10, 30), rng.integers(x0, x0 + 10, 30)
+        worldmap.increment(int(rng.integers(0, 3)), iy, ix)
+        if rng.random() < 0.2:
+            # Cellules effacées : elles sortent du compte
+            worldmap[y0:y0 + 4, x0:x0 + 4] = 0
+        scorer.update()
+        assert (scorer.perc_mapped(), scorer.fidelity()) == brute_force(gt, worldmap)
+
+
+def test_run_score_report():
+    sim = FakeSimulator(seed=2)
+    gt = sim.ground_truth.astype(float)
+    Rover = RoverState(np.dstack((gt * 0, gt * 255, gt * 0)))
+    Rover.score = RunScore(Rover, interval=1.0)
+    _, Rover = replay(fake_frames(sim, 200), Rover, render=False, sim=sim, max_frames=200)
+    report = Rover.score.report(Rover)
+    series = report['series']
+    assert len(series['t']) >= 6 and np.all(np.diff(series['t']) >= 1.0)
+    assert np.all(np.diff(series['mapped_cells']) >= 0)
+    assert report['final']['perc_mapped'] == brute_force(Rover.ground_truth, Rover.worldmap)[0]
+    reached = [report['time_to_mapped'][str(k)] for k in COVERAGE_THRESHOLDS]
+    assert all(t is None or t <= report['final']['t'] for t in reached)
@@ -0,0 +1,36 @@
+import numpy as np
+
+from perception import ColorSegmenter, color_thresh, OBSTACLE_THRESH, ROCK_THRESH, NAVIGABLE_THRESH
+
+
+# Image aléatoire plus les couleurs situées exactement sur les seuils
+def sample_image(shape=(160, 320)):
+    img = np.random.default_rng(0).integers(0, 256, shape + (3,), dtype=np.uint8)
+    edges = [bound for low, high in (OBSTACLE_THRESH, ROCK_THRESH, NAVIGABLE_THRESH) for bound in (low, high)]
+    img[0, :len(edges)] = edges
+    return img
+
+
+def test_masks_equal_three_color_thresh_calls():
+    img = sample_image()
+    segmenter = ColorSegmenter()
+    vision = np.zeros(img.shape, dtype=np.uint8)
+    masks = segmenter.segment(img, out=vision)
+    for k, (low, high) in enumerate((OBSTACLE_THRESH, ROCK_THRESH, NAVIGABLE_THRESH)):
+        expected = color_thresh(img, low, high) * 255
+        np.testing.assert_array_equal(masks[k], expected)
+        np.testing.assert_array_equal(vision[:, :, k], expected)
+    np.testing.assert_array_equal(segmenter.navigable, masks[2])
+    labels = segmenter.labels()
+    np.testing.assert_array_equal(labels == 3, masks[2] > 0)
+    assert labels[~masks.any(axis=0)].max() == 0
+
+
+def test_set_thresholds_and_new_image_size():
+    img = sample_image((80, 100))
+    segmenter = ColorSegmenter()
+    segmenter.set_thresholds(navigable=((120, 120, 120), (255, 255, 255)))
+    masks = segmenter.segment(img)
+    assert masks.shape == (3, 80, 100)
+    np.testing.assert_array_equal(masks[2], color_thresh(img, (120, 120, 120)) * 255)
+    np.testing.assert_array_equal(masks[0], color_thresh(img, *OBSTACLE_THRESH) * 255)
@@ -0,0 +1,29 @@
+import pytest
+
+from rover_state import RoverState
+from sweep import parse_param, grid_configs, random_configs, make_rover
+
+
+def test_parse_param():
+    assert parse_param('max_vel=1,1.5') == ('max_vel', [1.0, 1.5])
+    assert parse_param('wall_bias=0:0.3:0.1') == ('wall_bias', (0.0, 0.3, 0.1))
+    with pytest.raises(ValueError):
+        parse_param('vitesse=1')
+    with pytest.raises(ValueError):
+        parse_param('max_vel=1:2:3:4')
+
+
+def test_grid_and_random_configs():
+    params = dict([parse_param('max_vel=1,2'), parse_param('wall_bias=0:0.2:0.1')])
+    configs = grid_configs(params)
+    assert len(configs) == 6 and {'max_vel': 2.0, 'wall_bias': 0.2} in configs
+    drawn = random_configs(params, 5, seed=1)
+    assert drawn == random_configs(params, 5, seed=1)
+    assert all(c['max_vel'] in (1.0, 2.0) and 0 <= c['wall_bias'] <= 0.2 for c in drawn)
+
+
+def test_make_rover_applies_parameters():
+    Rover = make_rover({'rock_seek_distance': 8.0, 'navigable_min': 170}, None)
+    assert Rover.rock_seek_distance == 8.0
+    assert Rover.segmenter.thresholds[2][0] == (170, 170, 170)
+    assert RoverState().rock_seek_distance == 0
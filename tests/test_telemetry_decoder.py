@@ -0,0 +1,56 @@
+import base64
+from io import BytesIO
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from fake_sim import FakeSimulator
+from rover_state import RoverState
+from supporting_functions import update_rover
+from telemetry_decoder import TelemetryDecoder
+
+NUMERIC_FIELDS = ('speed', 'position', 'yaw', 'pitch', 'roll', 'throttle', 'steering_angle', 'samples_x', 'samples_y')
+
+
+def text_frame(seed=8):
+    sim = FakeSimulator(seed=seed)
+    sim.step((0.2, 0, 3.0))
+    return sim.telemetry()
+
+
+def test_update_rover_matches_reference_parsing():
+    data = text_frame()
+    Rover, image = update_rover(RoverState(), data)
+    x, y = [float(v) for v in data['position'].split(';')][:2]
+    assert Rover.pos == [x, y]
+    assert (Rover.vel, Rover.yaw, Rover.pitch, Rover.roll) == tuple(
+        float(data[k]) for k in ('speed', 'yaw', 'pitch', 'roll'))
+    assert (Rover.throttle, Rover.steer) == (float(data['throttle']), float(data['steering_angle']))
+    assert Rover.samples_to_find == int(data['sample_count'])
+    np.testing.assert_array_equal(Rover.samples_pos[0], np.int_([float(v) for v in data['samples_x'].split(';')]))
+    reference = np.asarray(Image.open(BytesIO(base64.b64decode(data['image']))))
+    np.testing.assert_array_equal(Rover.img, reference)
+    assert image.data == base64.b64decode(data['image'])
+
+
+def test_comma_decimal_frames():
+    data = text_frame()
+    comma = dict(data, **{k: data[k].replace('.', ',') for k in NUMERIC_FIELDS})
+    decoder = TelemetryDecoder()
+    assert decoder.state(comma) == TelemetryDecoder().state(data)
+    assert decoder.samples(comma) == TelemetryDecoder().samples(data)
+    # Format détecté une fois : les trames suivantes sont lues directement avec la virgule
+    assert decoder.parse is not float
+    with pytest.raises(ValueError):
+        TelemetryDecoder().parse_float('vitesse')
+
+
+def test_decoded_images_alternate_buffers():
+    data = text_frame()
+    decoder = TelemetryDecoder()
+    first, _ = decoder.decode_image(data['image'])
+    second, _ = decoder.decode_image(base64.b64decode(data['image']))
+    assert first is not second
+    np.testing.assert_array_equal(first, second)
+    assert decoder.decode_image(data['image'])[0] is first
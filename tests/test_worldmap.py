@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from worldmap import GroundTruthGrid, make_worldmap, split_bbox
+
+
+def ground_truth(shape=(200, 200)):
+    nav = np.random.default_rng(0).random(shape) < 0.4
+    return np.dstack((nav * 0, nav * 255, nav * 0)).astype(float)
+
+
+# Rééchantillonnage dense de référence : cellule -> pixel de vérité terrain contenant son centre
+def resample(gt, size, cell_size):
+    idx = np.int_((np.arange(size) + 0.5) * cell_size)
+    out = np.zeros((size, size, 3))
+    rows, cols = idx[idx < gt.shape[0]], idx[idx < gt.shape[1]]
+    out[:len(rows), :len(cols)] = gt[rows][:, cols]
+    return out
+
+
+@pytest.mark.parametrize('size, cell_size', [(200, 1.0), (400, 0.5), (150, 1.5), (250, 1.0)])
+def test_ground_truth_grid_matches_dense_resample(size, cell_size):
+    gt = ground_truth()
+    grid = GroundTruthGrid(gt, make_worldmap(size, cell_size))
+    dense = resample(gt, size, cell_size)
+    assert grid.nav_pixels == np.count_nonzero(dense[:, :, 1])
+    for bbox in [(0, size, 0, size), (size // 3, size // 2, 5, size - 1), (size - 7, size, size - 3, size)]:
+        y0, y1, x0, x1 = bbox
+        np.testing.assert_array_equal(grid.nav(*bbox), dense[y0:y1, x0:x1, 1] > 0)
+        np.testing.assert_array_equal(grid.half(*bbox), dense[y0:y1, x0:x1] * 0.5)
+
+
+def test_tiled_set_region_allocates_only_nonzero_tiles():
+    worldmap = make_worldmap(256, tiled=True, tile_size=32, channels=2)
+    values = np.zeros((64, 64, 2))
+    worldmap.set_region(10, 10, values)
+    assert worldmap.tiles == {}
+    values[40, 50] = 3
+    worldmap.set_region(10, 10, values)
+    assert list(worldmap.tiles) == [(1, 1)]
+    assert worldmap.region(50, 51, 60, 61)[0, 0, 0] == 3
+
+
+def test_split_bbox_covers_box_on_block_grid():
+    bbox = (5, 70, 30, 100)
+    blocks = list(split_bbox(bbox, 32))
+    covered = np.zeros((128, 128), dtype=int)
+    for y0, y1, x0, x1 in blocks:
+        assert y0 // 32 == (y1 - 1) // 32 and x0 // 32 == (x1 - 1) // 32
+        covered[y0:y1, x0:x1] += 1
+    expected = np.zeros((128, 128), dtype=int)
+    expected[5:70, 30:100] = 1
+    np.testing.assert_array_equal(covered, expected)
@@ -0,0 +1,379 @@
+import numpy as np
+
+from assets import ground_truth_stats
+
+# Cartes du monde interchangeables.
+# Une carte a `size` x `size` cellules de `cell_size` mètres et trois canaux (obstacles, rochers,
+# navigable). Deux implémentations partagent la même interface :
+#   - DenseWorldMap : un seul tableau, équivalent à l'ancien np.zeros((200, 200, 3)) ;
+#   - TiledWorldMap : tuiles allouées seulement là où le rover a observé quelque chose, pour que
+#     la mémoire et le coût par trame suivent la surface explorée et non la taille nominale du monde.
+# Les canaux peuvent être des compteurs entiers compacts (uint16, saturés au maximum du type).
+# Chaque écriture signale la région touchée aux objets DirtyRegion obtenus par track().
+
+
+# Boîte englobante (y0, y1, x0, x1), bornes hautes exclues, des cellules modifiées depuis la dernière lecture
+class DirtyRegion():
+    def __init__(self):
+        self.bbox = None
+
+    def add_bbox(self, y0, y1, x0, x1):
+        if self.bbox is None:
+            self.bbox = [y0, y1, x0, x1]
+        else:
+            self.bbox = [min(self.bbox[0], y0), max(self.bbox[1], y1),
+                         min(self.bbox[2], x0), max(self.bbox[3], x1)]
+
+    def add(self, ys, xs):
+        if len(ys) > 0:
+            self.add_bbox(int(ys.min()), int(ys.max()) + 1, int(xs.min()), int(xs.max()) + 1)
+
+    def take(self):
+        bbox, self.bbox = self.bbox, None
+        return bbox
+
+
+# Tuiles de `tile_size` cellules de côté modifiées depuis la dernière lecture (même interface que DirtyRegion) :
+# take() renvoie la boîte (y0, y1, x0, x1) de chaque tuile modifiée
+class DirtyTiles():
+    def __init__(self, size, tile_size=32):
+        self.size = size
+        self.tile_size = tile_size
+        count = -(-size // tile_size)
+        self.tiles = np.zeros((count, count), dtype=bool)
+
+    def add_bbox(self, y0, y1, x0, x1):
+        if y1 > y0 and x1 > x0:
+            size = self.tile_size
+            self.tiles[y0 // size:(y1 - 1) // size + 1, x0 // size:(x1 - 1) // size + 1] = True
+
+    def add(self, ys, xs):
+        if len(ys) > 0:
+            self.add_bbox(int(ys.min()), int(ys.max()) + 1, int(xs.min()), int(xs.max()) + 1)
+
+    def take(self):
+        size = self.tile_size
+        boxes = [(ty * size, min((ty + 1) * size, self.size), tx * size, min((tx + 1) * size, self.size))
+                 for ty, tx in zip(*self.tiles.nonzero())]
+        self.tiles[:] = False
+        return boxes
+
+
+class WorldMap():
+    def __init__(self, size=200, cell_size=1.0, dtype=float, channels=3):
+        self.size = size
+        self.cell_size = float(cell_size)
+        self.dtype = np.dtype(dtype)
+        self.channels = channels
+        self.trackers = []
+        if np.issubdtype(self.dtype, np.integer):
+            self.max_value = np.iinfo(self.dtype).max
+        else:
+            self.max_value = None
+
+    @property
+    def shape(self):
+        return (self.size, self.size, self.channels)
+
+    # Nouveau suivi des régions modifiées (DirtyRegion par défaut, ou DirtyTiles)
+    def track(self, tracker=None):
+        if tracker is None:
+            tracker = DirtyRegion()
+        self.trackers.append(tracker)
+        return tracker
+
+    def _mark(self, y0, y1, x0, x1):
+        for tracker in self.trackers:
+            tracker.add_bbox(y0, y1, x0, x1)
+
+    def _bbox(self, iy, ix):
+        return int(iy.min()), int(iy.max()) + 1, int(ix.min()), int(ix.max()) + 1
+
+    # Cellule contenant chaque point (coordonnées monde en mètres), bornée aux limites de la carte
+    def world_to_cell(self, x_world, y_world):
+        x_cell = np.clip(np.int_(x_world / self.cell_size), 0, self.size - 1)
+        y_cell = np.clip(np.int_(y_world / self.cell_size), 0, self.size - 1)
+        return x_cell, y_cell
+
+    def _to_dtype(self, values):
+        if self.max_value is not None:
+            return np.clip(np.rint(values), 0, self.max_value).astype(self.dtype)
+        return values.astype(self.dtype, copy=False)
+
+    # Somme pondérée des détections par cellule, doublons compris, en un seul np.bincount
+    # sur la boîte englobante des indices ; `limits` (bas, haut) borne le résultat
+    def scatter_add(self, channel, iy, ix, weights=None, limits=None):
+        if len(iy) == 0:
+            return
+        y0, y1, x0, x1 = self._bbox(iy, ix)
+        width = x1 - x0
+        local = (iy - y0) * width + (ix - x0)
+        sums = np.bincount(local, weights, minlength=(y1 - y0) * width).reshape(y1 - y0, width)
+        self._add_region(channel, y0, x0, sums, limits)
+        self._mark(y0, y1, x0, x1)
+
+    def to_dense(self):
+        return self.region(0, self.size, 0, self.size)
+
+    def __array__(self, dtype=None, copy=None):
+        dense = self.to_dense()
+        return dense if dtype is None else dense.astype(dtype)
+
+    def _slices(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        if len(key) >= 2 and all(isinstance(k, slice) and k.step in (None, 1) for k in key[:2]):
+            y0, y1, _ = key[0].indices(self.size)
+            x0, x1, _ = key[1].indices(self.size)
+            return (y0, max(y0, y1), x0, max(x0, x1)), key[2:]
+        return None, key
+
+
+class DenseWorldMap(WorldMap):
+    def __init__(self, size=200, cell_size=1.0, dtype=float, channels=3, data=None):
+        WorldMap.__init__(self, size, cell_size, dtype, channels)
+        if data is None:
+            data = np.zeros(self.shape, dtype=self.dtype)
+        self.data = data
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def channel(self, k):
+        return self.data[:, :, k]
+
+    def region(self, y0, y1, x0, x1):
+        return self.data[y0:y1, x0:x1]
+
+    # +1 pour chaque cellule touchée, une seule fois par appel même si elle apparaît plusieurs fois
+    def increment(self, channel, iy, ix):
+        if len(iy) == 0:
+            return
+        if self.max_value is None:
+            self.data[iy, ix, channel] += 1
+        else:
+            self.data[iy, ix, channel] = np.minimum(self.data[iy, ix, channel], self.max_value - 1) + 1
+        self._mark(*self._bbox(iy, ix))
+
+    def assign(self, channel, iy, ix, value):
+        if len(iy) == 0:
+            return
+        self.data[iy, ix, channel] = value
+        self._mark(*self._bbox(iy, ix))
+
+    # Valeurs du canal aux cellules (iy, ix)
+    def gather(self, channel, iy, ix):
+        return self.data[iy, ix, channel]
+
+    # Remplace une région (tous les canaux) à partir de (y0, x0)
+    def set_region(self, y0, x0, values):
+        y1, x1 = y0 + values.shape[0], x0 + values.shape[1]
+        self.data[y0:y1, x0:x1] = values
+        self._mark(y0, y1, x0, x1)
+
+    def _add_region(self, channel, y0, x0, values, limits=None):
+        target = self.data[y0:y0 + values.shape[0], x0:x0 + values.shape[1], channel]
+        if self.max_value is None:
+            target += values
+        else:
+            target[:] = self._to_dtype(target + values)
+        if limits is not None:
+            np.clip(target, limits[0], limits[1], out=target)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self._mark(0, self.size, 0, self.size)
+
+
+class TiledWorldMap(WorldMap):
+    def __init__(self, size=200, cell_size=1.0, dtype=float, channels=3, tile_size=32):
+        WorldMap.__init__(self, size, cell_size, dtype, channels)
+        self.tile_size = tile_size
+        self.tiles = {}
+
+    @property
+    def nbytes(self):
+        return len(self.tiles) * self.tile_size * self.tile_size * self.channels * self.dtype.itemsize
+
+    def _tile(self, ty, tx):
+        tile = self.tiles.get((ty, tx))
+        if tile is None:
+            tile = self.tiles[(ty, tx)] = np.zeros((self.tile_size, self.tile_size, self.channels), dtype=self.dtype)
+        return tile
+
+    # Regroupe des indices de cellules par tuile : (ty, tx, y local, x local)
+    def _by_tile(self, iy, ix):
+        size = self.tile_size
+        ty, tx = iy // size, ix // size
+        keys = ty * (self.size // size + 1) + tx
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        for group in np.split(order, bounds):
+            first = group[0]
+            yield int(ty[first]), int(tx[first]), iy[group] - ty[first] * size, ix[group] - tx[first] * size
+
+    def increment(self, channel, iy, ix):
+        if len(iy) == 0:
+            return
+        for ty, tx, ly, lx in self._by_tile(iy, ix):
+            tile = self._tile(ty, tx)
+            if self.max_value is None:
+                tile[ly, lx, channel] += 1
+            else:
+                tile[ly, lx, channel] = np.minimum(tile[ly, lx, channel], self.max_value - 1) + 1
+        self._mark(*self._bbox(iy, ix))
+
+    def assign(self, channel, iy, ix, value):
+        if len(iy) == 0:
+            return
+        for ty, tx, ly, lx in self._by_tile(iy, ix):
+            self._tile(ty, tx)[ly, lx, channel] = value
+        self._mark(*self._bbox(iy, ix))
+
+    # Valeurs du canal aux cellules (iy, ix) (0 là où aucune tuile n'a été allouée)
+    def gather(self, channel, iy, ix):
+        out = np.zeros(len(iy), dtype=self.dtype)
+        size = self.tile_size
+        ty, tx = iy // size, ix // size
+        for key in set(zip(ty.tolist(), tx.tolist())):
+            tile = self.tiles.get(key)
+            if tile is not None:
+                sel = (ty == key[0]) & (tx == key[1])
+                out[sel] = tile[iy[sel] - key[0] * size, ix[sel] - key[1] * size, channel]
+        return out
+
+    # Tuiles recouvrant une région : (tuile, tranche dans la tuile, tranche dans la région)
+    def _overlaps(self, y0, y1, x0, x1):
+        size = self.tile_size
+        for ty in range(y0 // size, (y1 - 1) // size + 1):
+            for tx in range(x0 // size, (x1 - 1) // size + 1):
+                ty0, tx0 = ty * size, tx * size
+                sy0, sy1 = max(y0, ty0), min(y1, ty0 + size)
+                sx0, sx1 = max(x0, tx0), min(x1, tx0 + size)
+                yield (ty, tx), (slice(sy0 - ty0, sy1 - ty0), slice(sx0 - tx0, sx1 - tx0)), \
+                    (slice(sy0 - y0, sy1 - y0), slice(sx0 - x0, sx1 - x0))
+
+    def _add_region(self, channel, y0, x0, values, limits=None):
+        y1, x1 = y0 + values.shape[0], x0 + values.shape[1]
+        for key, tile_slice, region_slice in self._overlaps(y0, y1, x0, x1):
+            part = values[region_slice]
+            if not part.any():
+                continue
+            target = self._tile(*key)[tile_slice + (channel,)]
+            if self.max_value is None:
+                target += part
+            else:
+                target[:] = self._to_dtype(target + part)
+            if limits is not None:
+                np.clip(target, limits[0], limits[1], out=target)
+
+    # Remplace une région (tous les canaux) à partir de (y0, x0) ; une tuile n'est allouée que pour
+    # des valeurs non nulles
+    def set_region(self, y0, x0, values):
+        y1, x1 = y0 + values.shape[0], x0 + values.shape[1]
+        for key, tile_slice, region_slice in self._overlaps(y0, y1, x0, x1):
+            part = values[region_slice]
+            tile = self.tiles.get(key)
+            if tile is None:
+                if not part.any():
+                    continue
+                tile = self._tile(*key)
+            tile[tile_slice] = part
+        self._mark(y0, y1, x0, x1)
+
+    # Copie dense d'une région (zéros là où aucune tuile n'a été allouée)
+    def region(self, y0, y1, x0, x1):
+        out = np.zeros((y1 - y0, x1 - x0, self.channels), dtype=self.dtype)
+        if y1 > y0 and x1 > x0:
+            for key, tile_slice, region_slice in self._overlaps(y0, y1, x0, x1):
+                tile = self.tiles.get(key)
+                if tile is not None:
+                    out[region_slice] = tile[tile_slice]
+        return out
+
+    def channel(self, k):
+        return self.to_dense()[:, :, k]
+
+    def __getitem__(self, key):
+        bbox, rest = self._slices(key)
+        if bbox is not None:
+            return self.region(*bbox)[(slice(None), slice(None)) + rest]
+        return self.to_dense()[key]
+
+    def __setitem__(self, key, value):
+        bbox, rest = self._slices(key)
+        if bbox is None:
+            raise TypeError("TiledWorldMap : seules les affectations par tranches sont possibles")
+        y0, y1, x0, x1 = bbox
+        if y1 <= y0 or x1 <= x0:
+            return
+        shape = np.empty((y1 - y0, x1 - x0, self.channels), dtype=bool)[(slice(None), slice(None)) + rest].shape
+        values = np.broadcast_to(value, shape)
+        for key, tile_slice, region_slice in self._overlaps(y0, y1, x0, x1):
+            self._tile(*key)[tile_slice + rest] = values[region_slice]
+        self._mark(y0, y1, x0, x1)
+
+
+# Découpe d'une boîte (y0, y1, x0, x1) en blocs d'au plus `block` cellules de côté, alignés sur la grille
+# des blocs (et donc sur les tuiles si `block` est la taille des tuiles)
+def split_bbox(bbox, block):
+    y0, y1, x0, x1 = bbox
+    for by in range(y0 // block * block, y1, block):
+        for bx in range(x0 // block * block, x1, block):
+            yield max(y0, by), min(y1, by + block), max(x0, bx), min(x1, bx + block)
+
+
+def make_worldmap(size=200, cell_size=1.0, dtype=float, tiled=False, tile_size=32, channels=3):
+    if tiled:
+        return TiledWorldMap(size, cell_size, dtype, channels, tile_size=tile_size)
+    return DenseWorldMap(size, cell_size, dtype, channels)
+
+
+# Vérité terrain (1 pixel par mètre) lue sur la grille d'une carte du monde, région par région : seuls son
+# masque navigable et son fond d'affichage sont conservés, à la résolution d'origine, sans copie
+# rééchantillonnée de la taille de la carte. new_map() crée une carte auxiliaire de même géométrie et de
+# même implémentation (tuiles allouées à la demande si la carte est par tuiles).
+class GroundTruthGrid():
+    def __init__(self, ground_truth, worldmap):
+        nav_mask, nav_pixels, half = ground_truth_stats(ground_truth)
+        self.size = worldmap.size
+        self.cell_size = worldmap.cell_size
+        self.tiled = isinstance(worldmap, TiledWorldMap)
+        self.tile_size = getattr(worldmap, 'tile_size', 32)
+        height, width = nav_mask.shape
+        self.identity = (height, width) == (self.size, self.size) and self.cell_size == 1.0
+        if self.identity:
+            self.nav_mask, self.half_rgb, self.nav_pixels = nav_mask, half, nav_pixels
+            return
+        # Pixel source de chaque ligne / colonne de la carte ; au-delà de la vérité terrain, une ligne
+        # et une colonne vides ajoutées en fin de tableau
+        idx = np.int_((np.arange(self.size) + 0.5) * self.cell_size)
+        self.rows = np.minimum(idx, height)
+        self.cols = np.minimum(idx, width)
+        self.nav_mask = np.pad(nav_mask, ((0, 1), (0, 1)))
+        self.half_rgb = np.pad(half, ((0, 1), (0, 1), (0, 0)))
+        # Cellules navigables de la grille : chaque pixel source compte autant de fois qu'il est lu
+        row_counts = np.bincount(self.rows, minlength=height + 1)
+        col_counts = np.bincount(self.cols, minlength=width + 1)
+        self.nav_pixels = int(row_counts @ self.nav_mask.astype(np.int64) @ col_counts)
+
+    def _cells(self, y0, y1, x0, x1):
+        if self.identity:
+            return slice(y0, y1), slice(x0, x1)
+        return self.rows[y0:y1, None], self.cols[None, x0:x1]
+
+    # Masque navigable de la région (y0, y1, x0, x1) de la grille
+    def nav(self, y0, y1, x0, x1):
+        return self.nav_mask[self._cells(y0, y1, x0, x1)]
+
+    # Fond d'affichage (vérité terrain * 0.5, 3 canaux) de la région
+    def half(self, y0, y1, x0, x1):
+        return self.half_rgb[self._cells(y0, y1, x0, x1)]
+
+    def new_map(self, dtype, channels):
+        return make_worldmap(self.size, self.cell_size, dtype, tiled=self.tiled, tile_size=self.tile_size,
+                             channels=channels)